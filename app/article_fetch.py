@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+from . import config, perf
+from .news_feed import get_http_client
+from .text_extract import extract_main_text
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4 # Грубая оценка длины токена для бюджета промпта
+MAX_PAGE_CHARS = 2_000_000 # Не разбираем гигантские страницы целиком
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+
+# LRU-кэш извлечённых текстов: url -> (время загрузки, текст)
+_cache: OrderedDict = OrderedDict()
+# Семафоры хостов с числом использующих их загрузок: хост -> [семафор, загрузок]. Запись живёт, пока хост
+# кто-то использует, поэтому словарь не растёт с числом когда-либо встреченных хостов
+_host_semaphores: dict[str, list] = {}
+
+
+def _cache_get(url: str) -> str | None:
+    """Текст статьи из кэша, если он не устарел."""
+    item = _cache.get(url)
+    if item is None:
+        return None
+    fetched_at, text = item
+    if time.time() - fetched_at > config.ARTICLE_CACHE_TTL_HOURS * 3600:
+        del _cache[url]
+        return None
+    _cache.move_to_end(url)
+    return text
+
+
+def _cache_put(url: str, text: str):
+    """Кладёт текст в кэш, вытесняя самые старые записи."""
+    _cache[url] = (time.time(), text)
+    _cache.move_to_end(url)
+    while len(_cache) > config.ARTICLE_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+@asynccontextmanager
+async def _host_limit(url: str):
+    """Лимит на хост, чтобы не долбить один сайт параллельными запросами; семафор удаляется, когда хост простаивает."""
+    host = urlsplit(url).hostname or ""
+    entry = _host_semaphores.get(host)
+    if entry is None:
+        entry = _host_semaphores[host] = [asyncio.Semaphore(max(config.ARTICLE_PER_HOST_LIMIT, 1)), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _host_semaphores[host]
+
+
+async def _fetch_one(url: str, semaphore: asyncio.Semaphore) -> str:
+    """Скачивает страницу и извлекает основной текст в пуле потоков. Ошибки возвращаются как пустой текст."""
+    try:
+        # Сначала лимит хоста, затем общий — чтобы ожидание занятого хоста не держало общий слот
+        async with _host_limit(url), semaphore:
+            with perf.timer("rss.article"):
+                response = await get_http_client().get(url, timeout=config.ARTICLE_FETCH_TIMEOUT)
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "").lower()
+        if content_type and "html" not in content_type:
+            logger.debug(f"Статья {url}: Content-Type {content_type} не HTML, пропуск.")
+            return ""
+        text = await asyncio.to_thread(extract_main_text, response.text[:MAX_PAGE_CHARS])
+        _cache_put(url, text)
+        logger.debug(f"Статья {url}: извлечено {len(text)} симв.")
+        return text
+    except httpx.HTTPError as e:
+        logger.info(f"Не удалось загрузить статью {url}: {type(e).__name__}: {e}")
+    except Exception as e:
+        logger.warning(f"Ошибка обработки статьи {url}: {e}", exc_info=True)
+    return ""
+
+
+async def fetch_articles(urls: list[str]) -> dict[str, str]:
+    """
+    Параллельно загружает статьи (общий лимит ARTICLE_FETCH_CONCURRENCY, лимит на хост ARTICLE_PER_HOST_LIMIT).
+    Всё, что не уложилось в бюджет ARTICLE_FETCH_BUDGET секунд, отменяется,
+    поэтому задержка ограничена самой медленной загрузкой, а не их суммой.
+    Возвращает url -> текст (только для успешно извлечённых статей).
+    """
+    texts = {}
+    to_fetch = []
+    for url in dict.fromkeys(u for u in urls if u and u.startswith(("http://", "https://"))):
+        cached = _cache_get(url)
+        if cached is not None:
+            if cached:
+                texts[url] = cached
+        else:
+            to_fetch.append(url)
+    if not to_fetch:
+        return texts
+
+    semaphore = asyncio.Semaphore(max(config.ARTICLE_FETCH_CONCURRENCY, 1))
+    tasks = {asyncio.create_task(_fetch_one(url, semaphore)): url for url in to_fetch}
+    started = time.monotonic()
+    done, pending = await asyncio.wait(tasks, timeout=config.ARTICLE_FETCH_BUDGET)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        if task.result():
+            texts[tasks[task]] = task.result()
+    logger.info(
+        f"Статьи: из кэша {len(urls) - len(to_fetch)}, загружено {len(done)}/{len(to_fetch)}, "
+        f"с текстом {len(texts)}, отменено по бюджету {len(pending)}, за {time.monotonic() - started:.1f} сек."
+    )
+    return texts
+
+
+def make_excerpt(text: str, max_tokens: int) -> str:
+    """Обрезает текст до бюджета токенов по границе предложения."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    excerpt = ""
+    for sentence in _SENTENCE_END_RE.split(text.replace("\n", " ")):
+        if len(excerpt) + len(sentence) + 1 > max_chars:
+            break
+        excerpt = f"{excerpt} {sentence}" if excerpt else sentence
+    return excerpt or text[:max_chars]
+
+
+async def get_excerpts(entries: list[dict]) -> dict[str, str]:
+    """Фрагменты статей для записей ленты: общий бюджет NEWS_ARTICLE_TOKEN_BUDGET делится поровну между статьями."""
+    if not config.NEWS_FETCH_ARTICLES or not entries:
+        return {}
+    texts = await fetch_articles([entry.get("link", "") for entry in entries])
+    if not texts:
+        return {}
+    per_article = max(config.NEWS_ARTICLE_TOKEN_BUDGET // len(texts), 50)
+    return {url: make_excerpt(text, per_article) for url, text in texts.items()}
@@ -1,13 +1,16 @@
 import logging
+import secrets
 import sys
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler, # Используется для фильтров в MessageHandler
-    PicklePersistence, # Для сохранения/восстановления jobs планировщика
+    PicklePersistence, # Прежний формат хранения состояния (PERSISTENCE_BACKEND=pickle)
+    TypeHandler,
     Defaults
 )
 from telegram.constants import ParseMode
+from telegram.request import HTTPXRequest
 from pathlib import Path
 
 # --- Настройка логирования ---
@@ -33,6 +36,9 @@ logger = logging.getLogger(__name__)
 try:
     from app import config # Импортируем после настройки логирования
     from app.handlers import commands, callbacks, messages, channel_posts # Импортируем пакеты с хэндлерами
+    from app import leader, news_feed, perf, perplexity_client, send_queue, traffic_record
+    from app.handlers.jobs import startup_restore_job, leader_election_job, reschedule_auto_post_job
+    from app.sqlite_persistence import SQLitePersistence
 except ValueError as e:
     logger.critical(f"Критическая ошибка конфигурации: {e}")
     sys.exit(1) # Выход, если конфигурация неверна
@@ -40,6 +46,34 @@ except ImportError as e:
      logger.critical(f"Ошибка импорта модулей: {e}. Убедитесь, что все зависимости установлены и структура проекта верна.")
      sys.exit(1)
 
+async def post_init(application) -> None:
+    """Запускает очередь исходящих сообщений и ставит восстановление сохранённых задач планировщика."""
+    send_queue.start()
+    traffic_record.start()
+    # Восстановление (и досылка пропущенных слотов) - первой задачей JobQueue: приём обновлений начинается сразу
+    if application.job_queue:
+        application.job_queue.run_once(startup_restore_job, when=0, name="startup_restore_job")
+
+
+async def post_stop(application) -> None:
+    """Досылает очередь исходящих сообщений, отдаёт лидерство и снимает вебхук, чтобы Telegram не слал обновления на выключенный сервер."""
+    await send_queue.stop()
+    await leader.release(application)
+    if config.BOT_MODE == "webhook" and config.WEBHOOK_DELETE_ON_STOP:
+        try:
+            await application.bot.delete_webhook()
+            logger.info("Вебхук удалён.")
+        except Exception as e:
+            logger.warning(f"Не удалось удалить вебхук: {e}")
+
+
+async def post_shutdown(application) -> None:
+    """Закрывает общие HTTP-клиенты и файл записи трафика при остановке бота."""
+    await news_feed.close_http_client()
+    await perplexity_client.close_http_client()
+    traffic_record.close()
+
+
 def main() -> None:
     """Запускает бота."""
     logger.info("🚀 Инициализация бота...")
@@ -49,10 +83,16 @@ def main() -> None:
     defaults = Defaults(parse_mode=ParseMode.MARKDOWN)
 
     # --- Настройка Persistence ---
-    # Используем PicklePersistence для сохранения состояния JobQueue между перезапусками
-    # Файл будет сохранен в директории data/, которая монтируется из хоста
-    persistence_path = config.DATA_DIR / 'bot_persistence.pickle'
-    persistence = PicklePersistence(filepath=persistence_path)
+    # По умолчанию состояние (bot_data и задачи автопостинга) хранится построчно в SQLite:
+    # запись инкрементальная, база безопасна для нескольких процессов. Старый pickle переносится автоматически.
+    # Файлы сохраняются в директории data/, которая монтируется из хоста
+    pickle_path = config.DATA_DIR / 'bot_persistence.pickle'
+    if config.PERSISTENCE_BACKEND == "pickle":
+        persistence_path = pickle_path
+        persistence = PicklePersistence(filepath=persistence_path)
+    else:
+        persistence_path = config.DATA_DIR / 'bot_state.sqlite3'
+        persistence = SQLitePersistence(filepath=persistence_path, legacy_pickle=pickle_path, shared=config.LEADER_ELECTION)
     logger.info(f"Используется сохранение состояния в: {persistence_path}")
 
 
@@ -63,11 +103,17 @@ def main() -> None:
             .token(config.BOT_TOKEN)
             .defaults(defaults)
             .persistence(persistence) # Добавляем persistence
-            .read_timeout(30) # Увеличиваем таймауты для ожидания сети/API
-            .get_updates_read_timeout(30)
-            .connect_timeout(30)
-            .write_timeout(30)
-            .pool_timeout(30)
+            # Обновления обрабатываются параллельно: долгая генерация не блокирует /schedule и кнопки.
+            # Тяжёлые операции дополнительно ограничены семафорами (app/concurrency.py)
+            .concurrent_updates(max(config.UPDATE_CONCURRENCY, 1))
+            # Увеличиваем таймауты для ожидания сети/API; время запросов к Bot API идёт в /perf,
+            # при TRAFFIC_RECORD_FILE запросы ещё и пишутся в файл
+            .request(traffic_record.wrap_bot_request(perf.TimedRequest(HTTPXRequest(
+                connection_pool_size=256, read_timeout=30, connect_timeout=30, write_timeout=30, pool_timeout=30))))
+            .get_updates_request(HTTPXRequest(connection_pool_size=1, read_timeout=30))
+            .post_init(post_init)
+            .post_stop(post_stop)
+            .post_shutdown(post_shutdown)
             .build()
         )
     except Exception as e:
@@ -89,12 +135,51 @@ def main() -> None:
     application.add_handler(callbacks.callback_handler)
     logger.debug("Добавлен обработчик inline-кнопок.")
 
+    # Запись входящих обновлений (TRAFFIC_RECORD_FILE): отдельная группа до остальных хэндлеров, обработку не прерывает
+    if config.TRAFFIC_RECORD_FILE:
+        application.add_handler(TypeHandler(Update, traffic_record.record_update), group=-1)
+        logger.info("Добавлен обработчик записи трафика.")
+
     # Обработчик новых постов в канале (опционально, для логирования)
     # Убедитесь, что бот - админ канала с правом читать сообщения!
     application.add_handler(channel_posts.channel_post_handler)
     logger.info("Добавлен обработчик новых постов в канале (для логирования).")
     # application.add_handler(channel_posts.edited_channel_post_handler) # Если нужен и для измененных
 
+    # --- Фоновые задачи ---
+    # Опрос RSS, чтобы /news работал с уже загруженным и разобранным снимком ленты
+    if config.NEWS_RSS_URL and config.NEWS_POLL_INTERVAL > 0 and application.job_queue:
+        application.job_queue.run_repeating(
+            news_feed.rss_poll_job,
+            interval=config.NEWS_POLL_INTERVAL,
+            first=1,
+            name=news_feed.RSS_POLL_JOB
+        )
+        logger.info(f"Фоновый опрос RSS каждые {config.NEWS_POLL_INTERVAL} сек.")
+
+    # Пересчёт слотов автопостинга по свежей статистике (меняются только сдвинувшиеся задачи)
+    if config.AUTO_POST_RESCHEDULE_HOURS > 0 and application.job_queue:
+        application.job_queue.run_repeating(
+            reschedule_auto_post_job,
+            interval=config.AUTO_POST_RESCHEDULE_HOURS * 3600,
+            first=config.AUTO_POST_RESCHEDULE_HOURS * 3600,
+            name="reschedule_auto_post_job"
+        )
+
+    # Несколько реплик с общим data/: продление аренды лидера и сверка задач с общей таблицей
+    if config.LEADER_ELECTION and application.job_queue:
+        application.job_queue.run_repeating(
+            leader_election_job,
+            interval=config.LEADER_RENEW_SECONDS,
+            first=config.LEADER_RENEW_SECONDS,
+            name=leader.LEASE_NAME
+        )
+        logger.info(f"👑 Выбор лидера включён: реплика {leader.REPLICA_ID}, аренда {config.LEADER_LEASE_SECONDS} сек.")
+        if config.BOT_MODE != "webhook":
+            logger.warning("LEADER_ELECTION с BOT_MODE=polling: getUpdates может читать только одна реплика, используйте вебхук за балансировщиком.")
+        elif not config.WEBHOOK_SECRET_TOKEN or config.WEBHOOK_DELETE_ON_STOP:
+            logger.warning("Для нескольких реплик задайте общий WEBHOOK_SECRET_TOKEN и WEBHOOK_DELETE_ON_STOP=false, иначе реплики перебивают вебхук друг друга.")
+
     # --- Запуск бота ---
     logger.info(f"🤖 Бот запускается... Используется модель OpenAI: {config.MODEL}")
     if config.OPENAI_PROXY:
@@ -102,12 +187,32 @@ def main() -> None:
     else:
         logger.info("🔌 Прокси OpenAI: не используется")
 
-    # Запускаем в режиме опроса (polling)
     # allowed_updates можно уточнить, чтобы бот получал только нужные типы обновлений
     allowed_updates = [
         Update.MESSAGE, Update.CALLBACK_QUERY, Update.CHANNEL_POST, Update.EDITED_CHANNEL_POST
     ]
-    application.run_polling(allowed_updates=allowed_updates, drop_pending_updates=True) # drop_pending_updates=True - чтобы не обрабатывать старые сообщения после перезапуска
+    if config.BOT_MODE == "webhook":
+        # Вебхук: Telegram сам присылает обновления на встроенный HTTP-сервер (без задержки long-poll).
+        # setWebhook вызывается при старте, deleteWebhook - при остановке (post_stop).
+        # Секрет проверяется по заголовку X-Telegram-Bot-Api-Secret-Token, чужие запросы получают 403.
+        secret_token = config.WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+        webhook_url = f"{config.WEBHOOK_URL.rstrip('/')}/{config.WEBHOOK_PATH}"
+        logger.info(f"🌐 Режим вебхука: {webhook_url} -> {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT}/{config.WEBHOOK_PATH}")
+        application.run_webhook(
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            # Без сертификата сервер слушает обычный HTTP - TLS завершает прокси перед ботом
+            cert=config.WEBHOOK_CERT,
+            key=config.WEBHOOK_KEY,
+            webhook_url=webhook_url,
+            secret_token=secret_token,
+            allowed_updates=allowed_updates,
+            drop_pending_updates=True,
+        )
+    else:
+        # Режим опроса (polling)
+        application.run_polling(allowed_updates=allowed_updates, drop_pending_updates=True) # drop_pending_updates=True - чтобы не обрабатывать старые сообщения после перезапуска
 
     logger.info("🏁 Бот остановлен.")
 
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import re
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Реестр каналов: один процесс обслуживает несколько каналов, у каждого свои админы и данные.
+# Маршрутизация по id канала и по id админа - поиск в словаре, без перебора каналов.
+DEFAULT_KEY = "main" # Ключ канала из CHANNEL_ID/ADMIN_ID, если CHANNELS не задан
+USER_DATA_KEY = "channel" # Выбранный админом канал в user_data (сохраняется persistence)
+_KEY_RE = re.compile(r"^[A-Za-z0-9-]+$") # Без "_": ключ попадает в сообщения с Markdown
+
+
+class Channel:
+    """
+    Канал и его собственные данные: админы, лог постов, график, задача автопостинга, индекс просмотренных новостей.
+    Канал по умолчанию (legacy) использует прежние имена файлов и задачи, чтобы данные одноканального бота подхватились как есть.
+    """
+
+    def __init__(self, key: str, chat_id: int, admin_ids: tuple[int, ...], legacy: bool = False):
+        self.key = key
+        self.chat_id = chat_id
+        self.admin_ids = admin_ids
+        self.legacy = legacy
+        suffix = "" if legacy else f"_{key}"
+        self.log_file = config.LOG_FILE.with_name(f"{config.LOG_FILE.stem}{suffix}{config.LOG_FILE.suffix}")
+        self.plot_file = config.PLOT_FILE.with_name(f"{config.PLOT_FILE.stem}{suffix}{config.PLOT_FILE.suffix}")
+        self.seen_news_file = config.DATA_DIR / f"seen_news{suffix}.bin"
+        self.job_name = f"{config.DAILY_AUTO_POST_JOB}{suffix}"
+        # Аналитика канала (pandas, графики) выполняется в пуле потоков по одной за раз:
+        # частые /stats одного канала ждут друг друга, а не занимают потоки и event loop остальных
+        self.analytics_lock = asyncio.Lock()
+
+    def __repr__(self) -> str:
+        return f"Channel({self.key!r}, {self.chat_id})"
+
+
+def _parse_channels(spec: str) -> list[tuple[str, int, tuple[int, ...]]]:
+    """Разбирает CHANNELS: "ключ:channel_id:admin_id|admin_id,...". Ошибки формата - ValueError."""
+    parsed = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            key, chat_id, admins = (item.strip() for item in part.split(":"))
+            admin_ids = tuple(int(a) for a in admins.split("|") if a.strip())
+            parsed.append((key, int(chat_id), admin_ids))
+        except ValueError:
+            err_msg = f"❌ Неверное описание канала в CHANNELS: '{part}' (ожидается ключ:channel_id:admin_id|admin_id)"
+            logger.critical(err_msg)
+            raise ValueError(err_msg)
+        if not _KEY_RE.match(key) or not admin_ids:
+            err_msg = f"❌ Канал '{part}' в CHANNELS: ключ - латиница, цифры и '-', нужен хотя бы один admin_id"
+            logger.critical(err_msg)
+            raise ValueError(err_msg)
+    return parsed
+
+
+def _build_registry() -> list[Channel]:
+    if config.CHANNELS:
+        parsed = _parse_channels(config.CHANNELS)
+        if not parsed:
+            raise ValueError("❌ CHANNELS задан, но не содержит ни одного канала.")
+    else:
+        parsed = [(DEFAULT_KEY, config.CHANNEL_ID, (config.ADMIN_ID,))]
+    # Прежние файлы данных достаются каналу из CHANNEL_ID, а если его нет в списке - первому
+    legacy_index = next((i for i, (_, chat_id, _) in enumerate(parsed) if chat_id == config.CHANNEL_ID), 0)
+    channels = []
+    for i, (key, chat_id, admin_ids) in enumerate(parsed):
+        if any(c.key == key or c.chat_id == chat_id for c in channels):
+            raise ValueError(f"❌ Канал '{key}' ({chat_id}) указан в CHANNELS дважды.")
+        channels.append(Channel(key, chat_id, admin_ids, legacy=i == legacy_index))
+    return channels
+
+
+_channels: dict[str, Channel] = {}
+_by_chat: dict[int, Channel] = {}
+_by_admin: dict[int, list[Channel]] = {}
+for _channel in _build_registry():
+    _channels[_channel.key] = _channel
+    _by_chat[_channel.chat_id] = _channel
+    for _admin_id in _channel.admin_ids:
+        _by_admin.setdefault(_admin_id, []).append(_channel)
+_default = next(c for c in _channels.values() if c.legacy)
+logger.info(f"Каналы: {', '.join(f'{c.key} ({c.chat_id}, админов: {len(c.admin_ids)})' for c in _channels.values())}")
+
+
+def all_channels() -> list[Channel]:
+    return list(_channels.values())
+
+
+def default() -> Channel:
+    """Канал по умолчанию (CHANNEL_ID или первый из CHANNELS)."""
+    return _default
+
+
+def resolve(channel: Channel | None) -> Channel:
+    """Канал или канал по умолчанию (для функций с необязательным аргументом channel)."""
+    return channel or _default
+
+
+def get(key: str | None) -> Channel | None:
+    return _channels.get(key) if key else None
+
+
+def by_chat_id(chat_id: int) -> Channel | None:
+    return _by_chat.get(chat_id)
+
+
+def chat_ids() -> list[int]:
+    return list(_by_chat)
+
+
+def admin_ids() -> list[int]:
+    return list(_by_admin)
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in _by_admin
+
+
+def admin_channels(user_id: int) -> list[Channel]:
+    """Каналы, которыми управляет пользователь (пустой список - не админ)."""
+    return _by_admin.get(user_id, [])
+
+
+def for_user(user_id: int, user_data: dict | None = None) -> Channel | None:
+    """
+    Активный канал админа: выбранный командой /channel (хранится в user_data) или первый из его каналов.
+    None, если пользователь не админ ни одного канала.
+    """
+    owned = _by_admin.get(user_id)
+    if not owned:
+        return None
+    selected = _channels.get(user_data.get(USER_DATA_KEY)) if user_data else None
+    return selected if selected is not None and user_id in selected.admin_ids else owned[0]
+
+
+def select(user_id: int, user_data: dict, key: str) -> Channel | None:
+    """Делает канал key активным для админа. None, если такого канала нет или он не его."""
+    channel = _channels.get(key)
+    if channel is None or user_id not in channel.admin_ids:
+        return None
+    user_data[USER_DATA_KEY] = key
+    return channel
+
+
+def label(channel: Channel) -> str:
+    """Префикс канала для сообщений админу ("[key] "); при одном канале - пустая строка."""
+    return f"[{channel.key}] " if len(_channels) > 1 else ""
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import functools
+import logging
+
+from telegram import Update
+from telegram.error import TelegramError
+
+from . import channels, config
+
+logger = logging.getLogger(__name__)
+
+# Классы тяжёлых операций и их лимиты одновременного выполнения.
+# Обработчики без декоратора (статистика, расписание, кнопки) ничем не ограничены.
+GENERATION = "generation"
+_LIMITS = {
+    GENERATION: lambda: config.GENERATION_CONCURRENCY,
+}
+_semaphores: dict[str, asyncio.Semaphore] = {}
+
+
+def get_semaphore(name: str) -> asyncio.Semaphore:
+    """Семафор класса операций (создаётся при первом обращении внутри event loop)."""
+    if name not in _semaphores:
+        _semaphores[name] = asyncio.Semaphore(max(_LIMITS[name](), 1))
+    return _semaphores[name]
+
+
+def limited(name: str):
+    """
+    Декоратор: не более N одновременных вызовов для класса операций name.
+    Если все слоты заняты, вызов ждёт очереди, а админ получает уведомление (если вызов пришёл из Update).
+    Вызовы из Update от не-админов отбрасываются до семафора: без ответа и без места в очереди.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            update = next((a for a in args if isinstance(a, Update)), None)
+            if update is not None and (not update.effective_user or not channels.is_admin(update.effective_user.id)):
+                user_id = update.effective_user.id if update.effective_user else None
+                logger.warning(f"{func.__name__}: неавторизованный доступ от user_id: {user_id}, запрос отклонён.")
+                return
+            semaphore = get_semaphore(name)
+            if semaphore.locked():
+                logger.info(f"{func.__name__}: все слоты '{name}' заняты, ожидание очереди.")
+                if update and update.effective_message:
+                    try:
+                        await update.effective_message.reply_text(
+                            f"⏳ Все слоты генерации заняты ({_LIMITS[name]()}), запрос поставлен в очередь.", parse_mode=None
+                        )
+                    except TelegramError as e:
+                        logger.warning(f"Не удалось отправить уведомление об очереди: {e}")
+            async with semaphore:
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -40,8 +40,33 @@ def get_env_var(var_name: str, default: str | None = None, required: bool = Fals
 
 # --- Основные настройки ---
 BOT_TOKEN = get_env_var("BOT_TOKEN", required=True)
-CHANNEL_ID = get_env_var("CHANNEL_ID", required=True, is_int=True)
-ADMIN_ID = get_env_var("ADMIN_ID", required=True, is_int=True)
+# Несколько каналов в одном процессе: "ключ:channel_id:admin_id|admin_id,..." (см. app/channels.py).
+# Если задано, CHANNEL_ID/ADMIN_ID не обязательны; канал с CHANNEL_ID (или первый) использует прежние файлы данных
+CHANNELS = get_env_var("CHANNELS")
+CHANNEL_ID = get_env_var("CHANNEL_ID", required=not CHANNELS, is_int=True)
+ADMIN_ID = get_env_var("ADMIN_ID", required=not CHANNELS, is_int=True)
+
+# --- Режим получения обновлений ---
+BOT_MODE = (get_env_var("BOT_MODE", default="polling") or "polling").strip().lower() # polling | webhook
+WEBHOOK_URL = get_env_var("WEBHOOK_URL") # Публичный https-адрес бота (например, за nginx/caddy с TLS)
+WEBHOOK_LISTEN = get_env_var("WEBHOOK_LISTEN", default="0.0.0.0")
+WEBHOOK_PORT = get_env_var("WEBHOOK_PORT", default="8443", is_int=True)
+WEBHOOK_PATH = get_env_var("WEBHOOK_PATH", default="telegram").strip("/")
+WEBHOOK_SECRET_TOKEN = get_env_var("WEBHOOK_SECRET_TOKEN") # Если не задан - генерируется при каждом запуске
+WEBHOOK_CERT = get_env_var("WEBHOOK_CERT") # Сертификат и ключ - только если TLS завершается самим ботом
+WEBHOOK_KEY = get_env_var("WEBHOOK_KEY")
+WEBHOOK_DELETE_ON_STOP = get_env_var("WEBHOOK_DELETE_ON_STOP", default="True").lower() == 'true'
+if BOT_MODE not in ("polling", "webhook"):
+    logger.warning(f"Неизвестный BOT_MODE '{BOT_MODE}', используется 'polling'.")
+    BOT_MODE = "polling"
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    err_msg = "❌ Для BOT_MODE=webhook нужно задать WEBHOOK_URL (публичный адрес, по которому Telegram доставит обновления)!"
+    logger.critical(err_msg)
+    raise ValueError(err_msg)
+
+# --- Параллельная обработка обновлений ---
+UPDATE_CONCURRENCY = get_env_var("UPDATE_CONCURRENCY", default="16", is_int=True) # Одновременно обрабатываемых обновлений
+GENERATION_CONCURRENCY = get_env_var("GENERATION_CONCURRENCY", default="2", is_int=True) # Одновременных генераций (/idea, /news, /research, автопост)
 
 # --- Настройки OpenAI ---
 OPENAI_API_KEY = get_env_var("OPENAI_API_KEY", required=True)
@@ -50,18 +75,88 @@ OPENAI_PROXY = get_env_var("OPENAI_PROXY") # Может быть None
 
 # --- Настройки Perplexity ---
 PPLX_API_KEY = get_env_var("PPLX_API_KEY") # Может быть None
+PPLX_MODEL = get_env_var("PPLX_MODEL", default="sonar")
+PPLX_CACHE_TTL = get_env_var("PPLX_CACHE_TTL", default="21600", is_int=True) # Секунды; кэш также сбрасывается со сменой дня
+
+# --- Настройки /research ---
+RESEARCH_PROVIDERS = get_env_var("RESEARCH_PROVIDERS", default="perplexity,openai") # Провайдеры через запятую
+RESEARCH_FANOUT = get_env_var("RESEARCH_FANOUT", default="True").lower() == 'true' # Опрашивать провайдеров параллельно
+RESEARCH_TIMEOUT = get_env_var("RESEARCH_TIMEOUT", default="90", is_int=True) # Таймаут одного провайдера, сек.
+
+# --- Замеры времени (/perf) ---
+PERF_WINDOW = get_env_var("PERF_WINDOW", default="1000", is_int=True) # Последних замеров на операцию для p50/p95
 
 # --- Внутренние пути и настройки ---
 LOG_FILE_REL = get_env_var("LOG_FILE", default="../data/telegram_channel_log.csv")
 PLOT_FILE_REL = get_env_var("PLOT_FILE", default="../data/posting_time_stats.png")
+DATA_DIR_REL = get_env_var("DATA_DIR", default="../data") # Состояние бота, черновики, кэши (относительно app/ или абсолютный путь)
+# Запись входящих обновлений и исходящих запросов для воспроизведения (benchmarks/replay.py); пусто - не писать
+TRAFFIC_RECORD_FILE_REL = get_env_var("TRAFFIC_RECORD_FILE")
 DEFAULT_POST_TIME = get_env_var("DEFAULT_POST_TIME", default="10:00")
 DAILY_AUTO_POST_JOB = get_env_var("DAILY_AUTO_POST_JOB", default="daily_auto_post_job")
+# За сколько минут до слота автопостинга генерировать пост заранее (0 - генерировать в момент публикации)
+AUTO_POST_PREGEN_LEAD_MINUTES = get_env_var("AUTO_POST_PREGEN_LEAD_MINUTES", default="15", is_int=True)
+AUTO_POST_SLOTS_PER_DAY = get_env_var("AUTO_POST_SLOTS_PER_DAY", default="1", is_int=True) # Лучших часов в каждый день недели
+AUTO_POST_MISFIRE_GRACE_MINUTES = get_env_var("AUTO_POST_MISFIRE_GRACE_MINUTES", default="120", is_int=True) # Окно досылки слота, пропущенного во время простоя (0 - не досылать)
+AUTO_POST_RESCHEDULE_HOURS = get_env_var("AUTO_POST_RESCHEDULE_HOURS", default="24", is_int=True) # Пересчёт слотов по статистике (0 - только по /auto_best)
 NEWS_RSS_URL = get_env_var("NEWS_RSS_URL", default="https://news.google.com/rss/search?q=artificial+intelligence&hl=ru&gl=RU&ceid=RU:ru")
+# Несколько лент через запятую, у каждой опционально вес источника: "url1|1.5,url2" (если не задано - NEWS_RSS_URL)
+NEWS_RSS_URLS = get_env_var("NEWS_RSS_URLS")
+NEWS_FETCH_CONCURRENCY = get_env_var("NEWS_FETCH_CONCURRENCY", default="32", is_int=True) # Одновременных загрузок лент (обычно все ленты в одну волну)
+NEWS_RECENCY_HALF_LIFE_HOURS = get_env_var("NEWS_RECENCY_HALF_LIFE_HOURS", default="12", is_int=True) # Затухание ранга по возрасту новости
+NEWS_MAX_ITEMS = get_env_var("NEWS_MAX_ITEMS", default="7", is_int=True) # Сколько лучших новостей попадает в промпт
+NEWS_SEEN_WINDOW_DAYS = get_env_var("NEWS_SEEN_WINDOW_DAYS", default="14", is_int=True) # Сколько дней помнить освещённые новости
+NEWS_SEEN_CAPACITY = get_env_var("NEWS_SEEN_CAPACITY", default="20000", is_int=True) # Ёмкость одного поколения индекса
+# Загрузка полного текста статей для /news
+NEWS_FETCH_ARTICLES = get_env_var("NEWS_FETCH_ARTICLES", default="True").lower() == 'true'
+NEWS_ARTICLE_TOKEN_BUDGET = get_env_var("NEWS_ARTICLE_TOKEN_BUDGET", default="2500", is_int=True) # Токенов на все фрагменты статей в промпте
+ARTICLE_FETCH_CONCURRENCY = get_env_var("ARTICLE_FETCH_CONCURRENCY", default="8", is_int=True)
+ARTICLE_PER_HOST_LIMIT = get_env_var("ARTICLE_PER_HOST_LIMIT", default="2", is_int=True)
+ARTICLE_FETCH_TIMEOUT = get_env_var("ARTICLE_FETCH_TIMEOUT", default="8", is_int=True) # Таймаут одной статьи, сек.
+ARTICLE_FETCH_BUDGET = get_env_var("ARTICLE_FETCH_BUDGET", default="12", is_int=True) # Общий бюджет на загрузку статей, сек.
+ARTICLE_CACHE_SIZE = get_env_var("ARTICLE_CACHE_SIZE", default="256", is_int=True)
+ARTICLE_CACHE_TTL_HOURS = get_env_var("ARTICLE_CACHE_TTL_HOURS", default="12", is_int=True)
+NEWS_POLL_INTERVAL = get_env_var("NEWS_POLL_INTERVAL", default="600", is_int=True) # Секунды между опросами RSS (0 - выключить)
+
+# --- Проверка черновиков на повтор тем (MinHash/LSH по логу постов) ---
+SIMILARITY_THRESHOLD = float(get_env_var("SIMILARITY_THRESHOLD", default="0.5")) # Оценка Жаккара, выше которой черновик помечается
+SIMILARITY_WINDOW_DAYS = get_env_var("SIMILARITY_WINDOW_DAYS", default="90", is_int=True) # С какими постами сравнивать
+
+# --- Подбор релевантных прошлых постов для промпта (TF-IDF) ---
+RETRIEVAL_ENGAGEMENT_WEIGHT = float(get_env_var("RETRIEVAL_ENGAGEMENT_WEIGHT", default="0.25")) # Вес реакций в ранжировании
+
+# --- Очередь исходящих сообщений (лимиты Bot API) ---
+SEND_GLOBAL_RATE = get_env_var("SEND_GLOBAL_RATE", default="25", is_int=True) # Запросов в секунду на всего бота
+SEND_CHAT_RATE = float(get_env_var("SEND_CHAT_RATE", default="1")) # Сообщений в секунду в личный чат
+SEND_GROUP_RATE_PER_MINUTE = get_env_var("SEND_GROUP_RATE_PER_MINUTE", default="20", is_int=True) # В канал/группу в минуту
+SEND_MAX_IN_FLIGHT = get_env_var("SEND_MAX_IN_FLIGHT", default="8", is_int=True) # Одновременных запросов в разные чаты
+SEND_MAX_RETRIES = get_env_var("SEND_MAX_RETRIES", default="3", is_int=True) # Повторов после RetryAfter
+
+# --- Хранилище черновиков (кнопки "Опубликовать"/"Удалить" ссылаются на черновик по id) ---
+DRAFT_CACHE_SIZE = get_env_var("DRAFT_CACHE_SIZE", default="200", is_int=True) # Черновиков в памяти (LRU)
+DRAFT_TTL_HOURS = get_env_var("DRAFT_TTL_HOURS", default="168", is_int=True) # Срок хранения неопубликованного черновика
+
+# --- Хранение состояния бота ---
+PERSISTENCE_BACKEND = (get_env_var("PERSISTENCE_BACKEND", default="sqlite") or "sqlite").strip().lower() # sqlite | pickle
+
+# --- Несколько реплик с общей директорией data/ ---
+# Задачи планировщика выполняет только реплика-лидер (аренда в bot_state.sqlite3), остальные обслуживают команды
+LEADER_ELECTION = get_env_var("LEADER_ELECTION", default="False").lower() == 'true'
+LEADER_LEASE_SECONDS = get_env_var("LEADER_LEASE_SECONDS", default="30", is_int=True) # Срок аренды лидерства
+LEADER_RENEW_SECONDS = get_env_var("LEADER_RENEW_SECONDS", default="10", is_int=True) # Как часто продлевать аренду и сверять задачи
+REPLICA_ID = get_env_var("REPLICA_ID") # Имя реплики в логах и аренде (по умолчанию hostname-pid)
+if LEADER_ELECTION and PERSISTENCE_BACKEND != "sqlite":
+    err_msg = "❌ LEADER_ELECTION требует PERSISTENCE_BACKEND=sqlite (аренда и задачи хранятся в общей SQLite базе)!"
+    logger.critical(err_msg)
+    raise ValueError(err_msg)
+if LEADER_ELECTION and LEADER_RENEW_SECONDS * 2 > LEADER_LEASE_SECONDS:
+    logger.warning("LEADER_RENEW_SECONDS больше половины LEADER_LEASE_SECONDS: лидерство может теряться при задержках продления.")
 
 # --- Абсолютные пути (важно для работы внутри Docker и с монтируемыми томами) ---
-DATA_DIR = APP_DIR / "../data"
+DATA_DIR = APP_DIR / DATA_DIR_REL
 LOG_FILE = (APP_DIR / LOG_FILE_REL).resolve()
 PLOT_FILE = (APP_DIR / PLOT_FILE_REL).resolve()
+TRAFFIC_RECORD_FILE = (APP_DIR / TRAFFIC_RECORD_FILE_REL).resolve() if TRAFFIC_RECORD_FILE_REL else None
 
 # Создаем директорию data, если ее нет
 try:
@@ -72,9 +167,9 @@ except OSError as e:
      # sys.exit(1)
 
 # Проверка, что обязательные ID не нулевые (дополнительная защита)
-if not CHANNEL_ID or CHANNEL_ID == 0:
+if not CHANNELS and (not CHANNEL_ID or CHANNEL_ID == 0):
     raise ValueError("CHANNEL_ID не может быть 0. Укажите корректный ID канала (начинается с -100...).")
-if not ADMIN_ID or ADMIN_ID == 0:
+if not CHANNELS and (not ADMIN_ID or ADMIN_ID == 0):
     raise ValueError("ADMIN_ID не может быть 0. Укажите корректный ID администратора.")
 
 logger.info(f"Путь к лог-файлу: {LOG_FILE}")
@@ -156,6 +251,13 @@ if IMAGE_GENERATION_ENABLED:
          logger.warning(f"IMAGE_PROMPT_MAX_LENGTH должен быть положительным числом. Установлено значение по умолчанию 1000.")
          IMAGE_PROMPT_MAX_LENGTH = 1000
 
+# --- Кэш сгенерированных изображений (data/image_cache) ---
+IMAGE_CACHE_ENABLED = get_env_var("IMAGE_CACHE_ENABLED", default="True").lower() == 'true'
+IMAGE_CACHE_MAX_MB = get_env_var("IMAGE_CACHE_MAX_MB", default="200", is_int=True)
+IMAGE_CACHE_MAX_ITEMS = get_env_var("IMAGE_CACHE_MAX_ITEMS", default="500", is_int=True)
+if IMAGE_GENERATION_ENABLED:
+    logger.info(f"  -> Кэш изображений: {'Включен' if IMAGE_CACHE_ENABLED else 'Выключен'} (лимит {IMAGE_CACHE_MAX_MB} МБ / {IMAGE_CACHE_MAX_ITEMS} шт.)")
+
 # ============================================================
 # --- Конец блока настроек генерации изображений ---
 # ============================================================
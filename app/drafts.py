@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Хранилище черновиков на стороне сервера: кнопки несут только короткий id ("publish:<id>"),
+# а публикация берёт исходный текст и метаданные отсюда, а не из текста сообщения в Telegram.
+# Функции синхронные и могут ждать блокировку базы до busy_timeout (при LEADER_ELECTION её делят реплики),
+# поэтому из корутин они вызываются через asyncio.to_thread.
+DB_PATH = config.DATA_DIR / "drafts.sqlite3"
+ID_BYTES = 6 # 8 символов base64url: callback_data "publish:<id>" укладывается в лимит 64 байта
+_PRUNE_INTERVAL = 3600 # Не чаще раза в час удаляем просроченные строки из базы
+
+# LRU в памяти: id -> {"id", "text", "kind", "meta", "created_at"}.
+# При LEADER_ELECTION база общая для реплик и черновик могла опубликовать или удалить другая реплика,
+# поэтому LRU не используется: черновики всегда читаются из базы, а публикация забирает черновик через claim().
+_cache: OrderedDict = OrderedDict()
+_conn: sqlite3.Connection | None = None
+_last_prune = 0.0
+_lock = threading.Lock()
+
+
+def _connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=10, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL") # В WAL без fsync на каждую запись: вызовы идут прямо из хэндлеров
+        _conn.execute("PRAGMA busy_timeout=10000")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS drafts ("
+            "id TEXT PRIMARY KEY, text TEXT NOT NULL, kind TEXT NOT NULL, meta TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS drafts_created_at ON drafts (created_at)")
+    return _conn
+
+
+def _ttl_seconds() -> float:
+    return config.DRAFT_TTL_HOURS * 3600
+
+
+def _remember(draft: dict):
+    """Кладёт черновик в LRU, вытесняя самые давно использованные."""
+    _cache[draft["id"]] = draft
+    _cache.move_to_end(draft["id"])
+    while len(_cache) > config.DRAFT_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def _prune(now: float):
+    """Удаляет просроченные черновики из базы (под _lock)."""
+    global _last_prune
+    if now - _last_prune < _PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    removed = _connection().execute("DELETE FROM drafts WHERE created_at < ?", (now - _ttl_seconds(),)).rowcount
+    if removed:
+        logger.info(f"Удалено просроченных черновиков: {removed}.")
+
+
+def save(text: str, kind: str, meta: dict | None = None, draft_id: str | None = None) -> str:
+    """
+    Сохраняет черновик и возвращает его короткий id.
+    draft_id задаёт id явно (заранее сгенерированный автопост ищется по имени задачи и дате); прежний черновик с ним заменяется.
+    """
+    now = time.time()
+    draft = {"id": draft_id or secrets.token_urlsafe(ID_BYTES), "text": text, "kind": kind, "meta": meta or {}, "created_at": now}
+    with _lock:
+        try:
+            _connection().execute(
+                "INSERT OR REPLACE INTO drafts (id, text, kind, meta, created_at) VALUES (?, ?, ?, ?, ?)",
+                (draft["id"], text, kind, json.dumps(draft["meta"], ensure_ascii=False, default=str), now),
+            )
+            _prune(now)
+        except sqlite3.Error as e:
+            # Черновик останется только в памяти: до перезапуска кнопки работают как обычно
+            logger.error(f"❌ Не удалось сохранить черновик {draft['id']} в базу: {e}")
+        _remember(draft)
+    return draft["id"]
+
+
+def _from_row(row) -> dict:
+    return {"id": row[0], "text": row[1], "kind": row[2], "meta": json.loads(row[3]), "created_at": row[4]}
+
+
+def get(draft_id: str) -> dict | None:
+    """Черновик по id (сначала LRU, при LEADER_ELECTION - сразу база) или None, если его нет или он просрочен."""
+    now = time.time()
+    with _lock:
+        draft = None if config.LEADER_ELECTION else _cache.get(draft_id)
+        if draft is None:
+            try:
+                row = _connection().execute(
+                    "SELECT id, text, kind, meta, created_at FROM drafts WHERE id = ?", (draft_id,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"❌ Ошибка чтения черновика {draft_id} из базы: {e}")
+                row = None
+            if row is None:
+                return None
+            draft = _from_row(row)
+        if now - draft["created_at"] > _ttl_seconds():
+            _cache.pop(draft_id, None)
+            try:
+                _connection().execute("DELETE FROM drafts WHERE id = ?", (draft_id,))
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось удалить просроченный черновик {draft_id}: {e}")
+            return None
+        if not config.LEADER_ELECTION:
+            _remember(draft)
+        return draft
+
+
+def claim(draft_id: str) -> dict | None:
+    """
+    Забирает черновик для публикации: удаляет строку из базы и возвращает черновик, если удалила именно эта
+    реплика (rowcount DELETE), иначе None - черновик уже забран другим нажатием или репликой, удалён или просрочен.
+    Если публикация не удалась, черновик возвращается через release().
+    """
+    with _lock:
+        _cache.pop(draft_id, None)
+        try:
+            conn = _connection()
+            row = conn.execute("SELECT id, text, kind, meta, created_at FROM drafts WHERE id = ?", (draft_id,)).fetchone()
+            if row is None or conn.execute("DELETE FROM drafts WHERE id = ?", (draft_id,)).rowcount != 1:
+                return None
+        except sqlite3.Error as e:
+            logger.error(f"❌ Не удалось забрать черновик {draft_id} из базы: {e}")
+            return None
+    draft = _from_row(row)
+    if time.time() - draft["created_at"] > _ttl_seconds():
+        return None
+    return draft
+
+
+def release(draft: dict):
+    """Возвращает забранный claim() черновик после неудачной публикации (с прежним временем создания)."""
+    with _lock:
+        try:
+            _connection().execute(
+                "INSERT OR IGNORE INTO drafts (id, text, kind, meta, created_at) VALUES (?, ?, ?, ?, ?)",
+                (draft["id"], draft["text"], draft["kind"], json.dumps(draft["meta"], ensure_ascii=False, default=str),
+                 draft["created_at"]),
+            )
+        except sqlite3.Error as e:
+            logger.error(f"❌ Не удалось вернуть черновик {draft['id']} в базу: {e}")
+
+
+def delete(draft_id: str):
+    """Удаляет черновик (после публикации или по кнопке "Удалить")."""
+    with _lock:
+        _cache.pop(draft_id, None)
+        try:
+            _connection().execute("DELETE FROM drafts WHERE id = ?", (draft_id,))
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось удалить черновик {draft_id} из базы: {e}")
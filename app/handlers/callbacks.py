@@ -2,44 +2,170 @@
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler
-from telegram.error import Forbidden, TelegramError # Импортируем ошибки
+from telegram.error import Forbidden, TelegramError, BadRequest # Импортируем ошибки
 from telegram.constants import ParseMode # Для возможной разметки подписи
 
 import io # Нужен для InputFile из байтов
+import asyncio
+from collections import OrderedDict
 
-from .. import config
+from .. import channels, config, drafts, image_cache, perf, send_queue
+from ..channels import Channel
 from ..post_logger import log_post # Импортируем функцию логирования
 from ..openai_client import generate_image # Импортируем функцию генерации изображения
 from ..utils import download_image # Импортируем функцию скачивания изображения
 
 logger = logging.getLogger(__name__)
 
-# --- Inline клавиатура для черновиков (без изменений) ---
+# --- Inline клавиатура для черновиков ---
+# Старый вариант без id: кнопки на черновиках, отправленных до появления хранилища черновиков
 INLINE_ACTION_KB = InlineKeyboardMarkup([
     [
         InlineKeyboardButton("📤 Опубликовать", callback_data="publish"),
         InlineKeyboardButton("🗑 Удалить", callback_data="delete")
     ]
 ])
+MESSAGE_LIMIT = 4096 # Лимит длины текстового сообщения Telegram
+
+
+def draft_keyboard(draft_id: str) -> InlineKeyboardMarkup:
+    """Кнопки черновика с его id из хранилища (callback_data "publish:<id>" / "delete:<id>")."""
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("📤 Опубликовать", callback_data=f"publish:{draft_id}"),
+            InlineKeyboardButton("🗑 Удалить", callback_data=f"delete:{draft_id}")
+        ]
+    ])
+
+
+async def send_draft(ctx: ContextTypes.DEFAULT_TYPE, notice: str, text: str, kind: str, meta: dict | None = None,
+                     channel: Channel | None = None, chat_id: int | None = None):
+    """
+    Сохраняет черновик канала в хранилище и отправляет админу (chat_id, по умолчанию первый админ канала) с кнопками.
+    Публикуется сохранённый текст, поэтому показ можно обрезать до лимита сообщения без потери поста.
+    """
+    channel = channels.resolve(channel)
+    chat_id = chat_id or channel.admin_ids[0]
+    draft_id = await asyncio.to_thread(drafts.save, text, kind, {**(meta or {}), "channel": channel.key})
+    shown = f"{channels.label(channel)}{notice}\n{text}"
+    if len(shown) > MESSAGE_LIMIT:
+        tail = "\n… (показано начало, будет опубликован полный текст)"
+        shown = shown[:MESSAGE_LIMIT - len(tail)] + tail
+    try:
+        return await send_queue.send(
+            lambda: ctx.bot.send_message(chat_id, shown, reply_markup=draft_keyboard(draft_id)), chat_id
+        )
+    except BadRequest as e:
+        # Разметка модели (или обрезка) может не разбираться как Markdown - показываем как есть
+        logger.warning(f"Черновик {draft_id} не отправлен с Markdown ({e}), отправляю без разметки.")
+        return await send_queue.send(
+            lambda: ctx.bot.send_message(chat_id, shown, reply_markup=draft_keyboard(draft_id), parse_mode=None),
+            chat_id
+        )
+
+
+def _text_from_message(message_text: str) -> str:
+    """Прежний способ: текст поста из сообщения с черновиком без служебных префиксов."""
+    text_to_publish = message_text
+    # Список возможных префиксов, которые нужно удалить
+    prefixes_to_remove = [
+        "💡 Черновик:", "📰 Новость:", "⚙️ Автопост:",
+        "💡 Черновик (Perplexity):", "💡 Черновик (OpenAI):", "⚠️ Использована резервная модель" # Удаляем и предупреждение о модели
+    ]
+    # Ищем и удаляем первый найденный префикс (и возможные переносы строк после него)
+    for prefix in prefixes_to_remove:
+         # Ищем префикс с возможным двоеточием или без, и с новой строки
+         if text_to_publish.strip().startswith(prefix.strip()):
+             # Удаляем префикс и все до первого осмысленного символа после него
+             parts = text_to_publish.split(prefix.strip(), 1)
+             if len(parts) > 1:
+                 text_to_publish = parts[1].strip()
+             else: # Если вдруг префикс был всем сообщением
+                 text_to_publish = ""
+             break # Убираем только первый найденный префикс
+    return text_to_publish
+
+
+# --- Защита от повторной обработки одного черновика ---
+# Обновления обрабатываются параллельно, поэтому двойное нажатие "Опубликовать" не должно
+# запустить две публикации. Ключ черновика - (chat_id, message_id) сообщения с кнопками.
+_drafts_in_progress: set[tuple[int, int]] = set()
+_handled_drafts: OrderedDict = OrderedDict() # Недавно обработанные черновики (ограниченный размер)
+_HANDLED_DRAFTS_MAX = 1000
+
+
+async def handle_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """
+    Пропускает к черновику только одно действие за раз: пока публикация или удаление выполняется,
+    а также после успешного завершения, повторные нажатия отклоняются. Если действие не удалось
+    (ошибка Telegram, пустой текст, нет прав на канал), черновик освобождается и кнопку можно нажать снова.
+    Проверка и отметка "в работе" идут без await между ними, поэтому атомарны в рамках event loop;
+    обращения к хранилищу черновиков (SQLite) - уже после отметки, в пуле потоков.
+    """
+    query = update.callback_query
+    action = query.data.split(":", 1)[0] if query and query.data else None
+    if not query or not query.message or action not in ("publish", "delete") or not channels.is_admin(query.from_user.id):
+        await _handle_draft_action(update, ctx)
+        return
+
+    key = (query.message.chat_id, query.message.message_id)
+    if key in _drafts_in_progress or key in _handled_drafts:
+        logger.info(f"Повторное нажатие '{action}' для черновика {key} отклонено.")
+        try:
+            await query.answer("⏳ Черновик уже обрабатывается." if key in _drafts_in_progress else "Черновик уже обработан.")
+        except TelegramError as e:
+            logger.warning(f"Не удалось ответить на повторный callback_query: {e}")
+        return
+
+    _drafts_in_progress.add(key)
+    draft_id = query.data.partition(":")[2]
+    claimed = None
+    done = False
+    try:
+        # При LEADER_ELECTION то же сообщение могут нажать на другой реплике: черновик забирается из общей базы
+        # до публикации, и публикует только та реплика, которой это удалось
+        if config.LEADER_ELECTION and action == "publish" and draft_id:
+            claimed = await asyncio.to_thread(drafts.claim, draft_id)
+            if claimed is None:
+                logger.info(f"Черновик {draft_id} не найден в общей базе (опубликован, удалён или просрочен), публикация отклонена.")
+                try:
+                    await query.answer("Черновик уже обработан или просрочен.")
+                except TelegramError as e:
+                    logger.warning(f"Не удалось ответить на callback_query: {e}")
+                return
+        done = await _handle_draft_action(update, ctx, claimed)
+        if done:
+            _handled_drafts[key] = True
+            while len(_handled_drafts) > _HANDLED_DRAFTS_MAX:
+                _handled_drafts.popitem(last=False)
+    finally:
+        _drafts_in_progress.discard(key)
+        if claimed and not done:
+            await asyncio.to_thread(drafts.release, claimed) # Публикация не удалась - черновик снова доступен для повтора
+
 
 # ============================================================
 # --- ОБНОВЛЕННЫЙ Обработчик нажатий на inline-кнопки ---
 # ============================================================
-async def handle_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает нажатия на inline-кнопки ('publish', 'delete')."""
+async def _handle_draft_action(update: Update, ctx: ContextTypes.DEFAULT_TYPE, claimed: dict | None = None) -> bool:
+    """
+    Обрабатывает нажатия на inline-кнопки ('publish', 'delete').
+    claimed - черновик, уже забранный из общей базы (drafts.claim при LEADER_ELECTION).
+    Возвращает True, если черновик опубликован или удалён; при отказе или ошибке - False (можно нажать ещё раз).
+    """
     query = update.callback_query
     if not query or not query.data:
         logger.warning("Получен пустой callback_query или query.data")
-        return
+        return False
 
-    # Проверяем, что пользователь - админ
-    if query.from_user.id != config.ADMIN_ID:
+    # Проверяем, что пользователь - админ (какого-либо канала; права на сам канал черновика проверяются ниже)
+    if not channels.is_admin(query.from_user.id):
         try:
             # Отвечаем на коллбэк с сообщением об ошибке
             await query.answer("🚫 Доступ запрещен.", show_alert=True)
         except TelegramError as e:
             logger.error(f"Ошибка ответа на callback неавторизованного пользователя: {e}")
-        return
+        return False
 
     # Отвечаем на колбэк, чтобы кнопка перестала "грузиться"
     try:
@@ -48,103 +174,114 @@ async def handle_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         logger.warning(f"Не удалось ответить на callback_query: {e}")
 
 
+    action, _, draft_id = query.data.partition(":")
+
     # --- Логика для кнопки "Опубликовать" ---
-    if query.data == "publish":
+    if action == "publish":
         if not query.message:
              logger.error("Не удалось получить сообщение из callback_query для публикации.")
              # Уведомить админа об ошибке?
-             await ctx.bot.send_message(config.ADMIN_ID, "❌ Ошибка: Не удалось получить текст исходного сообщения для публикации.")
-             return
-
-        original_message_text = query.message.text # Текст сообщения, к которому прикреплена кнопка
-        if not original_message_text:
-             logger.error("Сообщение, к которому прикреплена кнопка 'Опубликовать', не содержит текста.")
-             await query.edit_message_text("❌ Ошибка: Не удалось прочитать текст черновика.")
-             return
-
-        # 1. Извлекаем текст поста из сообщения с черновиком
-        text_to_publish = original_message_text
-        # Список возможных префиксов, которые нужно удалить
-        prefixes_to_remove = [
-            "💡 Черновик:", "📰 Новость:", "⚙️ Автопост:",
-            "💡 Черновик (Perplexity):", "⚠️ Использована резервная модель" # Удаляем и предупреждение о модели
-        ]
-        # Ищем и удаляем первый найденный префикс (и возможные переносы строк после него)
-        for prefix in prefixes_to_remove:
-             # Ищем префикс с возможным двоеточием или без, и с новой строки
-             if text_to_publish.strip().startswith(prefix.strip()):
-                 # Удаляем префикс и все до первого осмысленного символа после него
-                 parts = text_to_publish.split(prefix.strip(), 1)
-                 if len(parts) > 1:
-                     text_to_publish = parts[1].strip()
-                 else: # Если вдруг префикс был всем сообщением
-                     text_to_publish = ""
-                 break # Убираем только первый найденный префикс
+             await ctx.bot.send_message(query.from_user.id, "❌ Ошибка: Не удалось получить текст исходного сообщения для публикации.")
+             return False
+
+        # 1. Берём исходный текст черновика из хранилища по id из кнопки
+        draft = claimed or (await asyncio.to_thread(drafts.get, draft_id) if draft_id else None)
+        if draft:
+            text_to_publish = draft["text"].strip()
+            logger.info(f"Черновик {draft_id} ({draft['kind']}) взят из хранилища.")
+        else:
+            # Черновик без id (старые кнопки) или вытесненный по сроку: извлекаем текст из сообщения
+            if draft_id:
+                logger.warning(f"Черновик {draft_id} не найден в хранилище (просрочен?), текст берётся из сообщения.")
+            original_message_text = query.message.text # Текст сообщения, к которому прикреплена кнопка
+            if not original_message_text:
+                 logger.error("Сообщение, к которому прикреплена кнопка 'Опубликовать', не содержит текста.")
+                 send_queue.post_status(query.message, "❌ Ошибка: Не удалось прочитать текст черновика.")
+                 return False
+            text_to_publish = _text_from_message(original_message_text)
+
+        # Канал публикации берётся из черновика; для старых кнопок без черновика - активный канал админа
+        channel = (channels.get(draft["meta"].get("channel")) if draft else None) or channels.for_user(query.from_user.id, ctx.user_data)
+        if query.from_user.id not in channel.admin_ids:
+            logger.warning(f"Пользователь {query.from_user.id} не админ канала {channel.key}, публикация черновика {draft_id} отклонена.")
+            send_queue.post_status(query.message, f"🚫 Вы не администратор канала {channel.key}.")
+            return False
 
         # Проверяем, что текст не пуст после удаления префиксов
         if not text_to_publish:
              logger.warning("Попытка опубликовать пустой текст после удаления префикса.")
-             await query.edit_message_text("⚠️ Не удалось извлечь текст для публикации (текст пуст после удаления служебных префиксов).")
-             return
+             send_queue.post_status(query.message, "⚠️ Не удалось извлечь текст для публикации (текст пуст после удаления служебных префиксов).")
+             return False
         logger.info(f"Извлечен текст для публикации: '{text_to_publish[:100].replace(chr(10),' ')}...'")
 
 
-        # 2. Пытаемся сгенерировать и скачать изображение, если включено
+        # 2. Пытаемся взять изображение из кэша или сгенерировать и скачать его, если включено
         image_bytes = None
+        image_file_id = None # Telegram file_id из кэша (повторная публикация без загрузки)
+        image_cache_key = None
         if config.IMAGE_GENERATION_ENABLED:
-            # Уведомляем админа о начале генерации
-            try:
-                await query.edit_message_text("⏳ Генерирую изображение для поста...")
-            except TelegramError as e:
-                logger.warning(f"Не удалось обновить сообщение для админа перед генерацией изображения: {e}")
+            cached_image = None
+            if config.IMAGE_CACHE_ENABLED:
+                image_cache_key = image_cache.make_key(text_to_publish)
+                try:
+                    cached_image = await asyncio.to_thread(image_cache.get, image_cache_key)
+                except Exception as cache_e:
+                    logger.warning(f"Ошибка чтения кэша изображений: {cache_e}")
+
+            if cached_image:
+                image_file_id = cached_image["file_id"]
+                image_bytes = cached_image["bytes"]
+                logger.info(f"Изображение найдено в кэше (file_id: {'есть' if image_file_id else 'нет'}), генерация пропущена.")
+            else:
+                # Уведомляем админа о начале генерации (в фоне, генерация не ждёт правки)
+                send_queue.post_status(query.message, "⏳ Генерирую изображение для поста...")
 
-            try:
-                # Используем извлеченный текст поста как промпт
-                image_url = await generate_image(text_to_publish)
-
-                if image_url:
-                    # Пытаемся скачать изображение
-                    image_bytes = await download_image(image_url)
-                    if not image_bytes:
-                        logger.warning("Не удалось скачать сгенерированное изображение по URL.")
-                        try:
-                             await query.edit_message_text("⚠️ Не удалось скачать картинку. Публикую только текст...")
-                        except TelegramError as e: logger.warning(f"Не удалось обновить сообщение админа: {e}")
-                        # image_bytes уже None
+                try:
+                    # Используем извлеченный текст поста как промпт
+                    image_url = await generate_image(text_to_publish)
+
+                    if image_url:
+                        # Пытаемся скачать изображение
+                        image_bytes = await download_image(image_url)
+                        if not image_bytes:
+                            logger.warning("Не удалось скачать сгенерированное изображение по URL.")
+                            send_queue.post_status(query.message, "⚠️ Не удалось скачать картинку. Публикую только текст...")
+                            # image_bytes уже None
+                        else:
+                             logger.info("Изображение для поста успешно сгенерировано и скачано.")
+                             if image_cache_key:
+                                 try:
+                                     await asyncio.to_thread(image_cache.put, image_cache_key, image_bytes)
+                                 except Exception as cache_e:
+                                     logger.warning(f"Не удалось сохранить изображение в кэш: {cache_e}")
+                             # Не обновляем сообщение админа здесь, т.к. скоро будет финальный статус
                     else:
-                         logger.info("Изображение для поста успешно сгенерировано и скачано.")
-                         # Не обновляем сообщение админа здесь, т.к. скоро будет финальный статус
-                else:
-                    logger.warning("Функция generate_image не вернула URL.")
-                    try:
-                         await query.edit_message_text("⚠️ Не удалось сгенерировать картинку (нет URL). Публикую только текст...")
-                    except TelegramError as e: logger.warning(f"Не удалось обновить сообщение админа: {e}")
-                    image_bytes = None # Убеждаемся
+                        logger.warning("Функция generate_image не вернула URL.")
+                        send_queue.post_status(query.message, "⚠️ Не удалось сгенерировать картинку (нет URL). Публикую только текст...")
+                        image_bytes = None # Убеждаемся
 
-            except Exception as img_e:
-                logger.error(f"Ошибка во время генерации или скачивания изображения: {img_e}", exc_info=True)
-                try:
+                except Exception as img_e:
+                    logger.error(f"Ошибка во время генерации или скачивания изображения: {img_e}", exc_info=True)
                     # Сообщаем об ошибке, но продолжаем публиковать текст
-                    await query.edit_message_text(f"⚠️ Ошибка генерации картинки ({type(img_e).__name__}). Публикую только текст...")
-                except TelegramError as e: logger.warning(f"Не удалось обновить сообщение админа: {e}")
-                image_bytes = None # Убеждаемся, что публикуем только текст
+                    send_queue.post_status(query.message, f"⚠️ Ошибка генерации картинки ({type(img_e).__name__}). Публикую только текст...")
+                    image_bytes = None # Убеждаемся, что публикуем только текст
         else:
              logger.info("Генерация изображений отключена, публикуется только текст.")
 
+        has_image = bool(image_file_id or image_bytes)
 
         # 3. Публикация в канал
         try:
             sent_message = None
             publication_type = "неизвестно" # Тип для логов и сообщения админу
 
-            # Уведомляем админа о начале публикации
-            try:
-                status_msg = "⏳ Публикую фото с текстом..." if image_bytes else "⏳ Публикую текст..."
-                await query.edit_message_text(status_msg)
-            except TelegramError as e: logger.warning(f"Не удалось обновить сообщение админа перед публикацией: {e}")
+            # Уведомляем админа о начале публикации. Правка уходит в фоне: публикация в канал её не ждёт,
+            # а если пост опубликуется раньше, этот статус будет вытеснен финальным
+            status_msg = "⏳ Публикую фото с текстом..." if has_image else "⏳ Публикую текст..."
+            send_queue.post_status(query.message, status_msg)
 
 
-            if image_bytes:
+            if has_image:
                 # Отправляем ФОТО с текстом в ПОДПИСИ (caption)
                 caption = text_to_publish
                 # Проверяем лимит длины подписи (1024 символа в Telegram)
@@ -153,90 +290,117 @@ async def handle_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
                     logger.warning(f"Текст поста ({len(caption)} симв.) длиннее лимита подписи ({caption_limit}). Текст будет обрезан.")
                     caption = caption[:caption_limit]
 
-                sent_message = await ctx.bot.send_photo(
-                    chat_id=config.CHANNEL_ID,
-                    photo=io.BytesIO(image_bytes), # Передаем байты изображения
-                    caption=caption,
-                    # parse_mode можно добавить, если нужен Markdown/HTML в подписи
-                    # parse_mode=ParseMode.MARKDOWN
-                )
+                if image_file_id:
+                    try:
+                        # Повторная публикация: Telegram уже хранит файл, загрузка не нужна
+                        sent_message = await send_queue.send(
+                            lambda: ctx.bot.send_photo(chat_id=channel.chat_id, photo=image_file_id, caption=caption),
+                            channel.chat_id, send_queue.CHANNEL
+                        )
+                    except BadRequest as e:
+                        logger.warning(f"file_id из кэша отклонен Telegram ({e}), загружаю файл заново.")
+                        await asyncio.to_thread(image_cache.set_file_id, image_cache_key, None)
+                        image_bytes = await asyncio.to_thread(image_cache.load_bytes, image_cache_key)
+                        if not image_bytes:
+                            raise
+
+                if sent_message is None:
+                    # Через очередь публикаций в канал: приоритет выше статусов админа, учёт flood control
+                    sent_message = await send_queue.send(
+                        lambda: ctx.bot.send_photo(
+                            chat_id=channel.chat_id,
+                            photo=io.BytesIO(image_bytes), # Новый поток на каждую попытку (повтор после RetryAfter)
+                            caption=caption,
+                            # parse_mode можно добавить, если нужен Markdown/HTML в подписи
+                            # parse_mode=ParseMode.MARKDOWN
+                        ),
+                        channel.chat_id, send_queue.CHANNEL
+                    )
                 publication_type = "фото с подписью"
+
+                # Запоминаем file_id, чтобы при повторе не загружать файл снова
+                if image_cache_key and sent_message.photo:
+                    try:
+                        await asyncio.to_thread(image_cache.set_file_id, image_cache_key, sent_message.photo[-1].file_id)
+                    except Exception as cache_e:
+                        logger.warning(f"Не удалось сохранить file_id в кэш: {cache_e}")
             else:
                 # Отправляем только ТЕКСТ
-                sent_message = await ctx.bot.send_message(
-                    chat_id=config.CHANNEL_ID,
-                    text=text_to_publish
-                    # parse_mode=ParseMode.MARKDOWN # Если нужен Markdown/HTML в тексте
+                sent_message = await send_queue.send(
+                    lambda: ctx.bot.send_message(
+                        chat_id=channel.chat_id,
+                        text=text_to_publish
+                        # parse_mode=ParseMode.MARKDOWN # Если нужен Markdown/HTML в тексте
+                    ),
+                    channel.chat_id, send_queue.CHANNEL
                 )
                 publication_type = "текстовый пост"
 
-            logger.info(f"Пост ({publication_type}) успешно отправлен в канал {config.CHANNEL_ID}, message_id={sent_message.message_id}")
+            logger.info(f"Пост ({publication_type}) успешно отправлен в канал {channel.key} ({channel.chat_id}), message_id={sent_message.message_id}")
+            if draft:
+                await asyncio.to_thread(drafts.delete, draft_id)
 
             # 4. Логируем опубликованный пост в CSV (логируем полный текст)
             try:
-                log_post(
+                await asyncio.to_thread( # Вне event loop: при LEADER_ELECTION запись ждёт flock лога
+                    log_post,
                     message_id=sent_message.message_id,
                     text=text_to_publish, # Логируем ПОЛНЫЙ текст, не обрезанный caption
                     timestamp=sent_message.date, # Используем время отправки от Telegram
-                    reactions=0 # Реакции на момент публикации неизвестны
+                    reactions=0, # Реакции на момент публикации неизвестны
+                    channel=channel
                 )
             except Exception as log_e:
                 logger.error(f"❌ Ошибка логирования поста {sent_message.message_id} после публикации: {log_e}")
                 # Уведомляем админа об этой проблеме, она не должна мешать публикации
                 await ctx.bot.send_message(
-                    chat_id=config.ADMIN_ID,
+                    chat_id=query.from_user.id,
                     text=f"⚠️ Пост опубликован (ID: {sent_message.message_id}), но произошла ошибка при его записи в лог: {log_e}"
                 )
 
             # 5. Редактируем исходное сообщение в чате с админом - финальный статус
-            final_admin_text = f"✅ Опубликовано ({publication_type}) в канале!\n\n"
+            final_admin_text = f"{channels.label(channel)}✅ Опубликовано ({publication_type}) в канале!\n\n"
             preview_text = text_to_publish.replace('\n', ' ')[:100] # Краткий предпросмотр
-            if image_bytes:
+            if has_image:
                  final_admin_text += f"🖼️ + _{preview_text}..._"
             else:
                  final_admin_text += f"_{preview_text}..._"
 
-            try:
-                 await query.edit_message_text(final_admin_text, parse_mode=ParseMode.MARKDOWN)
-            except TelegramError as e:
-                 logger.warning(f"Не удалось обновить финальный статус для админа: {e}")
-                 # Можно отправить новым сообщением, если редактирование не удалось
-                 # await ctx.bot.send_message(config.ADMIN_ID, final_admin_text, parse_mode=ParseMode.MARKDOWN)
+            send_queue.post_status(query.message, final_admin_text, parse_mode=ParseMode.MARKDOWN)
+            return True
 
 
         except Forbidden as e:
             # Ошибка прав доступа
-            logger.error(f"❌ Forbidden: Не удалось опубликовать пост в канал {config.CHANNEL_ID}: {e}. Проверьте права бота в канале.", exc_info=True)
+            logger.error(f"❌ Forbidden: Не удалось опубликовать пост в канал {channel.chat_id}: {e}. Проверьте права бота в канале.", exc_info=True)
             error_text = f"❌ Ошибка прав доступа: {e}\nБот должен быть администратором канала с правом отправки "
-            error_text += "фотографий." if image_bytes else "сообщений."
-            try:
-                await query.edit_message_text(error_text)
-            except TelegramError as te: logger.error(f"Не удалось уведомить админа об ошибке Forbidden: {te}")
+            error_text += "фотографий." if has_image else "сообщений."
+            send_queue.post_status(query.message, error_text)
+            # Ошибка после отправки (например, в уведомлении о логе) не должна разрешать повторную публикацию
+            return sent_message is not None
 
         except TelegramError as e:
              # Другие ошибки Telegram API
-             logger.error(f"❌ Ошибка Telegram при публикации в канал {config.CHANNEL_ID}: {e}", exc_info=True)
+             logger.error(f"❌ Ошибка Telegram при публикации в канал {channel.chat_id}: {e}", exc_info=True)
              error_text = f"❌ Ошибка Telegram при публикации: {e}"
-             try:
-                 await query.edit_message_text(error_text)
-             except TelegramError as te: logger.error(f"Не удалось уведомить админа об ошибке Telegram: {te}")
+             send_queue.post_status(query.message, error_text)
+             return sent_message is not None
 
         except Exception as e:
             # Любая другая непредвиденная ошибка
-            logger.error(f"❌ Непредвиденная ошибка при публикации в канал {config.CHANNEL_ID}: {e}", exc_info=True)
+            logger.error(f"❌ Непредвиденная ошибка при публикации в канал {channel.chat_id}: {e}", exc_info=True)
             error_text = f"❌ Непредвиденная ошибка при публикации: {e}"
-            try:
-                await query.edit_message_text(error_text)
-            except TelegramError as te: logger.error(f"Не удалось уведомить админа о непредвиденной ошибке: {te}")
+            send_queue.post_status(query.message, error_text)
+            return sent_message is not None
 
 
     # --- Логика для кнопки "Удалить" ---
-    elif query.data == "delete":
-        try:
-            await query.edit_message_text("🗑 Черновик удален.")
-            logger.info(f"Черновик удален пользователем {query.from_user.id}")
-        except TelegramError as e:
-            logger.warning(f"Не удалось отредактировать сообщение для удаления черновика: {e}")
+    elif action == "delete":
+        if draft_id:
+            await asyncio.to_thread(drafts.delete, draft_id)
+        send_queue.post_status(query.message, "🗑 Черновик удален.")
+        logger.info(f"Черновик удален пользователем {query.from_user.id}")
+        return True
 
     # --- Обработка неизвестных callback_data ---
     else:
@@ -246,6 +410,13 @@ async def handle_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             await query.answer("Неизвестное действие.")
         except TelegramError as e:
             logger.warning(f"Не удалось ответить на неизвестный callback_query: {e}")
+        return False
 
 # --- Создаем хэндлер для колбэков ---
-callback_handler = CallbackQueryHandler(handle_callback)
+def _perf_name(update: Update, ctx) -> str:
+    """Операция для /perf: действие кнопки из callback_data ("callback:publish", "callback:delete")."""
+    query = update.callback_query
+    return f"callback:{(query.data or '').partition(':')[0]}" if query else "callback"
+
+
+callback_handler = CallbackQueryHandler(perf.timed(_perf_name)(handle_callback))
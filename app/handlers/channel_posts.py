@@ -1,7 +1,8 @@
+import asyncio
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes, MessageHandler, filters
-from .. import config
+from .. import channels
 from ..post_logger import log_post
 
 logger = logging.getLogger(__name__)
@@ -12,29 +13,32 @@ async def log_new_channel_post(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return # Игнорируем другие типы апдейтов
 
     message = update.channel_post
-    # Убедимся, что это именно наш канал (хотя фильтр уже должен это делать)
-    if message.chat_id != config.CHANNEL_ID:
+    # Канал по id чата (поиск в словаре); фильтр уже пропускает только наши каналы
+    channel = channels.by_chat_id(message.chat_id)
+    if channel is None:
         logger.warning(f"Получен channel_post из другого канала: {message.chat_id}")
         return
 
     # Логируем только текстовые сообщения (можно расширить для фото и т.д.)
     if message.text:
-        logger.info(f"Обнаружен новый пост в канале {config.CHANNEL_ID} (message_id={message.message_id}). Логирование...")
+        logger.info(f"Обнаружен новый пост в канале {channel.key} ({channel.chat_id}, message_id={message.message_id}). Логирование...")
         try:
-            log_post(
+            await asyncio.to_thread( # Запись в CSV и обновление индексов - в пуле потоков
+                log_post,
                 message_id=message.message_id,
                 text=message.text,
                 timestamp=message.date,
-                reactions=0 # Реакции на момент публикации неизвестны
+                reactions=0, # Реакции на момент публикации неизвестны
+                channel=channel
             )
         except Exception as e:
             logger.error(f"❌ Ошибка логирования поста {message.message_id} из канала: {e}", exc_info=True)
     else:
         logger.debug(f"Получен нетекстовый пост (message_id={message.message_id}) в канале, логирование пропущено.")
 
-# Фильтр для новых постов в НАШЕМ канале
-# Важно: Бот должен быть добавлен в канал как администратор с правами читать сообщения!
-channel_post_filter = filters.UpdateType.CHANNEL_POST & filters.Chat(chat_id=config.CHANNEL_ID)
+# Фильтр для новых постов в НАШИХ каналах (все каналы из реестра)
+# Важно: Бот должен быть добавлен в каждый канал как администратор с правами читать сообщения!
+channel_post_filter = filters.UpdateType.CHANNEL_POST & filters.Chat(chat_id=channels.chat_ids())
 
 # Создаем хэндлер
 channel_post_handler = MessageHandler(channel_post_filter, log_new_channel_post)
@@ -42,7 +46,7 @@ channel_post_handler = MessageHandler(channel_post_filter, log_new_channel_post)
 # Также можно добавить обработчик для ИЗМЕНЕННЫХ постов, если нужно обновлять текст/реакции
 # async def log_edited_channel_post(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 #     # ... (логика похожа, но обновляет существующую запись) ...
-# edited_channel_post_handler = MessageHandler(filters.UpdateType.EDITED_CHANNEL_POST & filters.Chat(chat_id=config.CHANNEL_ID), log_edited_channel_post)
+# edited_channel_post_handler = MessageHandler(filters.UpdateType.EDITED_CHANNEL_POST & filters.Chat(chat_id=channels.chat_ids()), log_edited_channel_post)
 
 # Примечание: Получение РЕАКЦИЙ на посты канала через стандартный Bot API затруднено.
 # Обычно для этого требуются либо user-боты, либо специальные библиотеки/сервисы,
@@ -1,10 +1,9 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import logging
 import httpx        # Используем для RSS и Perplexity
-import feedparser   # Для парсинга RSS
 import ssl          # Для обработки SSL ошибок
-from datetime import datetime, time as dtime, timezone
-import pandas as pd
+from datetime import datetime, timezone
 
 from telegram import Update, ReplyKeyboardMarkup, InputFile
 from telegram.ext import ContextTypes, CommandHandler
@@ -12,13 +11,16 @@ from telegram.constants import ParseMode
 from telegram.error import TelegramError, Forbidden, BadRequest # Добавили BadRequest
 
 # Импорт локальных модулей
-from .. import config
+from .. import channels, config, leader, news_feed, perf, seen_news, article_fetch, similarity, perplexity_client, research
+from ..channels import Channel
+from ..concurrency import limited, GENERATION
 from ..openai_client import get_async_openai_client # Используем async клиент
-from ..post_logger import read_top_posts, read_posts, log_post
-from ..prompts import PROMPT_TMPL_IDEA, PROMPT_TMPL_NEWS, PROMPT_TMPL_RESEARCH
-from ..utils import get_best_posting_time
-from .callbacks import INLINE_ACTION_KB # Импортируем клавиатуру для черновиков
-from .jobs import auto_post_job # Импортируем функцию для автопостинга
+from ..post_logger import read_posts, log_post
+from ..prompts import PROMPT_TMPL_IDEA, PROMPT_TMPL_NEWS, PROMPT_TOPIC_HINT
+from ..retrieval import build_posts_context
+from ..utils import get_best_posting_time, get_best_posting_slots, weekly_stats
+from .callbacks import send_draft # Отправка черновика с кнопками (текст хранится на сервере)
+from .jobs import apply_auto_post_slots, channel_jobs, format_slots, missed_runs, unschedule_channel, upcoming_runs # Слоты автопостинга
 
 logger = logging.getLogger(__name__)
 
@@ -40,48 +42,82 @@ async def start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Отправляет приветствие и клавиатуру админу."""
     if not update.message or not update.effective_user: return
     user_id = update.effective_user.id
-    if user_id != config.ADMIN_ID:
+    channel = channels.for_user(user_id, ctx.user_data)
+    if channel is None:
         logger.warning(f"Неавторизованный доступ к /start от user_id: {user_id}")
         return
+    greeting = "🤖 Привет! Я твой AI ассистент для канала.\nВыбери действие:"
+    if len(channels.admin_channels(user_id)) > 1:
+        greeting += f"\n\nАктивный канал: {channel.key} (сменить: /channel)"
     try:
-        await update.message.reply_text(
-            "🤖 Привет! Я твой AI ассистент для канала.\nВыбери действие:",
-            reply_markup=MENU_KB
-        )
+        await update.message.reply_text(greeting, reply_markup=MENU_KB, parse_mode=None)
     except (TelegramError, Forbidden) as e:
         logger.error(f"Ошибка отправки /start сообщения админу {user_id}: {e}")
 
+# --- Аналитика канала вне event loop ---
+async def _run_analytics(channel: Channel, func, *args):
+    """
+    Тяжёлая аналитика (чтение лога в pandas, график) в пуле потоков, не больше одной одновременно на канал:
+    event loop не блокируется, а частые запросы одного канала не занимают потоки, нужные другим.
+    """
+    async with channel.analytics_lock:
+        return await asyncio.to_thread(func, *args)
+
+
+# --- Проверка черновика на повтор недавних постов ---
+async def _warn_if_similar(ctx: ContextTypes.DEFAULT_TYPE, draft: str, channel: Channel, chat_id: int):
+    """Отправляет админу предупреждение (отдельным сообщением), если черновик похож на недавний пост канала."""
+    try:
+        matches = await asyncio.to_thread(similarity.find_similar, draft, None, None, channel)
+    except Exception as e:
+        logger.warning(f"Не удалось проверить черновик на похожие посты: {e}", exc_info=True)
+        return
+    if not matches:
+        return
+    best = matches[0]
+    posted = best["dt"].strftime('%d.%m.%Y') if best["dt"] else "дата неизвестна"
+    logger.info(f"Черновик похож на пост {best['message_id']} (сходство {best['similarity']:.2f}).")
+    warning = (
+        f"⚠️ Черновик похож на недавний пост ({posted}, сходство {best['similarity']:.0%}, "
+        f"всего похожих: {len(matches)}):\n«{best['preview'].replace(chr(10), ' ')}…»"
+    )
+    try:
+        await ctx.bot.send_message(chat_id, warning, parse_mode=None)
+    except TelegramError as e:
+        logger.warning(f"Не удалось отправить предупреждение о похожем посте: {e}")
+
+
 # --- Команда /idea (и для кнопки "💡 Идея") ---
+@limited(GENERATION)
 async def generate_idea(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Генерирует черновик идеи для поста с помощью OpenAI."""
     if not update.message or not update.effective_user: return
-    if update.effective_user.id != config.ADMIN_ID: return
+    channel = channels.for_user(update.effective_user.id, ctx.user_data)
+    if channel is None: return
 
     try:
         await update.message.reply_chat_action(action='typing')
     except TelegramError as e:
         logger.warning(f"Не удалось отправить chat_action 'typing': {e}")
 
+    # Тема от админа: /idea <тема> (из меню тема не передается)
+    topic = " ".join(ctx.args).strip() if ctx.args else None
+
     try:
-        # 1. Получаем лучшие посты из лога
-        logger.debug("Запрос топ постов для генерации идеи...")
-        top_posts_df = read_top_posts(5)
-        if not top_posts_df.empty:
-            posts_context = top_posts_df[['text', 'reactions']].to_string(index=False, header=True)
-            logger.debug(f"Топ посты найдены. Контекст ({len(posts_context)} симв.):\n{posts_context[:500]}...")
-        else:
-            posts_context = "(Пока нет данных о прошлых постах)"
-            logger.debug("Данные о прошлых постах отсутствуют.")
+        # 1. Получаем релевантные теме (или просто лучшие) посты из лога
+        logger.debug(f"Подбор прошлых постов для генерации идеи (тема: {topic or 'не задана'})...")
+        posts_context = await asyncio.to_thread(build_posts_context, topic, 5, channel)
+        logger.debug(f"Контекст прошлых постов ({len(posts_context)} симв.):\n{posts_context[:500]}...")
 
         # 2. Формируем промпт
-        prompt = PROMPT_TMPL_IDEA.format(posts=posts_context)
+        prompt = PROMPT_TMPL_IDEA.format(posts=posts_context, topic=PROMPT_TOPIC_HINT.format(topic=topic) if topic else "")
         logger.debug(f"Сформирован промпт для OpenAI ({len(prompt)} симв.).")
 
         # 3. Вызываем OpenAI API (асинхронно)
         openai_client = get_async_openai_client()
         if not openai_client:
              logger.error("Не удалось получить клиент OpenAI для generate_idea.")
-             await ctx.bot.send_message(config.ADMIN_ID, "❌ Ошибка: Не удалось инициализировать клиент OpenAI.")
+             await ctx.bot.send_message(update.effective_user.id, "❌ Ошибка: Не удалось инициализировать клиент OpenAI.")
              return
 
         draft = None
@@ -92,12 +128,13 @@ async def generate_idea(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             nonlocal draft, last_err, used_model
             try:
                  logger.info(f"Запрос к OpenAI (модель: {model_name}) для генерации идеи...")
-                 resp = await openai_client.chat.completions.create(
-                    model=model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=1200, # Увеличим лимит для более длинных постов
-                    temperature=0.7, # Можно чуть уменьшить для большей предсказуемости
-                 )
+                 with perf.timer("openai.chat"):
+                     resp = await openai_client.chat.completions.create(
+                        model=model_name,
+                        messages=[{"role": "user", "content": prompt}],
+                        max_tokens=1200, # Увеличим лимит для более длинных постов
+                        temperature=0.7, # Можно чуть уменьшить для большей предсказуемости
+                     )
                  if resp.choices and resp.choices[0].message and resp.choices[0].message.content:
                      draft = resp.choices[0].message.content.strip()
                      used_model = model_name
@@ -124,14 +161,16 @@ async def generate_idea(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
         # 4. Отправляем результат админу
         if success and draft:
+            await _warn_if_similar(ctx, draft, channel, update.effective_user.id)
             notice = "💡 Черновик:"
             if used_model != config.MODEL:
                  notice = f"⚠️ Использована резервная модель {used_model}.\n{notice}"
-            await ctx.bot.send_message(config.ADMIN_ID, f"{notice}\n{draft}", reply_markup=INLINE_ACTION_KB)
+            await send_draft(ctx, notice, draft, "idea", {"model": used_model, "topic": topic},
+                             channel=channel, chat_id=update.effective_user.id)
         elif draft is None and success:
             error_message = "❌ Ошибка: OpenAI вернул пустой результат."
             logger.error(error_message)
-            await ctx.bot.send_message(config.ADMIN_ID, error_message)
+            await ctx.bot.send_message(update.effective_user.id, error_message)
         else:
             error_text = f"❌ Ошибка OpenAI при генерации идеи: {type(last_err).__name__}"
             # Добавляем специфичное сообщение для ошибки доступа
@@ -141,100 +180,109 @@ async def generate_idea(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
                  error_text += f": {last_err}" # Добавляем детали для других ошибок
 
             logger.error(f"Ошибка OpenAI при генерации идеи. Последняя ошибка: {last_err}", exc_info=isinstance(last_err, Exception))
-            await ctx.bot.send_message(config.ADMIN_ID, error_text)
+            await ctx.bot.send_message(update.effective_user.id, error_text)
 
     except Exception as e:
         logger.error(f"❌ Непредвиденная ошибка в generate_idea: {e}", exc_info=True)
         try:
             # Упрощаем сообщение об ошибке
-            await ctx.bot.send_message(config.ADMIN_ID, f"❌ Внутренняя ошибка при генерации идеи: {type(e).__name__}")
+            await ctx.bot.send_message(update.effective_user.id, f"❌ Внутренняя ошибка при генерации идеи: {type(e).__name__}")
         except Exception as send_e:
              logger.error(f"Не удалось отправить сообщение об ошибке generate_idea админу: {send_e}")
 
 
 # --- Команда /news (и для кнопки "📰 Новости") (Используем HTTX) ---
+@limited(GENERATION)
 async def generate_news_post(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Генерирует черновик поста на основе новостей из RSS, используя httpx."""
     if not update.message or not update.effective_user: return
-    if update.effective_user.id != config.ADMIN_ID: return
+    channel = channels.for_user(update.effective_user.id, ctx.user_data)
+    if channel is None: return
 
     try:
         await update.message.reply_chat_action(action='typing')
     except TelegramError as e:
         logger.warning(f"Не удалось отправить chat_action 'typing': {e}")
 
-    rss_url = config.NEWS_RSS_URL
-    if not rss_url:
-         logger.error("URL RSS ленты новостей не указан в конфигурации (NEWS_RSS_URL).")
-         await ctx.bot.send_message(config.ADMIN_ID, "❌ URL RSS ленты не настроен.")
+    feeds = news_feed.get_feed_urls()
+    if not feeds:
+         logger.error("URL RSS ленты новостей не указан в конфигурации (NEWS_RSS_URL / NEWS_RSS_URLS).")
+         await ctx.bot.send_message(update.effective_user.id, "❌ URL RSS ленты не настроен.")
          return
 
-    # --- 1. Загрузка RSS ленты с использованием httpx ---
-    logger.info(f"Загрузка новостей из RSS (httpx): {rss_url}")
-    feed_data = {}
+    rss_url = feeds[0][0] if len(feeds) == 1 else f"{len(feeds)} лент"
+
+    # --- 1. Снимок RSS лент (обновляется фоновым опросом rss_poll_job) ---
+    snapshot = news_feed.get_snapshot()
+    if not snapshot["entries"]:
+        # Снимка ещё нет (опрос выключен или не успел отработать) — загружаем ленту сейчас
+        logger.info(f"Снимок RSS пуст, загрузка новостей (httpx): {rss_url}")
+        try:
+            await news_feed.refresh_feed()
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Ошибка HTTP {e.response.status_code} при загрузке RSS {rss_url}", exc_info=False)
+            await ctx.bot.send_message(update.effective_user.id, f"❌ Ошибка HTTP {e.response.status_code} при загрузке новостей.")
+            return
+        except httpx.TimeoutException as e:
+             logger.error(f"Таймаут при загрузке RSS {rss_url}: {e}", exc_info=False)
+             await ctx.bot.send_message(update.effective_user.id, "❌ Таймаут при загрузке новостей.")
+             return
+        except httpx.RequestError as e:
+            # Особое внимание на SSL ошибки
+            if isinstance(e, httpx.ConnectError) and e.__cause__ and isinstance(e.__cause__, ssl.SSLError):
+                 ssl_error_details = repr(e.__cause__)
+                 logger.error(f"Ошибка SSL при подключении к RSS {rss_url}: {ssl_error_details}", exc_info=False)
+                 await ctx.bot.send_message(update.effective_user.id, f"❌ Ошибка SSL при загрузке новостей: {type(e.__cause__).__name__}")
+            else:
+                 logger.error(f"Ошибка сети/запроса при загрузке RSS {rss_url}: {e}", exc_info=True)
+                 await ctx.bot.send_message(update.effective_user.id, f"❌ Ошибка сети при загрузке новостей: {type(e).__name__}")
+            return
+        except news_feed.FeedParseError as e:
+            logger.warning(f"Не удалось распарсить RSS ({rss_url}) или лента пуста: {e}")
+            await ctx.bot.send_message(update.effective_user.id, f"❌ Не удалось разобрать новости из RSS: {e}")
+            return
+        except Exception as e: # Ловим другие ошибки (например, feedparser)
+            logger.error(f"Ошибка при обработке RSS {rss_url}: {e}", exc_info=True)
+            await ctx.bot.send_message(update.effective_user.id, f"❌ Ошибка обработки RSS ленты: {type(e).__name__}")
+            return
+        snapshot = news_feed.get_snapshot()
+
+    # Показываем админу, насколько свежий снимок используется
     try:
-        # Используем httpx.AsyncClient для асинхронного запроса
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True, verify=True) as client:
-            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-            response = await client.get(rss_url, headers=headers)
-
-            logger.debug(f"Ответ от RSS сервера: Статус {response.status_code}")
-            response.raise_for_status() # Проверка на ошибки HTTP (4xx, 5xx)
-
-            rss_content = response.content
-            if not rss_content:
-                 logger.error(f"Получен пустой ответ от RSS URL: {rss_url}")
-                 await ctx.bot.send_message(config.ADMIN_ID, "❌ Получен пустой ответ от RSS-сервера.")
-                 return
-
-            logger.debug(f"Попытка парсинга RSS контента ({len(rss_content)} байт)...")
-            feed_data = feedparser.parse(rss_content)
-            logger.info(f"RSS лента загружена и передана в feedparser.")
-
-    except httpx.HTTPStatusError as e:
-        logger.error(f"Ошибка HTTP {e.response.status_code} при загрузке RSS {rss_url}", exc_info=False)
-        await ctx.bot.send_message(config.ADMIN_ID, f"❌ Ошибка HTTP {e.response.status_code} при загрузке новостей.")
-        return
-    except httpx.TimeoutException as e:
-         logger.error(f"Таймаут при загрузке RSS {rss_url}: {e}", exc_info=False)
-         await ctx.bot.send_message(config.ADMIN_ID, "❌ Таймаут при загрузке новостей.")
-         return
-    except httpx.RequestError as e:
-        # Особое внимание на SSL ошибки
-        if isinstance(e, httpx.ConnectError) and e.__cause__ and isinstance(e.__cause__, ssl.SSLError):
-             ssl_error_details = repr(e.__cause__)
-             logger.error(f"Ошибка SSL при подключении к RSS {rss_url}: {ssl_error_details}", exc_info=False)
-             await ctx.bot.send_message(config.ADMIN_ID, f"❌ Ошибка SSL при загрузке новостей: {type(e.__cause__).__name__}")
-        else:
-             logger.error(f"Ошибка сети/запроса при загрузке RSS {rss_url}: {e}", exc_info=True)
-             await ctx.bot.send_message(config.ADMIN_ID, f"❌ Ошибка сети при загрузке новостей: {type(e).__name__}")
-        return
-    except Exception as e: # Ловим другие ошибки (например, feedparser)
-        logger.error(f"Ошибка при обработке RSS {rss_url}: {e}", exc_info=True)
-        await ctx.bot.send_message(config.ADMIN_ID, f"❌ Ошибка обработки RSS ленты: {type(e).__name__}")
-        return
-    # --- Конец блока загрузки RSS ---
-
-    # Проверка результата парсинга
-    if not feed_data or feed_data.get('bozo', 1) or not feed_data.entries:
-        bozo_exception = feed_data.get('bozo_exception', 'Неизвестная ошибка парсинга')
-        logger.warning(f"Не удалось распарсить RSS ({rss_url}) или лента пуста. Bozo: {feed_data.get('bozo', 'N/A')}, Exception: {bozo_exception}")
-        error_msg_detail = type(bozo_exception).__name__ if bozo_exception != 'Неизвестная ошибка парсинга' else bozo_exception
-        await ctx.bot.send_message(config.ADMIN_ID, f"❌ Не удалось разобрать новости из RSS: {error_msg_detail}")
+        await ctx.bot.send_message(
+            update.effective_user.id,
+            f"🗞 Лента: {len(snapshot['entries'])} записей, обновлена {news_feed.format_age(snapshot['age'])} назад "
+            f"(проверена {news_feed.format_age(snapshot['checked_age'])} назад)."
+        )
+    except TelegramError as e:
+        logger.warning(f"Не удалось отправить возраст ленты админу: {e}")
+
+    # --- Блок 2: Отбор ещё не освещённых новостей и форматирование ---
+    fresh_entries = seen_news.filter_unseen(snapshot["entries"], channel)
+    if not fresh_entries:
+        logger.info("Все новости из ленты уже использовались в черновиках.")
+        await ctx.bot.send_message(update.effective_user.id, "ℹ️ Новых новостей нет: все записи ленты уже использовались в черновиках.")
         return
+    used_entries = fresh_entries[:config.NEWS_MAX_ITEMS] # Записи уже без дублей и отсортированы по рангу
+
+    # Фрагменты полных статей (параллельная загрузка в пределах бюджета по времени и токенам)
+    try:
+        await update.message.reply_chat_action(action='typing')
+        excerpts = await article_fetch.get_excerpts(used_entries)
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить тексты статей, используются только описания из RSS: {e}", exc_info=True)
+        excerpts = {}
 
-    # --- Блок 2: Форматирование новостей ---
     news_items_context = ""
-    from bs4 import BeautifulSoup
-    for entry in feed_data.entries[:7]:
-        title = entry.get('title', 'Без заголовка')
-        summary = entry.get('summary', '')
-        summary_text = BeautifulSoup(summary, "html.parser").get_text(separator=' ', strip=True)
-        news_items_context += f"- {title}: {summary_text[:150]}...\n"
+    for entry in used_entries:
+        news_items_context += f"- {entry['title']}: {entry['summary_text'][:150]}...\n"
+        excerpt = excerpts.get(entry.get('link'))
+        if excerpt:
+            news_items_context += f"  Фрагмент статьи: {excerpt}\n"
 
     if not news_items_context:
          logger.warning("Не удалось извлечь тексты новостей из записей RSS.")
-         await ctx.bot.send_message(config.ADMIN_ID, "❌ Не удалось извлечь тексты новостей из RSS.")
+         await ctx.bot.send_message(update.effective_user.id, "❌ Не удалось извлечь тексты новостей из RSS.")
          return
     logger.debug(f"Контекст новостей для генерации поста:\n{news_items_context}")
 
@@ -245,7 +293,7 @@ async def generate_news_post(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     openai_client = get_async_openai_client()
     if not openai_client:
          logger.error("Не удалось получить клиент OpenAI для generate_news_post.")
-         await ctx.bot.send_message(config.ADMIN_ID, "❌ Ошибка: Не удалось инициализировать клиент OpenAI.")
+         await ctx.bot.send_message(update.effective_user.id, "❌ Ошибка: Не удалось инициализировать клиент OpenAI.")
          return
 
     draft = None
@@ -256,12 +304,13 @@ async def generate_news_post(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         nonlocal draft, last_err, used_model
         try:
             logger.info(f"Запрос к OpenAI (модель: {model_name}) для генерации новости...")
-            resp = await openai_client.chat.completions.create(
-                model=model_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=1500, # Увеличим для развернутых постов
-                temperature=0.65,
-            )
+            with perf.timer("openai.chat"):
+                resp = await openai_client.chat.completions.create(
+                    model=model_name,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=1500, # Увеличим для развернутых постов
+                    temperature=0.65,
+                )
             if resp.choices and resp.choices[0].message and resp.choices[0].message.content:
                  draft = resp.choices[0].message.content.strip()
                  used_model = model_name
@@ -288,11 +337,17 @@ async def generate_news_post(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         notice = "📰 Новость:"
         if used_model != config.MODEL:
              notice = f"⚠️ Использована резервная модель {used_model}.\n{notice}"
-        await ctx.bot.send_message(config.ADMIN_ID, f"{notice}\n{draft}", reply_markup=INLINE_ACTION_KB)
+        await send_draft(ctx, notice, draft, "news", {"model": used_model, "links": [e.get("link") for e in used_entries]},
+                         channel=channel, chat_id=update.effective_user.id)
+        # Запоминаем новости, чтобы не генерировать посты о них повторно в этом канале
+        try:
+            seen_news.mark_seen(used_entries, channel)
+        except Exception as e:
+            logger.error(f"❌ Не удалось обновить индекс просмотренных новостей: {e}", exc_info=True)
     elif draft is None and success:
          error_message = "❌ Ошибка: OpenAI вернул пустой результат для новости."
          logger.error(error_message)
-         await ctx.bot.send_message(config.ADMIN_ID, error_message)
+         await ctx.bot.send_message(update.effective_user.id, error_message)
     else:
         error_text = f"❌ Ошибка OpenAI при генерации новости: {type(last_err).__name__}"
         if isinstance(last_err, Forbidden) or (hasattr(last_err, 'code') and last_err.code == 'unsupported_country_region_territory'):
@@ -301,13 +356,13 @@ async def generate_news_post(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
              error_text += f": {last_err}"
 
         logger.error(f"Ошибка OpenAI при генерации новости. Последняя ошибка: {last_err}", exc_info=isinstance(last_err, Exception))
-        await ctx.bot.send_message(config.ADMIN_ID, error_text)
+        await ctx.bot.send_message(update.effective_user.id, error_text)
 
     # Перехват исключений на уровне всей функции (на всякий случай)
     # except Exception as e:
     #     logger.error(f"❌ Непредвиденная ошибка в generate_news_post: {e}", exc_info=True)
     #     try:
-    #         await ctx.bot.send_message(config.ADMIN_ID, f"❌ Внутренняя ошибка при обработке новостей: {type(e).__name__}")
+    #         await ctx.bot.send_message(update.effective_user.id, f"❌ Внутренняя ошибка при обработке новостей: {type(e).__name__}")
     #     except Exception as send_e:
     #          logger.error(f"Не удалось отправить сообщение об ошибке generate_news_post админу: {send_e}")
 
@@ -316,7 +371,8 @@ async def generate_news_post(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 async def show_stats(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Отправляет статистику по лучшему времени и график."""
     if not update.message or not update.effective_user: return
-    if update.effective_user.id != config.ADMIN_ID: return
+    channel = channels.for_user(update.effective_user.id, ctx.user_data)
+    if channel is None: return
 
     try:
         await update.message.reply_chat_action(action='upload_photo')
@@ -325,45 +381,46 @@ async def show_stats(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     try:
         logger.info("Запрос статистики лучшего времени постинга...")
-        best_time, plot_path = get_best_posting_time() # Используем исправленную функцию
-        message = f"📊 **Анализ времени публикаций**\n\n"
+        best_time, plot_path = await _run_analytics(channel, get_best_posting_time, channel)
+        message = f"{channels.label(channel)}📊 **Анализ времени публикаций**\n\n"
         message += f"🕒 Рекомендуемое время для постинга (UTC): **{best_time}**\n\n" # Уточнили UTC
         message += f"📈 График среднего числа реакций по часам (UTC):"
 
-        await ctx.bot.send_message(config.ADMIN_ID, message, parse_mode=ParseMode.MARKDOWN)
+        await ctx.bot.send_message(update.effective_user.id, message, parse_mode=ParseMode.MARKDOWN)
 
         if plot_path and plot_path.exists():
             logger.info(f"Отправка графика статистики: {plot_path}")
             try:
                  with open(plot_path, "rb") as photo_file:
-                     await ctx.bot.send_photo(config.ADMIN_ID, photo=photo_file)
+                     await ctx.bot.send_photo(update.effective_user.id, photo=photo_file)
                  logger.info(f"График статистики {plot_path} успешно отправлен админу.")
             except FileNotFoundError:
                  logger.error(f"Файл графика {plot_path} не найден для отправки.")
-                 await ctx.bot.send_message(config.ADMIN_ID, "⚠️ Ошибка: Файл графика не найден.")
+                 await ctx.bot.send_message(update.effective_user.id, "⚠️ Ошибка: Файл графика не найден.")
             except (TelegramError, Forbidden) as e:
                  logger.error(f"Не удалось отправить график {plot_path} админу: {e}")
-                 await ctx.bot.send_message(config.ADMIN_ID, f"⚠️ Не удалось отправить файл графика: {type(e).__name__}")
+                 await ctx.bot.send_message(update.effective_user.id, f"⚠️ Не удалось отправить файл графика: {type(e).__name__}")
         elif plot_generated := plot_path: # Если путь был, но файла нет
             logger.warning(f"Файл графика {plot_path} не существует.")
-            await ctx.bot.send_message(config.ADMIN_ID, "⚠️ Не удалось найти сгенерированный график.")
+            await ctx.bot.send_message(update.effective_user.id, "⚠️ Не удалось найти сгенерированный график.")
         else: # Если plot_path изначально None
              logger.info("График не сгенерирован (нет данных или ошибка).")
-             await ctx.bot.send_message(config.ADMIN_ID, "📉 График не сгенерирован (вероятно, недостаточно данных для анализа).")
+             await ctx.bot.send_message(update.effective_user.id, "📉 График не сгенерирован (вероятно, недостаточно данных для анализа).")
 
     except Exception as e:
         logger.error(f"❌ Ошибка в show_stats: {e}", exc_info=True)
         try:
-            await ctx.bot.send_message(config.ADMIN_ID, f"❌ Ошибка при показе статистики: {type(e).__name__}")
+            await ctx.bot.send_message(update.effective_user.id, f"❌ Ошибка при показе статистики: {type(e).__name__}")
         except Exception as send_e:
              logger.error(f"Не удалось отправить сообщение об ошибке show_stats админу: {send_e}")
 
 
 # --- Команда /auto_best (и для кнопки "🕒 Авто по лучшему") ---
 async def set_auto_post_best_time(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    """Настраивает ежедневный автопостинг на лучшее время."""
+    """Настраивает автопостинг на лучшие часы каждого дня недели (AUTO_POST_SLOTS_PER_DAY слотов в день)."""
     if not update.message or not update.effective_user: return
-    if update.effective_user.id != config.ADMIN_ID: return
+    channel = channels.for_user(update.effective_user.id, ctx.user_data)
+    if channel is None: return
 
     if not ctx.job_queue:
         logger.error("JobQueue не доступен в контексте для set_auto_post_best_time.")
@@ -371,35 +428,20 @@ async def set_auto_post_best_time(update: Update, ctx: ContextTypes.DEFAULT_TYPE
         return
 
     try:
-        logger.info("Запрос лучшего времени для настройки автопостинга...")
-        best_time_str, _ = get_best_posting_time()
-        try:
-            hour = int(best_time_str.split(":")[0])
-        except (ValueError, IndexError, TypeError) as time_e:
-            logger.error(f"Не удалось разобрать лучшее время '{best_time_str}': {time_e}. Используется дефолтное.")
-            hour = int(config.DEFAULT_POST_TIME.split(":")[0])
-            best_time_str = f"{hour:02d}:00"
-
-        post_time = dtime(hour=hour, minute=0, second=0, tzinfo=timezone.utc)
-        logger.info(f"Определено время для автопостинга: {post_time.strftime('%H:%M')} UTC")
-
-        current_jobs = ctx.job_queue.get_jobs_by_name(config.DAILY_AUTO_POST_JOB)
-        removed_count = 0
-        for job in current_jobs:
-            job.schedule_removal()
-            removed_count += 1
-        if removed_count > 0:
-            logger.info(f"Удалено {removed_count} предыдущих задач '{config.DAILY_AUTO_POST_JOB}'.")
-
-        ctx.job_queue.run_daily(
-            callback=auto_post_job,
-            time=post_time,
-            name=config.DAILY_AUTO_POST_JOB,
-            data={"channel_id": config.CHANNEL_ID, "admin_id": config.ADMIN_ID}
+        logger.info("Расчёт слотов автопостинга по дням недели...")
+        slots = await _run_analytics(channel, get_best_posting_slots, channel, config.AUTO_POST_SLOTS_PER_DAY)
+        job_data = {"channel": channel.key, "channel_id": channel.chat_id, "admin_id": update.effective_user.id}
+        changes, scheduled_here = await apply_auto_post_slots(ctx.application, channel, slots, job_data)
+
+        slot_count = sum(len(hours) for hours in slots.values())
+        reply = (
+            f"{channels.label(channel)}✅ Автопостинг настроен: **{slot_count}** публикаций в неделю.\n\n"
+            f"{format_slots(await channel_jobs(ctx.application, channel))}\n\n"
+            f"Изменено задач: +{changes['added']} / ~{changes['changed']} / -{changes['removed']}, без изменений: {changes['kept']}."
         )
-
-        logger.info(f"Задача '{config.DAILY_AUTO_POST_JOB}' запланирована на {post_time.strftime('%H:%M')} UTC.")
-        await update.message.reply_text(f"✅ Автопостинг настроен на **{best_time_str} UTC** ежедневно.", parse_mode=ParseMode.MARKDOWN)
+        if not scheduled_here:
+            reply += "\nℹ️ Публикацию выполнит реплика-лидер."
+        await update.message.reply_text(reply, parse_mode=ParseMode.MARKDOWN)
 
     except Exception as e:
         logger.error(f"❌ Ошибка при настройке автопостинга: {e}", exc_info=True)
@@ -413,7 +455,8 @@ async def set_auto_post_best_time(update: Update, ctx: ContextTypes.DEFAULT_TYPE
 async def weekly_report(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Генерирует и отправляет отчет по постам за последнюю неделю."""
     if not update.message or not update.effective_user: return
-    if update.effective_user.id != config.ADMIN_ID: return
+    channel = channels.for_user(update.effective_user.id, ctx.user_data)
+    if channel is None: return
 
     try:
         await update.message.reply_chat_action(action='typing')
@@ -422,34 +465,24 @@ async def weekly_report(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     try:
         logger.info("Генерация недельного отчета...")
-        df = read_posts()
+        df = await _run_analytics(channel, read_posts, channel)
         if df.empty or 'dt' not in df.columns or df['dt'].isnull().all():
             logger.warning("Нет данных для недельного отчета.")
             await update.message.reply_text("❌ Нет данных для отчёта.")
             return
 
-        if df['dt'].dt.tz is None:
-            logger.warning("Таймзоны в логе нет. Предполагается UTC.")
-            df['dt'] = df['dt'].dt.tz_localize(timezone.utc)
-
         now = datetime.now(timezone.utc)
-        one_week_ago = now - pd.Timedelta(days=7)
-        weekly_df = df[df['dt'] > one_week_ago].copy()
-
-        if weekly_df.empty:
+        stats = await _run_analytics(channel, weekly_stats, df, now)
+        if stats is None:
             logger.info("Нет постов за последнюю неделю.")
             await update.message.reply_text("📉 За последнюю неделю нет новых постов в логе.")
             return
+        top_posts = stats["top_posts"]
 
-        total_posts = len(weekly_df)
-        average_reactions = weekly_df['reactions'].fillna(0).mean()
-        total_reactions = weekly_df['reactions'].fillna(0).sum()
-        top_posts = weekly_df.nlargest(3, 'reactions')
-
-        report = f"📅 **Отчёт за последнюю неделю** ({one_week_ago.strftime('%d.%m.%Y')} - {now.strftime('%d.%m.%Y')})\n\n"
-        report += f"📝 Всего постов: {total_posts}\n"
-        report += f"📈 Сумма реакций: {int(total_reactions)}\n"
-        report += f"📊 Среднее число реакций: {average_reactions:.1f}\n\n"
+        report = f"{channels.label(channel)}📅 **Отчёт за последнюю неделю** ({stats['since'].strftime('%d.%m.%Y')} - {now.strftime('%d.%m.%Y')})\n\n"
+        report += f"📝 Всего постов: {stats['total_posts']}\n"
+        report += f"📈 Сумма реакций: {int(stats['total_reactions'])}\n"
+        report += f"📊 Среднее число реакций: {stats['average_reactions']:.1f}\n\n"
 
         if not top_posts.empty:
             report += "🏆 **Топ-3 поста по реакциям:**\n"
@@ -459,7 +492,7 @@ async def weekly_report(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         else:
             report += "ℹ️ Недостаточно данных для определения топ постов за неделю.\n"
 
-        await ctx.bot.send_message(config.ADMIN_ID, report, parse_mode=ParseMode.MARKDOWN)
+        await ctx.bot.send_message(update.effective_user.id, report, parse_mode=ParseMode.MARKDOWN)
         logger.info("Недельный отчет успешно отправлен админу.")
 
     except Exception as e:
@@ -470,129 +503,145 @@ async def weekly_report(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
              logger.error(f"Не удалось отправить сообщение об ошибке weekly_report админу: {send_e}")
 
 
-# --- Команда /research (и для кнопки "🔍 Ресёрч PPLX") (ИСПРАВЛЕНАЯ МОДЕЛЬ И ОБРАБОТКА ОШИБОК) ---
+# --- Команда /research (и для кнопки "🔍 Ресёрч PPLX") ---
+def _research_error_text(provider: str, e: Exception) -> str:
+    """Сообщение админу об ошибке одного провайдера ресёрча."""
+    title = research.PROVIDER_TITLES[provider]
+    if isinstance(e, perplexity_client.PerplexityAuthError):
+        logger.error("Ошибка 401 Unauthorized от Perplexity API. Проверьте PPLX_API_KEY.")
+        return "❌ Ошибка авторизации (401) Perplexity. Проверьте ключ."
+    if isinstance(e, perplexity_client.PerplexityError):
+        return f"❌ Ошибка API Perplexity: {e}"
+    if isinstance(e, httpx.HTTPStatusError):
+        error_body = e.response.text[:200] if hasattr(e.response, 'text') else '(нет тела ответа)'
+        logger.error(f"❌ Ошибка HTTP {e.response.status_code} от {title}: {error_body}", exc_info=False)
+        return f"❌ Ошибка HTTP {e.response.status_code} от {title} API."
+    if isinstance(e, httpx.RequestError):
+        return f"❌ Ошибка сети при обращении к {title}: {type(e).__name__}"
+    if isinstance(e, asyncio.TimeoutError):
+        return f"❌ {title} не ответил за {config.RESEARCH_TIMEOUT} сек."
+    return f"❌ Ошибка {title} при ресёрче: {type(e).__name__}: {e}"
+
+
+@limited(GENERATION)
+async def _deliver_research(ctx: ContextTypes.DEFAULT_TYPE, query: str, providers: list[str], channel: Channel, chat_id: int):
+    """
+    Фоновая доставка черновиков ресёрча. В режиме RESEARCH_FANOUT все провайдеры опрашиваются параллельно:
+    первый готовый черновик отправляется сразу, остальные - по мере поступления.
+    Иначе провайдеры опрашиваются по очереди (самый быстрый по статистике первым) до первого успеха.
+    Задержка каждого ответа записывается в bot_data для выбора провайдера по умолчанию.
+    """
+    stats = ctx.bot_data.setdefault(research.LATENCY_KEY, {})
+    delivered = 0
+    errors = []
+
+    async def handle(result: dict) -> bool:
+        nonlocal delivered
+        if not result["reused"]: # Ответ из кэша ничего не говорит о скорости провайдера
+            research.record_latency(stats, result["provider"], result["elapsed"], ok=bool(result["text"]))
+        if not result["text"]:
+            errors.append(_research_error_text(result["provider"], result["error"]))
+            return False
+        title = research.PROVIDER_TITLES[result["provider"]]
+        if delivered:
+            await ctx.bot.send_message(
+                chat_id, f"➕ Ещё один вариант: {title} ({result['elapsed']:.1f} сек.)", parse_mode=None
+            )
+        await send_draft(ctx, f"💡 Черновик ({title}):", result["text"], "research",
+                         {"provider": result["provider"], "query": query, "elapsed": round(result["elapsed"], 2)},
+                         channel=channel, chat_id=chat_id)
+        delivered += 1
+        return True
+
+    try:
+        if config.RESEARCH_FANOUT:
+            tasks = [asyncio.create_task(research.run_provider(p, query)) for p in providers]
+            try:
+                for next_result in asyncio.as_completed(tasks):
+                    await handle(await next_result)
+            finally:
+                for task in tasks:
+                    task.cancel()
+        else:
+            for provider in providers:
+                if await handle(await research.run_provider(provider, query)):
+                    break
+
+        if not delivered:
+            await ctx.bot.send_message(chat_id, "\n".join(errors) or "❌ Ресёрч не дал результата.")
+        elif errors:
+            logger.info(f"Ресёрч '{query}': отправлено черновиков {delivered}, ошибок провайдеров {len(errors)}.")
+    except Exception as e:
+        logger.error(f"❌ Непредвиденная ошибка при доставке ресёрча: {e}", exc_info=True)
+        try:
+            await ctx.bot.send_message(chat_id, f"❌ Внутренняя ошибка при ресёрче: {type(e).__name__}")
+        except Exception as send_e:
+             logger.error(f"Не удалось отправить сообщение об ошибке ресёрча админу: {send_e}")
+
+
 async def research_perplexity(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    """Выполняет поиск и генерацию поста через Perplexity API."""
+    """Ресёрч по запросу: Perplexity и/или OpenAI (RESEARCH_PROVIDERS), черновики приходят по мере готовности."""
     if not update.message or not update.effective_user: return
-    if update.effective_user.id != config.ADMIN_ID: return
+    channel = channels.for_user(update.effective_user.id, ctx.user_data)
+    if channel is None: return
 
-    if not config.PPLX_API_KEY:
-        logger.warning("Попытка использовать Perplexity без API ключа.")
-        await ctx.bot.send_message(config.ADMIN_ID, "❗️ API-ключ Perplexity (PPLX_API_KEY) не найден.")
+    providers = research.available_providers()
+    if not providers:
+        logger.warning("Ресёрч недоступен: нет провайдеров с API ключами.")
+        await ctx.bot.send_message(update.effective_user.id, "❗️ Нет доступных провайдеров ресёрча. Проверьте RESEARCH_PROVIDERS и PPLX_API_KEY.")
         return
+    providers = research.rank_providers(ctx.bot_data.get(research.LATENCY_KEY, {}), providers)
 
     query = " ".join(ctx.args) if ctx.args else "последние тренды в области искусственного интеллекта"
-    logger.info(f"Запрос к Perplexity API по теме: '{query}'")
+    logger.info(f"Ресёрч по теме: '{query}' (провайдеры: {', '.join(providers)}, параллельно: {config.RESEARCH_FANOUT})")
     try:
-        await update.message.reply_text(f"🔬 Ищу информацию по запросу: '{query}'...")
+        titles = ", ".join(research.PROVIDER_TITLES[p] for p in providers)
+        await update.message.reply_text(f"🔬 Ищу информацию по запросу: '{query}' ({titles})...")
         await update.message.reply_chat_action(action='typing')
     except TelegramError as e:
          logger.warning(f"Не удалось отправить сообщение/chat_action в research_perplexity: {e}")
 
-    headers = {
-        "Authorization": f"Bearer {config.PPLX_API_KEY}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
-    payload = {
-        "model": "sonar", # Исправленная/актуальная модель
-        "messages": [
-            {"role": "system", "content": "You are an AI assistant writing concise and engaging Telegram posts for an IT audience."}, # Уточнили роль
-            {"role": "user", "content": PROMPT_TMPL_RESEARCH.format(query=query)}
-        ],
-        "stream": False,
-    }
-
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            res = await client.post(
-                "https://api.perplexity.ai/chat/completions",
-                headers=headers,
-                json=payload,
-            )
-            logger.debug(f"Ответ от Perplexity API: Статус {res.status_code}")
-            if res.status_code == 401:
-                 logger.error("Ошибка 401 Unauthorized от Perplexity API. Проверьте PPLX_API_KEY.")
-                 await ctx.bot.send_message(config.ADMIN_ID, "❌ Ошибка авторизации (401) Perplexity. Проверьте ключ.")
-                 return
-
-            res.raise_for_status() # Проверка на другие ошибки (включая 400 Bad Request из-за неверной модели)
-            data = res.json()
-            logger.debug(f"Получены данные от Perplexity: {str(data)[:500]}...")
-
-        if isinstance(data, dict) and "choices" in data and data["choices"] and \
-           isinstance(data["choices"][0], dict) and "message" in data["choices"][0] and \
-           isinstance(data["choices"][0]["message"], dict) and "content" in data["choices"][0]["message"]:
-
-            text = data["choices"][0]["message"]["content"].strip()
-            if text:
-                logger.info(f"Perplexity успешно сгенерировал ответ по запросу: {query}")
-                await ctx.bot.send_message(config.ADMIN_ID, f"💡 Черновик (Perplexity):\n{text}", reply_markup=INLINE_ACTION_KB)
-            else:
-                logger.warning("Perplexity API вернул пустой 'content'.")
-                await ctx.bot.send_message(config.ADMIN_ID, "❌ Perplexity API вернул пустой ответ.")
-        else:
-            error_detail = data.get('error', {}).get('message', 'Неверный формат ответа')
-            logger.error(f"Ошибка API Perplexity или неверный формат ответа: {error_detail} | Ответ: {data}")
-            await ctx.bot.send_message(config.ADMIN_ID, f"❌ Ошибка API Perplexity: {error_detail}")
-
-    except httpx.HTTPStatusError as e:
-         error_body = e.response.text[:200] if hasattr(e.response, 'text') else '(нет тела ответа)'
-         logger.error(f"❌ Ошибка HTTP {e.response.status_code} от Perplexity: {error_body}", exc_info=False)
-         # Упрощенное сообщение для пользователя
-         await ctx.bot.send_message(config.ADMIN_ID, f"❌ Ошибка HTTP {e.response.status_code} от Perplexity API.")
-    except httpx.RequestError as e:
-         logger.error(f"❌ Ошибка сети при запросе к Perplexity: {e}", exc_info=True)
-         await ctx.bot.send_message(config.ADMIN_ID, f"❌ Ошибка сети при обращении к Perplexity: {type(e).__name__}")
-    except Exception as e:
-        logger.error(f"❌ Непредвиденная ошибка в research_perplexity: {e}", exc_info=True)
-        try:
-            await ctx.bot.send_message(config.ADMIN_ID, f"❌ Внутренняя ошибка при ресёрче: {type(e).__name__}")
-        except Exception as send_e:
-             logger.error(f"Не удалось отправить сообщение об ошибке research_perplexity админу: {send_e}")
+    # Доставка идёт в фоне, чтобы медленный провайдер не задерживал обработку других команд
+    ctx.application.create_task(_deliver_research(ctx, query, providers, channel, update.effective_user.id), update=update)
 
 
 # --- Команда /schedule (и для кнопки "⚙️ Расписание") ---
 async def show_schedule(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Показывает текущее расписание автопостинга (если есть)."""
     if not update.message or not update.effective_user: return
-    if update.effective_user.id != config.ADMIN_ID: return
+    channel = channels.for_user(update.effective_user.id, ctx.user_data)
+    if channel is None: return
 
-    schedule_text = "⚙️ **Статус автопостинга:**\n\n"
+    schedule_text = f"{channels.label(channel)}⚙️ **Статус автопостинга:**\n\n"
     if ctx.job_queue:
-        jobs = ctx.job_queue.get_jobs_by_name(config.DAILY_AUTO_POST_JOB)
+        jobs = await channel_jobs(ctx.application, channel) # Все слоты канала одним запросом к таблице задач
         if jobs:
-            job = jobs[0]
-            trigger = job.trigger
-            next_run_time = job.next_t
-
-            run_hour = getattr(trigger, 'hour', None)
-            run_minute = getattr(trigger, 'minute', 0)
-
-            if run_hour is not None:
-                try:
-                    scheduled_time_str = f"{int(run_hour):02d}:{int(run_minute):02d}"
-                    schedule_text += f"✅ Автопостинг **включен**.\n"
-                    schedule_text += f"🕒 Публикация настроена на **{scheduled_time_str} UTC** ежедневно.\n\n"
-                except (ValueError, TypeError):
-                    logger.error(f"Не удалось отформатировать время из триггера: hour={run_hour}, minute={run_minute}")
-                    schedule_text += f"✅ Автопостинг **включен**, но не удалось определить время настройки.\n"
-                if next_run_time:
-                     schedule_text += f"▶️ Следующий запуск: {next_run_time.strftime('%Y-%m-%d %H:%M:%S %Z')}\n\n"
-                else:
-                     schedule_text += f"▶️ Время следующего запуска пока не определено.\n\n"
-            else:
-                schedule_text += f"✅ Автопостинг **включен**, но не удалось определить время настройки из триггера.\n"
-                if next_run_time:
-                    schedule_text += f"🕒 Следующий запуск: {next_run_time.strftime('%Y-%m-%d %H:%M:%S %Z')}\n\n"
-                else:
-                    schedule_text += f"🕒 Время следующего запуска пока не определено.\n\n"
+            schedule_text += f"✅ Автопостинг **включен**.\n"
+            schedule_text += f"{format_slots(jobs)}\n\n"
+            runs = upcoming_runs(jobs, datetime.now(timezone.utc))
+            if runs:
+                schedule_text += "▶️ Ближайшие запуски:\n" + "\n".join(f"• {run:%Y-%m-%d %H:%M} UTC" for run in runs) + "\n\n"
+            missed = await missed_runs(ctx.application, channel)
+            if missed:
+                schedule_text += "⏰ Пропущенные и неудачные запуски (7 дней):\n"
+                for run in missed[:5]:
+                    slot = datetime.fromtimestamp(run["scheduled_for"], timezone.utc)
+                    ran_at = datetime.fromtimestamp(run["ran_at"], timezone.utc)
+                    if run["status"] == "recovered":
+                        schedule_text += f"• {slot:%Y-%m-%d %H:%M} UTC - опубликован в {ran_at:%H:%M}\n"
+                    elif run["status"] == "failed":
+                        schedule_text += f"• {slot:%Y-%m-%d %H:%M} UTC - не опубликован из-за ошибки ({ran_at:%H:%M})\n"
+                    else:
+                        schedule_text += f"• {slot:%Y-%m-%d %H:%M} UTC - не досылался (вне окна)\n"
+                schedule_text += "\n"
             schedule_text += f"Нажмите [🛑 Остановить автопост], чтобы выключить."
         else:
             schedule_text += f"❌ Автопостинг **выключен**.\n\n"
             schedule_text += f"Нажмите [🕒 Авто по лучшему], чтобы включить."
     else:
         schedule_text += "⚠️ Планировщик задач недоступен."
+    if config.LEADER_ELECTION:
+        schedule_text += f"\n\n👑 Задачи выполняет реплика: `{await leader.current_leader(ctx.application) or 'нет лидера'}`"
 
     try:
         await update.message.reply_text(schedule_text, parse_mode=ParseMode.MARKDOWN)
@@ -604,29 +653,83 @@ async def show_schedule(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 async def stop_auto_post(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Останавливает запланированный автопостинг."""
     if not update.message or not update.effective_user: return
-    if update.effective_user.id != config.ADMIN_ID: return
+    channel = channels.for_user(update.effective_user.id, ctx.user_data)
+    if channel is None: return
 
     if not ctx.job_queue:
         logger.error("JobQueue не доступен для stop_auto_post.")
         await update.message.reply_text("❌ Ошибка: Планировщик задач недоступен.")
         return
 
-    jobs = ctx.job_queue.get_jobs_by_name(config.DAILY_AUTO_POST_JOB)
-    if jobs:
-        removed_count = 0
-        for job in jobs:
-            job.schedule_removal()
-            removed_count += 1
-        logger.info(f"Удалено {removed_count} задач '{config.DAILY_AUTO_POST_JOB}' по команде админа.")
-        await update.message.reply_text("🛑 Ежедневный автопостинг остановлен.")
+    removed_count = await unschedule_channel(ctx.application, channel)
+    if removed_count:
+        logger.info(f"Удалено {removed_count} задач автопостинга канала {channel.key} по команде админа.")
+        await update.message.reply_text(f"{channels.label(channel)}🛑 Автопостинг остановлен.")
     else:
         logger.info("Задачи автопостинга для остановки не найдены.")
         await update.message.reply_text("ℹ️ Автопостинг не был запущен.")
 
 
+# --- Команда /channel: активный канал админа (если он управляет несколькими) ---
+async def select_channel(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Показывает каналы админа или делает активным указанный: /channel <ключ>."""
+    if not update.message or not update.effective_user: return
+    user_id = update.effective_user.id
+    channel = channels.for_user(user_id, ctx.user_data)
+    if channel is None: return
+
+    if ctx.args:
+        key = ctx.args[0].strip()
+        selected = channels.select(user_id, ctx.user_data, key)
+        if selected is None:
+            text = f"❌ Канал '{key}' не найден среди ваших каналов."
+        else:
+            logger.info(f"Админ {user_id} переключился на канал {selected.key} ({selected.chat_id}).")
+            if config.LEADER_ELECTION:
+                # Другие реплики перечитывают user_data перед каждым обновлением - записываем выбор сразу
+                await ctx.application.update_persistence()
+            text = f"✅ Активный канал: {selected.key} ({selected.chat_id}). Команды и кнопки меню работают с ним."
+    else:
+        lines = ["📡 Ваши каналы:"]
+        for owned in channels.admin_channels(user_id):
+            lines.append(f"{'▶️' if owned is channel else '▫️'} {owned.key} ({owned.chat_id})")
+        lines.append("\nСменить активный канал: /channel <ключ>")
+        text = "\n".join(lines)
+
+    try:
+        await update.message.reply_text(text, parse_mode=None)
+    except (TelegramError, Forbidden) as e:
+         logger.error(f"Не удалось отправить сообщение /channel админу: {e}")
+
+
+# --- Команда /perf: время операций и память процесса ---
+async def show_perf(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Показывает p50/p95 по хэндлерам, задачам и вызовам внешних сервисов (последние PERF_WINDOW замеров) и RSS процесса."""
+    if not update.message or not update.effective_user: return
+    if not channels.is_admin(update.effective_user.id): return
+
+    rss, peak = perf.rss_bytes()
+    uptime_min = perf.uptime() / 60
+    lines = [f"⏱ Время операций (последние {config.PERF_WINDOW} замеров на операцию), работает {uptime_min:.0f} мин.",
+             f"💾 RSS{' (пик)' if peak else ''}: {rss / 2**20:.0f} МБ", ""]
+    rows = perf.snapshot()
+    if rows:
+        lines.append(f"{'операция':30s} {'p50, мс':>8s} {'p95, мс':>8s} {'n':>6s} {'ошибок':>6s}")
+        for row in rows:
+            lines.append(f"{row['name'][:30]:30s} {row['p50'] * 1000:8.0f} {row['p95'] * 1000:8.0f} {row['total']:6d} {row['errors']:6d}")
+    else:
+        lines.append("Замеров пока нет.")
+
+    try:
+        # Моноширинный блок: таблица выравнивается, имена операций с "_" не ломают разметку
+        await update.message.reply_text("```\n" + "\n".join(lines) + "\n```", parse_mode=ParseMode.MARKDOWN)
+    except (TelegramError, Forbidden) as e:
+         logger.error(f"Не удалось отправить сообщение /perf админу: {e}")
+
+
 # --- Сборка хэндлеров команд ---
 start_handler = CommandHandler("start", start)
-idea_handler = CommandHandler("idea", generate_idea)
+idea_handler = CommandHandler("idea", generate_idea) # /idea [тема]
 news_handler = CommandHandler("news", generate_news_post)
 stats_handler = CommandHandler("stats", show_stats)
 auto_best_handler = CommandHandler("auto_best", set_auto_post_best_time)
@@ -634,10 +737,15 @@ weekly_report_handler = CommandHandler("weekly", weekly_report)
 research_handler = CommandHandler("research", research_perplexity)
 schedule_handler = CommandHandler("schedule", show_schedule)
 stop_auto_handler = CommandHandler("stop_auto", stop_auto_post)
+channel_handler = CommandHandler("channel", select_channel) # /channel [ключ]
+perf_handler = CommandHandler("perf", show_perf)
 
 # Список всех хэндлеров команд для удобного добавления в bot.py
 command_handlers = [
     start_handler, idea_handler, news_handler, stats_handler,
     auto_best_handler, weekly_report_handler, research_handler,
-    schedule_handler, stop_auto_handler
+    schedule_handler, stop_auto_handler, channel_handler, perf_handler
 ]
+# Время каждой команды для /perf (операция "/команда")
+for _handler in command_handlers:
+    _handler.callback = perf.timed(f"/{next(iter(_handler.commands))}")(_handler.callback)
@@ -1,111 +1,564 @@
+import asyncio
+import functools
 import logging
+import warnings
+from datetime import datetime, timedelta, time as dtime, timezone
 from telegram.ext import ContextTypes
+from telegram.warnings import PTBUserWarning
 from telegram.error import TelegramError
 # Импортируем необходимые функции из других модулей
-from .. import config
+from .. import channels, config, drafts, leader, perf, send_queue
+from ..channels import Channel
+from ..concurrency import limited, GENERATION
 from ..openai_client import get_async_openai_client
-from ..post_logger import read_top_posts, log_post
+from ..post_logger import log_post
+from ..retrieval import build_posts_context
 from ..prompts import PROMPT_TMPL_AUTO # Используем авто-промпт (сейчас = idea)
 
 logger = logging.getLogger(__name__)
 
-async def auto_post_job(context: ContextTypes.DEFAULT_TYPE):
+PREGEN_SUFFIX = "_pregen" # Задача заранее генерирует пост для слота автопостинга с тем же именем без суффикса
+PREGEN_KIND = "auto_pregen"
+
+
+def job_channel(data: dict | None) -> Channel:
+    """Канал задачи по job.data ("channel" - ключ, у старых задач только "channel_id"); иначе канал по умолчанию."""
+    data = data or {}
+    return channels.get(data.get("channel")) or channels.by_chat_id(data.get("channel_id")) or channels.default()
+
+
+async def _notify_admins(context: ContextTypes.DEFAULT_TYPE, channel: Channel, text: str):
+    """Уведомление всем админам канала (ошибка отправки одному не мешает остальным)."""
+    for admin_id in channel.admin_ids:
+        try:
+            await context.bot.send_message(chat_id=admin_id, text=f"{channels.label(channel)}{text}")
+        except TelegramError as e:
+            logger.warning(f"Не удалось уведомить админа {admin_id} канала {channel.key}: {e}")
+
+
+def leader_only(func):
+    """
+    Декоратор задачи планировщика: выполняется только на реплике-лидере и только один раз на слот.
+    При LEADER_ELECTION запуск отмечается в общей базе (ключ - имя задачи и минута запуска),
+    так что при смене лидера в момент срабатывания вторая реплика его пропустит.
+    Если задача вернула False (пост не опубликован), слот записывается в историю как "failed".
+    """
+    @functools.wraps(func)
+    async def wrapper(context: ContextTypes.DEFAULT_TYPE):
+        job = context.job
+        if not leader.is_leader():
+            logger.info(f"Задача '{job.name}' пропущена: реплика {leader.REPLICA_ID} не лидер.")
+            return
+        store = _job_store(context.application)
+        scheduled_for = job_slot(job)
+        if config.LEADER_ELECTION and store is not None:
+            slot = f"{job.name}@{scheduled_for:%Y-%m-%dT%H:%M}"
+            try:
+                claimed = await store.claim_run(slot, leader.REPLICA_ID)
+            except Exception as e:
+                logger.error(f"❌ Не удалось отметить запуск '{slot}', задача пропущена: {e}")
+                return
+            if not claimed:
+                logger.info(f"Запуск '{slot}' уже выполнен другой репликой, пропуск.")
+                return
+        result = await func(context)
+        if store is not None and job.name in _synced:
+            # История слотов: по ней после перезапуска видно, какой запуск пропущен
+            if result is False:
+                status = "failed"
+            else:
+                status = "recovered" if (job.data or {}).get("catchup_for") else "ok"
+            try:
+                await store.record_job_run(job.name, scheduled_for.timestamp(), status)
+            except Exception as e:
+                logger.warning(f"Не удалось записать запуск '{job.name}' в историю: {e}")
+        return result
+    return wrapper
+
+
+def job_slot(job) -> datetime:
+    """
+    Слот запуска (время по расписанию, UTC): для досылки - пропущенный слот из job.data["catchup_for"],
+    для задач с известным расписанием - последнее срабатывание по нему (не сдвигается, если задача запустилась с опозданием).
+    """
+    now = datetime.now(timezone.utc)
+    catchup_for = (job.data or {}).get("catchup_for") if isinstance(job.data, dict) else None
+    if catchup_for:
+        return datetime.fromisoformat(catchup_for)
+    spec = _synced.get(job.name)
+    return (previous_run(spec, now) if spec else None) or now.replace(second=0, microsecond=0)
+
+
+@limited(GENERATION)
+async def _generate_auto_post(channel: Channel) -> str:
+    """
+    Генерирует текст автопоста (аналогично /idea) по постам канала. Ошибки OpenAI пробрасываются.
+    Слот генерации занимает только сама генерация: публикация готового поста его не ждёт.
+    """
+    posts_context = await asyncio.to_thread(build_posts_context, None, 5, channel)
+    prompt = PROMPT_TMPL_AUTO.format(posts=posts_context, topic="")
+    # Только основная модель для автопоста, чтобы не усложнять
+    logger.info(f"Автопост: Запрос к OpenAI (модель: {config.MODEL})...")
+    with perf.timer("openai.chat"):
+        resp = await get_async_openai_client().chat.completions.create(
+            model=config.MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=400,
+            temperature=0.75,
+        )
+    draft = (resp.choices[0].message.content or "").strip()
+    logger.info(f"Автопост: Идея успешно сгенерирована моделью {config.MODEL}.")
+    return draft
+
+
+def _pregen_draft_id(slot_job_name: str, slot_date) -> str:
+    """Id заранее сгенерированного поста: имя задачи слота и дата публикации (UTC)."""
+    return f"{slot_job_name}@{slot_date:%Y-%m-%d}"
+
+
+def _pregen_time(post_time: dtime) -> dtime:
+    """Время запуска предварительной генерации: за AUTO_POST_PREGEN_LEAD_MINUTES до слота (через полночь - накануне)."""
+    slot = datetime.combine(datetime(2000, 1, 2), post_time)
+    return (slot - timedelta(minutes=config.AUTO_POST_PREGEN_LEAD_MINUTES)).timetz()
+
+
+@leader_only
+@perf.timed("pregen_auto_post_job")
+async def pregen_auto_post_job(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Генерирует пост заранее, за AUTO_POST_PREGEN_LEAD_MINUTES до слота, и сохраняет его в хранилище черновиков
+    (общем для реплик). Задача слота только публикует готовый текст. При ошибке слот сгенерирует пост сам.
+    """
+    job = context.job
+    channel = job_channel(job.data)
+    slot_name = job.name.removesuffix(PREGEN_SUFFIX)
+    hour, minute = (int(part) for part in job.data["slot"].split(":"))
+    now = datetime.now(timezone.utc)
+    slot = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if slot < now:
+        slot += timedelta(days=1) # Слот после полуночи
+    draft_id = _pregen_draft_id(slot_name, slot)
+    if await asyncio.to_thread(drafts.get, draft_id) is not None:
+        logger.info(f"Пост для слота {draft_id} уже подготовлен.")
+        return
+    try:
+        text = await _generate_auto_post(channel)
+    except Exception as e:
+        logger.warning(f"Автопост: предварительная генерация для {draft_id} не удалась, пост будет сгенерирован в момент публикации: {e}")
+        return
+    if text:
+        await asyncio.to_thread(drafts.save, text, PREGEN_KIND, {"channel": channel.key, "slot": slot.isoformat()}, draft_id=draft_id)
+        logger.info(f"📝 Автопост для слота {slot:%Y-%m-%d %H:%M} UTC канала {channel.key} подготовлен заранее.")
+
+
+@leader_only
+@perf.timed("auto_post_job")
+async def auto_post_job(context: ContextTypes.DEFAULT_TYPE) -> bool:
     """
     Функция, выполняемая планировщиком для автоматической публикации поста.
-    Генерирует идею и публикует её в канал.
+    Публикует пост, подготовленный pregen_auto_post_job, а если его нет - генерирует идею на месте.
+    Публикация идёт в канал задачи (job.data["channel"]). Возвращает True, если пост опубликован.
     """
     job = context.job
     logger.info(f"🚀 Запуск задачи автопостинга: {job.name}")
 
     try:
-        # 1. Получаем данные из job.data (если передавали)
-        # channel_id = job.data.get("channel_id", config.CHANNEL_ID)
-        # Можно использовать config.CHANNEL_ID напрямую, если он не меняется
-        channel_id = config.CHANNEL_ID
-
-        # 2. Генерируем контент (аналогично /idea)
-        top_posts_df = read_top_posts(5)
-        posts_context = top_posts_df[['text', 'reactions']].to_string(index=False) if not top_posts_df.empty else "(Нет данных о прошлых постах)"
-        prompt = PROMPT_TMPL_AUTO.format(posts=posts_context)
-
-        openai_client = get_async_openai_client()
-        draft = None
-        last_err = None
-        used_model = config.MODEL
-
-        # Попытка генерации (только основная модель для автопоста, чтобы не усложнять)
-        try:
-            logger.info(f"Автопост: Запрос к OpenAI (модель: {config.MODEL})...")
-            resp = await openai_client.chat.completions.create(
-                model=config.MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=400,
-                temperature=0.75,
-            )
-            draft = resp.choices[0].message.content.strip()
-            logger.info(f"Автопост: Идея успешно сгенерирована моделью {config.MODEL}.")
-        except Exception as e:
-            last_err = e
-            logger.error(f"❌ Автопост: Ошибка генерации OpenAI ({config.MODEL}): {e}")
-            # Можно попробовать резервную модель или просто пропустить этот запуск
-            # Пока пропустим, чтобы не спамить ошибками
-            await context.bot.send_message(
-                 chat_id=config.ADMIN_ID, # Уведомляем админа об ошибке
-                 text=f"⚠️ Автопост: Не удалось сгенерировать контент.\nОшибка: {e}"
-            )
-            return # Прерываем выполнение задачи
+        # 1. Канал задачи из job.data
+        channel = job_channel(job.data)
+        channel_id = channel.chat_id
+
+        # 2. Готовый пост из предварительной генерации или генерация по постам этого канала
+        draft_id = _pregen_draft_id(job.name, job_slot(job))
+        pregenerated = await asyncio.to_thread(drafts.get, draft_id)
+        if pregenerated is not None:
+            draft = pregenerated["text"]
+            logger.info(f"Автопост: используется пост, подготовленный заранее ({draft_id}).")
+        else:
+            try:
+                draft = await _generate_auto_post(channel)
+            except Exception as e:
+                logger.error(f"❌ Автопост: Ошибка генерации OpenAI ({config.MODEL}): {e}")
+                # Пропускаем этот запуск, чтобы не спамить ошибками
+                await _notify_admins(context, channel, f"⚠️ Автопост: Не удалось сгенерировать контент.\nОшибка: {e}")
+                return False # Прерываем выполнение задачи
 
         # 3. Публикуем сгенерированный пост в канал
         if draft:
             try:
-                sent_message = await context.bot.send_message(
-                    chat_id=channel_id,
-                    text=draft
+                sent_message = await send_queue.send(
+                    lambda: context.bot.send_message(chat_id=channel_id, text=draft),
+                    channel_id, send_queue.CHANNEL
                 )
                 logger.info(f"✅ Автопост успешно опубликован в канал {channel_id}, message_id={sent_message.message_id}")
+                if pregenerated is not None:
+                    await asyncio.to_thread(drafts.delete, draft_id)
 
                 # 4. Логируем опубликованный пост
                 try:
-                    log_post(
+                    await asyncio.to_thread(
+                        log_post,
                         message_id=sent_message.message_id,
                         text=draft,
-                        timestamp=sent_message.date
+                        timestamp=sent_message.date,
+                        channel=channel
                     )
                 except Exception as log_e:
                     logger.error(f"❌ Автопост: Ошибка логирования поста {sent_message.message_id}: {log_e}")
                     # Отправляем уведомление админу о проблеме с логированием
-                    await context.bot.send_message(
-                         chat_id=config.ADMIN_ID,
-                         text=f"⚠️ Автопост опубликован (ID: {sent_message.message_id}), но произошла ошибка при его логировании: {log_e}"
+                    await _notify_admins(
+                        context, channel,
+                        f"⚠️ Автопост опубликован (ID: {sent_message.message_id}), но произошла ошибка при его логировании: {log_e}"
                     )
+                return True
 
             except TelegramError as e:
                 logger.error(f"❌ Автопост: Не удалось опубликовать пост в канал {channel_id}: {e}", exc_info=True)
-                await context.bot.send_message(
-                    chat_id=config.ADMIN_ID,
-                    text=f"❌ Автопост: Не удалось опубликовать сгенерированный пост в канал {channel_id}.\nОшибка: {e}"
-                )
+                await _notify_admins(context, channel, f"❌ Автопост: Не удалось опубликовать сгенерированный пост в канал {channel_id}.\nОшибка: {e}")
+                return False
             except Exception as e:
                  logger.error(f"❌ Автопост: Непредвиденная ошибка при публикации: {e}", exc_info=True)
-                 await context.bot.send_message(
-                    chat_id=config.ADMIN_ID,
-                    text=f"❌ Автопост: Непредвиденная ошибка при публикации: {e}"
-                )
+                 await _notify_admins(context, channel, f"❌ Автопост: Непредвиденная ошибка при публикации: {e}")
+                 return False
         else:
             # Эта ветка не должна достигаться из-за return выше, но на всякий случай
             logger.error("❌ Автопост: Сгенерирован пустой черновик, публикация отменена.")
-            await context.bot.send_message(
-                chat_id=config.ADMIN_ID,
-                text="⚠️ Автопост: OpenAI вернул пустой результат, публикация отменена."
-            )
+            await _notify_admins(context, channel, "⚠️ Автопост: OpenAI вернул пустой результат, публикация отменена.")
+            return False
 
     except Exception as e:
         logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА в задаче автопостинга {job.name}: {e}", exc_info=True)
         # Отправляем уведомление админу о критической ошибке в самой задаче
         try:
-            await context.bot.send_message(
-                chat_id=config.ADMIN_ID,
-                text=f"🚨 КРИТИЧЕСКАЯ ОШИБКА в задаче автопостинга! Задача могла быть прервана.\nОшибка: {e}"
-            )
+            await _notify_admins(context, job_channel(job.data), f"🚨 КРИТИЧЕСКАЯ ОШИБКА в задаче автопостинга! Задача могла быть прервана.\nОшибка: {e}")
         except Exception as send_e:
             logger.error(f"Не удалось даже отправить уведомление об ошибке админу: {send_e}")
+        return False
+
+
+# --- Сохранение задач планировщика между перезапусками ---
+# PTB не сохраняет JobQueue; описания задач хранятся в SQLite persistence (таблица jobs).
+# При LEADER_ELECTION таблица общая для всех реплик, а в JobQueue задачи есть только у лидера:
+# он периодически сверяет их с таблицей, поэтому изменения, сделанные командами на любой реплике, доходят до него.
+JOB_CALLBACKS = {
+    "auto_post_job": auto_post_job,
+}
+# Сопутствующие задачи: ставятся и снимаются вместе с основной, в таблице задач не хранятся
+PREGEN_CALLBACKS = {
+    auto_post_job: pregen_auto_post_job,
+}
+_synced: dict[str, dict] = {} # Задачи, поставленные в локальный JobQueue: имя -> spec ({"time": "HH:MM", "days": [...]})
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс") # Дни в spec: 0 - понедельник, как datetime.weekday()
+
+
+def _job_store(application):
+    """Persistence с поддержкой задач (SQLitePersistence) или None."""
+    persistence = application.persistence
+    return persistence if persistence is not None and hasattr(persistence, "save_job") else None
+
+
+def _daily_spec(post_time: dtime, days: list[int] | None = None) -> dict:
+    spec = {"time": post_time.strftime("%H:%M")}
+    if days is not None and len(set(days)) < 7:
+        spec["days"] = sorted(set(days))
+    return spec
+
+
+# PTB предупреждает о смене нумерации дней при каждом run_daily с days; перевод номеров сделан в _ptb_days
+warnings.filterwarnings("ignore", message="Prior to v20.0 the `days` parameter", category=PTBUserWarning)
+
+
+def _ptb_days(days: list[int] | None) -> tuple[int, ...]:
+    """Дни недели для run_daily: в PTB 0 - воскресенье."""
+    return tuple(range(7)) if days is None else tuple(sorted((day + 1) % 7 for day in days))
+
+
+def _remove_local(application, name: str) -> int:
+    """Снимает задачи с именем name (и их предварительную генерацию) из локального JobQueue, возвращает их число."""
+    if not application.job_queue:
+        return 0
+    jobs = application.job_queue.get_jobs_by_name(name)
+    for job in jobs + application.job_queue.get_jobs_by_name(name + PREGEN_SUFFIX):
+        job.schedule_removal()
+    _synced.pop(name, None)
+    return len(jobs)
+
+
+def _run_daily_local(application, name: str, callback, post_time: dtime, data: dict | None, days: list[int] | None = None):
+    application.job_queue.run_daily(
+        callback=callback, time=post_time, days=_ptb_days(days), name=name, data=data,
+        # Срабатывание, опоздавшее из-за занятого event loop, выполняется, а не отбрасывается через секунду (умолчание APScheduler)
+        job_kwargs={"misfire_grace_time": max(config.AUTO_POST_MISFIRE_GRACE_MINUTES, 1) * 60, "coalesce": True},
+    )
+    _synced[name] = _daily_spec(post_time, days)
+    pregen = PREGEN_CALLBACKS.get(callback)
+    if pregen is not None and config.AUTO_POST_PREGEN_LEAD_MINUTES > 0:
+        pregen_time = _pregen_time(post_time)
+        if days is not None and pregen_time > post_time:
+            days = [(day - 1) % 7 for day in days] # Генерация накануне: слот сразу после полуночи
+        application.job_queue.run_daily(
+            callback=pregen, time=pregen_time, days=_ptb_days(days), name=name + PREGEN_SUFFIX,
+            data={**(data or {}), "slot": post_time.strftime("%H:%M")},
+        )
+
+
+async def schedule_daily_job(application, name: str, callback, post_time: dtime, data: dict | None = None,
+                             days: list[int] | None = None) -> bool:
+    """
+    Ставит ежедневную задачу (заменяя прежнюю с тем же именем) и запоминает её для восстановления после перезапуска.
+    days - дни недели (0 - понедельник), по умолчанию каждый день.
+    Локально задача ставится только на лидере; возвращает True, если она запланирована в этом процессе.
+    """
+    removed = _remove_local(application, name)
+    if removed:
+        logger.info(f"Удалено {removed} предыдущих задач '{name}'.")
+    scheduled = leader.is_leader()
+    if scheduled:
+        _run_daily_local(application, name, callback, post_time, data, days)
+    store = _job_store(application)
+    if store is not None:
+        try:
+            await store.save_job(name, callback.__name__, "daily", _daily_spec(post_time, days), data)
+        except Exception as e:
+            logger.error(f"❌ Не удалось сохранить задачу '{name}': {e}", exc_info=True)
+    return scheduled
+
+
+async def unschedule_job(application, name: str) -> bool:
+    """Снимает задачу локально и удаляет её сохранённое описание. True, если задача была (здесь или в таблице)."""
+    existed = _remove_local(application, name) > 0
+    store = _job_store(application)
+    if store is not None:
+        try:
+            existed = existed or await load_saved_job(application, name) is not None
+            await store.delete_job(name)
+        except Exception as e:
+            logger.error(f"❌ Не удалось удалить сохранённую задачу '{name}': {e}", exc_info=True)
+    return existed
+
+
+async def load_saved_job(application, name: str) -> dict | None:
+    """Сохранённое описание задачи (для реплик, у которых её нет в JobQueue)."""
+    store = _job_store(application)
+    if store is None:
+        return None
+    return next((saved for saved in await store.load_jobs(name) if saved["name"] == name), None)
+
+
+# --- Слоты автопостинга канала: задачи "<job_name>@HH:MM" с днями недели ---
+def slot_job_name(channel: Channel, post_time: str) -> str:
+    return f"{channel.job_name}@{post_time}"
+
+
+async def channel_jobs(application, channel: Channel) -> list[dict]:
+    """
+    Задачи автопостинга канала [{"name", "spec", "data"}] одним запросом к таблице задач
+    (включая прежнюю единственную задачу channel.job_name). Без таблицы - из локального JobQueue.
+    """
+    store = _job_store(application)
+    if store is not None:
+        return [saved for saved in await store.load_jobs(channel.job_name) if saved["callback"] == auto_post_job.__name__]
+    result = []
+    for name, spec in _synced.items():
+        if name == channel.job_name or name.startswith(f"{channel.job_name}@"):
+            local = application.job_queue.get_jobs_by_name(name) if application.job_queue else ()
+            result.append({"name": name, "spec": spec, "data": local[0].data if local else None})
+    return result
+
+
+async def apply_auto_post_slots(application, channel: Channel, slots: dict[int, list[int]], data: dict) -> tuple[dict, bool]:
+    """
+    Приводит задачи автопостинга канала к слотам {день недели: [час, ...]}: одна задача на час с набором дней.
+    Меняются только отличающиеся задачи: совпадающие не трогаются (их время следующего запуска не сбрасывается).
+    Возвращает (счётчики added/changed/removed/kept, запланированы ли задачи в этом процессе).
+    """
+    wanted: dict[str, dict] = {}
+    for day, hours in slots.items():
+        for hour in hours:
+            post_time = f"{hour:02d}:00"
+            wanted.setdefault(slot_job_name(channel, post_time), {"time": post_time, "days": []})["days"].append(day)
+    current = {saved["name"]: saved["spec"] for saved in await channel_jobs(application, channel)}
+    changes = {"added": 0, "changed": 0, "removed": 0, "kept": 0}
+    for name in current.keys() - wanted.keys():
+        await unschedule_job(application, name)
+        changes["removed"] += 1
+    for name, spec in wanted.items():
+        hour, minute = (int(part) for part in spec["time"].split(":"))
+        post_time = dtime(hour=hour, minute=minute, tzinfo=timezone.utc)
+        if current.get(name) == _daily_spec(post_time, spec["days"]):
+            changes["kept"] += 1
+            continue
+        changes["changed" if name in current else "added"] += 1
+        await schedule_daily_job(application, name, auto_post_job, post_time, data, spec["days"])
+    logger.info(f"Слоты автопостинга канала {channel.key}: {changes}")
+    return changes, leader.is_leader()
+
+
+def previous_run(spec: dict, now: datetime) -> datetime | None:
+    """Последнее срабатывание по spec не позже now (за неделю назад) или None."""
+    hour, minute = (int(part) for part in spec["time"].split(":"))
+    days = spec.get("days", range(7))
+    for offset in range(8):
+        run = (now - timedelta(days=offset)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if run <= now and run.weekday() in days:
+            return run
+    return None
+
+
+def upcoming_runs(jobs: list[dict], now: datetime, limit: int = 5) -> list[datetime]:
+    """Ближайшие запуски задач по их spec (на неделю вперёд), по возрастанию."""
+    runs = []
+    for saved in jobs:
+        hour, minute = (int(part) for part in saved["spec"]["time"].split(":"))
+        days = saved["spec"].get("days", range(7))
+        for offset in range(8):
+            run = (now + timedelta(days=offset)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if run > now and run.weekday() in days:
+                runs.append(run)
+    return sorted(runs)[:limit]
+
+
+def format_slots(jobs: list[dict]) -> str:
+    """Строки "🕒 10:00 UTC - Пн, Ср, Пт" по времени слотов."""
+    lines = []
+    for saved in sorted(jobs, key=lambda saved: saved["spec"]["time"]):
+        days = saved["spec"].get("days")
+        days_text = "ежедневно" if days is None else ", ".join(WEEKDAYS[day] for day in days)
+        lines.append(f"🕒 **{saved['spec']['time']} UTC** - {days_text}")
+    return "\n".join(lines)
+
+
+async def missed_runs(application, channel: Channel, days: int = 7) -> list[dict]:
+    """Слоты автопостинга канала за days дней, пропущенные во время простоя (досланные и не досланные) или не опубликованные из-за ошибки."""
+    store = _job_store(application)
+    if store is None:
+        return []
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).timestamp()
+    return await store.job_history(channel.job_name, since, statuses=("recovered", "missed", "failed"))
+
+
+async def unschedule_channel(application, channel: Channel) -> int:
+    """Снимает все задачи автопостинга канала, возвращает их число."""
+    jobs = await channel_jobs(application, channel)
+    for saved in jobs:
+        await unschedule_job(application, saved["name"])
+    return len(jobs)
+
+
+@leader_only
+async def reschedule_auto_post_job(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Периодически пересчитывает слоты автопостинга каналов с включённым автопостингом
+    и меняет только те задачи, чьи часы или дни сдвинулись.
+    """
+    from ..utils import get_best_posting_slots # Локальный импорт: utils тянет matplotlib
+    application = context.application
+    for channel in channels.all_channels():
+        jobs = await channel_jobs(application, channel)
+        if not jobs:
+            continue
+        try:
+            async with channel.analytics_lock:
+                slots = await asyncio.to_thread(get_best_posting_slots, channel, config.AUTO_POST_SLOTS_PER_DAY)
+            changes, _ = await apply_auto_post_slots(application, channel, slots, jobs[0]["data"] or {"channel": channel.key})
+        except Exception as e:
+            logger.error(f"❌ Ошибка пересчёта слотов автопостинга канала {channel.key}: {e}", exc_info=True)
+            continue
+        if changes["added"] or changes["changed"] or changes["removed"]:
+            await _notify_admins(context, channel, "🔄 Слоты автопостинга обновлены по свежей статистике:\n"
+                                 + format_slots(await channel_jobs(application, channel)).replace("**", ""))
+
+
+async def sync_jobs(application):
+    """
+    Приводит JobQueue к таблице задач: ставит недостающие, переставляет изменившиеся, снимает удалённые.
+    На старте восстанавливает задачи после перезапуска, при LEADER_ELECTION вызывается лидером периодически.
+    """
+    store = _job_store(application)
+    if store is None or not application.job_queue or not leader.is_leader():
+        return
+    saved_jobs = await store.load_jobs()
+    catchup = _CatchUp(store, await store.last_job_runs(), await store.job_history_since())
+    wanted = set()
+    for saved in saved_jobs:
+        callback = JOB_CALLBACKS.get(saved["callback"])
+        if callback is None or saved["kind"] != "daily":
+            logger.warning(f"Пропуск сохранённой задачи '{saved['name']}': неизвестный тип или функция ({saved['kind']}, {saved['callback']}).")
+            continue
+        wanted.add(saved["name"])
+        spec = saved["spec"]
+        local = application.job_queue.get_jobs_by_name(saved["name"])
+        if local and _synced.get(saved["name"]) == spec:
+            continue
+        if local and saved["name"] not in _synced:
+            _synced[saved["name"]] = spec # Поставлена до сверки (например, сразу командой) - не трогаем
+            continue
+        _remove_local(application, saved["name"])
+        hour, minute = (int(part) for part in spec["time"].split(":"))
+        post_time = dtime(hour=hour, minute=minute, tzinfo=timezone.utc)
+        _run_daily_local(application, saved["name"], callback, post_time, saved["data"], spec.get("days"))
+        logger.info(f"♻️ Восстановлена задача '{saved['name']}' ({spec['time']} UTC).")
+        await catchup.check(application, saved, callback)
+    for name in [name for name in _synced if name not in wanted]:
+        _remove_local(application, name)
+        logger.info(f"Задача '{name}' удалена из общей таблицы задач, снята с планировщика.")
+
+
+class _CatchUp:
+    """
+    Досылка слота, пропущенного, пока задача не была запланирована ни в одном процессе (простой, перезапуск).
+    Политика: только последний пропущенный слот и только в пределах AUTO_POST_MISFIRE_GRACE_MINUTES;
+    более старый слот отмечается в истории как пропущенный. Слот считается пропущенным, если он позже
+    последней отметки задачи в job_history (или, без отметок, позже сохранения задачи и начала ведения истории).
+    """
+
+    def __init__(self, store, last_runs: dict[str, float], history_since: float):
+        self.store = store
+        self.last_runs = last_runs
+        self.history_since = history_since
+
+    async def check(self, application, saved: dict, callback):
+        now = datetime.now(timezone.utc)
+        missed = previous_run(saved["spec"], now)
+        if missed is None:
+            return
+        known = max(self.last_runs.get(saved["name"], 0), saved["updated_at"], self.history_since)
+        if missed.timestamp() <= known:
+            return
+        late = now - missed
+        if config.AUTO_POST_MISFIRE_GRACE_MINUTES <= 0 or late > timedelta(minutes=config.AUTO_POST_MISFIRE_GRACE_MINUTES):
+            logger.warning(f"⏭ Слот {missed:%Y-%m-%d %H:%M} UTC задачи '{saved['name']}' пропущен во время простоя и не досылается (опоздание {late}).")
+            await self.store.record_job_run(saved["name"], missed.timestamp(), "missed")
+            return
+        logger.info(f"⏰ Слот {missed:%Y-%m-%d %H:%M} UTC задачи '{saved['name']}' пропущен во время простоя, досылается сейчас.")
+        application.job_queue.run_once(
+            callback, when=0, name=saved["name"], data={**(saved["data"] or {}), "catchup_for": missed.isoformat()},
+        )
+
+
+# Прежнее имя: восстановление задач в post_init
+restore_jobs = sync_jobs
+
+
+async def startup_restore_job(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Восстановление задач после старта: запускается из JobQueue сразу после post_init,
+    поэтому приём обновлений не ждёт чтения таблицы задач и досылки пропущенных слотов.
+    """
+    if config.LEADER_ELECTION:
+        await leader.renew(context.application) # Задачи восстанавливает только лидер, остальные реплики ждут аренду
+    await sync_jobs(context.application)
+
+
+async def leader_election_job(context: ContextTypes.DEFAULT_TYPE):
+    """Продлевает аренду лидерства (на каждой реплике); лидер сверяет задачи, бывший лидер снимает свои."""
+    application = context.application
+    is_leader_now, changed = await leader.renew(application)
+    if is_leader_now:
+        try:
+            await sync_jobs(application)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сверки задач с общей таблицей: {e}", exc_info=True)
+    elif changed:
+        for name in list(_synced):
+            _remove_local(application, name)
+        logger.info("Задачи планировщика сняты: их выполняет новый лидер.")
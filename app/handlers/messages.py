@@ -1,7 +1,7 @@
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes, MessageHandler, filters
-from .. import config
+from .. import channels
 # Импортируем функции-обработчики команд, которые вызываются из меню
 from .commands import (
     generate_idea,
@@ -19,9 +19,9 @@ logger = logging.getLogger(__name__)
 # --- Обработка нажатий на кнопки ReplyKeyboard ---
 async def handle_text_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает текстовые сообщения, соответствующие кнопкам меню."""
-    # Этот хэндлер должен быть защищен фильтром filters.Chat(config.ADMIN_ID) при добавлении в Application
+    # Этот хэндлер должен быть защищен фильтром filters.Chat(админы каналов) при добавлении в Application
     user_id = update.effective_user.id
-    if user_id != config.ADMIN_ID:
+    if not channels.is_admin(user_id):
         logger.warning(f"Неавторизованная попытка использования текстового меню от user_id: {user_id}")
         return # Игнорируем сообщения не от админа
 
@@ -54,8 +54,8 @@ async def handle_text_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         # await update.message.reply_text("Не распознал эту команду. Используй кнопки меню или известные команды.")
         pass # Просто игнорируем
 
-# --- Фильтр для текстовых сообщений только от админа ---
-admin_text_filter = filters.TEXT & ~filters.COMMAND & filters.Chat(config.ADMIN_ID)
+# --- Фильтр для текстовых сообщений только от админов каналов ---
+admin_text_filter = filters.TEXT & ~filters.COMMAND & filters.Chat(channels.admin_ids())
 
 # --- Создаем хэндлер ---
 text_menu_handler = MessageHandler(admin_text_filter, handle_text_menu)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Кэш сгенерированных изображений на диске (LRU с ограничением размера)
+CACHE_DIR = config.DATA_DIR / "image_cache"
+INDEX_PATH = CACHE_DIR / "index.json"
+
+# key -> {"file": имя файла, "size": байт, "file_id": Telegram file_id | None, "ts": время последнего доступа}
+_index: OrderedDict | None = None
+_lock = threading.Lock() # Функции вызываются из потоков (asyncio.to_thread)
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Нормализует промпт: регистр, пробелы и обрезка до IMAGE_PROMPT_MAX_LENGTH (как в generate_image)."""
+    normalized = _WS_RE.sub(" ", prompt or "").strip()
+    return normalized[:config.IMAGE_PROMPT_MAX_LENGTH].strip().lower()
+
+
+def make_key(prompt: str) -> str:
+    """Ключ кэша: параметры модели + хэш нормализованного промпта."""
+    prompt_hash = hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+    raw_key = "|".join([
+        str(config.IMAGE_MODEL), str(config.IMAGE_SIZE),
+        str(config.IMAGE_QUALITY), str(config.IMAGE_STYLE), prompt_hash
+    ])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()[:32]
+
+
+def _load_index() -> OrderedDict:
+    """Загружает индекс кэша с диска (один раз за время жизни процесса)."""
+    global _index
+    if _index is not None:
+        return _index
+    _index = OrderedDict()
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        if INDEX_PATH.exists():
+            with open(INDEX_PATH, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            # Восстанавливаем порядок LRU по времени последнего доступа
+            for key, entry in sorted(entries.items(), key=lambda kv: kv[1].get("ts", 0)):
+                if (CACHE_DIR / entry.get("file", "")).is_file():
+                    _index[key] = entry
+            logger.info(f"Загружен индекс кэша изображений: {len(_index)} записей.")
+    except Exception as e:
+        logger.error(f"❌ Не удалось загрузить индекс кэша изображений {INDEX_PATH}: {e}", exc_info=True)
+        _index = OrderedDict()
+    return _index
+
+
+def _save_index():
+    """Атомарно сохраняет индекс (через временный файл)."""
+    try:
+        tmp_path = INDEX_PATH.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(_index, f, ensure_ascii=False)
+        tmp_path.replace(INDEX_PATH)
+    except Exception as e:
+        logger.error(f"❌ Не удалось сохранить индекс кэша изображений: {e}", exc_info=True)
+
+
+def _evict(index: OrderedDict):
+    """Удаляет самые старые записи, пока кэш превышает лимиты по размеру или количеству."""
+    max_bytes = config.IMAGE_CACHE_MAX_MB * 1024 * 1024
+    total = sum(entry.get("size", 0) for entry in index.values())
+    while index and (total > max_bytes or len(index) > config.IMAGE_CACHE_MAX_ITEMS):
+        key, entry = index.popitem(last=False)
+        total -= entry.get("size", 0)
+        try:
+            (CACHE_DIR / entry["file"]).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Не удалось удалить файл кэша {entry.get('file')}: {e}")
+        logger.debug(f"Кэш изображений: вытеснена запись {key}")
+
+
+def get(key: str) -> dict | None:
+    """
+    Возвращает запись кэша {"file_id": ..., "bytes": ...} или None.
+    Байты читаются с диска только если file_id ещё неизвестен.
+    """
+    with _lock:
+        index = _load_index()
+        entry = index.get(key)
+        if entry is None:
+            return None
+        entry["ts"] = time.time()
+        index.move_to_end(key)
+        _save_index()
+        file_id = entry.get("file_id")
+    if file_id:
+        return {"file_id": file_id, "bytes": None}
+    image_bytes = load_bytes(key)
+    return {"file_id": None, "bytes": image_bytes} if image_bytes else None
+
+
+def load_bytes(key: str) -> bytes | None:
+    """Читает байты изображения из кэша."""
+    with _lock:
+        entry = _load_index().get(key)
+    if entry is None:
+        return None
+    try:
+        return (CACHE_DIR / entry["file"]).read_bytes()
+    except OSError as e:
+        logger.warning(f"Не удалось прочитать файл кэша {entry.get('file')}: {e}")
+        return None
+
+
+def put(key: str, image_bytes: bytes):
+    """Сохраняет изображение в кэш и вытесняет старые записи при превышении лимитов."""
+    if not image_bytes:
+        return
+    with _lock:
+        index = _load_index()
+        file_name = f"{key}.img"
+        try:
+            (CACHE_DIR / file_name).write_bytes(image_bytes)
+        except OSError as e:
+            logger.error(f"❌ Не удалось записать изображение в кэш: {e}")
+            return
+        index[key] = {"file": file_name, "size": len(image_bytes), "file_id": None, "ts": time.time()}
+        index.move_to_end(key)
+        _evict(index)
+        _save_index()
+    logger.info(f"Изображение сохранено в кэш ({len(image_bytes) / 1024:.1f} КБ), ключ {key}.")
+
+
+def set_file_id(key: str, file_id: str | None):
+    """Запоминает Telegram file_id после первой загрузки (None — сбросить недействительный file_id)."""
+    with _lock:
+        entry = _load_index().get(key)
+        if entry is None or entry.get("file_id") == file_id:
+            return
+        entry["file_id"] = file_id
+        _save_index()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import socket
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Выбор реплики-лидера: при LEADER_ELECTION несколько процессов работают с общей data/,
+# и только держатель аренды "scheduler" (таблица leases в bot_state.sqlite3) выполняет задачи планировщика.
+# Без LEADER_ELECTION процесс всегда лидер, поведение прежнее.
+LEASE_NAME = "scheduler"
+REPLICA_ID = config.REPLICA_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+_leader = not config.LEADER_ELECTION
+
+
+def is_leader() -> bool:
+    """Выполняет ли эта реплика задачи планировщика."""
+    return _leader
+
+
+def _store(application):
+    persistence = application.persistence
+    return persistence if persistence is not None and hasattr(persistence, "acquire_lease") else None
+
+
+async def renew(application) -> tuple[bool, bool]:
+    """
+    Захватывает или продлевает аренду лидерства. Возвращает (лидер ли сейчас, изменился ли статус).
+    Если базу не удалось опросить, реплика перестаёт считать себя лидером: лучше пропустить запуск, чем выполнить его дважды.
+    """
+    global _leader
+    if not config.LEADER_ELECTION:
+        return True, False
+    store = _store(application)
+    try:
+        leader = await store.acquire_lease(LEASE_NAME, REPLICA_ID, config.LEADER_LEASE_SECONDS)
+    except Exception as e:
+        logger.error(f"❌ Не удалось продлить аренду лидерства: {e}")
+        leader = False
+    changed = leader != _leader
+    _leader = leader
+    if changed:
+        logger.info(f"👑 Реплика {REPLICA_ID} стала лидером." if leader else f"Реплика {REPLICA_ID} больше не лидер.")
+    return leader, changed
+
+
+async def release(application):
+    """Отдаёт аренду при остановке, чтобы при перезапуске или выкатке другая реплика стала лидером сразу."""
+    global _leader
+    if not config.LEADER_ELECTION or not _leader:
+        return
+    _leader = False
+    try:
+        await _store(application).release_lease(LEASE_NAME, REPLICA_ID)
+        logger.info(f"Реплика {REPLICA_ID} отдала лидерство.")
+    except Exception as e:
+        logger.warning(f"Не удалось освободить аренду лидерства: {e}")
+
+
+async def current_leader(application) -> str | None:
+    """Имя реплики-лидера (для /schedule)."""
+    if not config.LEADER_ELECTION:
+        return REPLICA_ID
+    try:
+        return await _store(application).lease_holder(LEASE_NAME)
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать держателя аренды: {e}")
+        return None
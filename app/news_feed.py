@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import calendar
+import hashlib
+import logging
+import re
+import time
+
+import httpx
+import feedparser
+
+from . import config, perf, traffic_record
+from .text_extract import html_to_text_batch
+
+logger = logging.getLogger(__name__)
+
+RSS_POLL_JOB = "rss_poll_job"
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# Общий HTTP-клиент для RSS (keep-alive между опросами)
+_http_client: httpx.AsyncClient | None = None
+
+# Состояние каждой ленты: заголовки для условного GET и уже разобранные записи
+# url -> {"etag", "last_modified", "entries": [...], "fetched_at", "checked_at"}
+_feeds_state: dict[str, dict] = {}
+# Объединённый, очищенный от дублей и отсортированный список записей всех лент
+_merged = {"entries": [], "fetched_at": None, "checked_at": None}
+_refresh_lock = asyncio.Lock() # Не даём опросчику и /news качать ленты одновременно
+
+_TITLE_SOURCE_RE = re.compile(r"\s+[-–—|]\s+[^-–—|]{1,60}$") # Хвост " - Издание" (Google News и агрегаторы)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class FeedParseError(Exception):
+    """Лента загружена, но не разобрана (bozo) или пуста."""
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий асинхронный HTTP-клиент для загрузки RSS."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=30.0, follow_redirects=True, verify=True, headers={'User-Agent': USER_AGENT},
+                                         event_hooks=traffic_record.event_hooks("rss"))
+    return _http_client
+
+
+async def close_http_client():
+    """Закрывает общий HTTP-клиент (при остановке бота)."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+def _parse_feed(rss_content: bytes) -> list[dict]:
+    """Разбирает RSS и очищает описания от HTML одной пачкой. Выполняется в отдельном потоке."""
+    feed_data = feedparser.parse(rss_content)
+    if not feed_data or feed_data.get('bozo', 1) or not feed_data.entries:
+        bozo_exception = feed_data.get('bozo_exception', 'Неизвестная ошибка парсинга')
+        detail = type(bozo_exception).__name__ if bozo_exception != 'Неизвестная ошибка парсинга' else bozo_exception
+        raise FeedParseError(detail)
+
+    summaries = html_to_text_batch([entry.get('summary', '') for entry in feed_data.entries])
+    entries = []
+    for entry, summary_text in zip(feed_data.entries, summaries):
+        published = entry.get('published_parsed') or entry.get('updated_parsed')
+        entries.append({
+            "title": entry.get('title', 'Без заголовка'),
+            "summary_text": summary_text,
+            "link": entry.get('link', ''),
+            "id": entry.get('id', ''),
+            "published_ts": calendar.timegm(published) if published else None,
+        })
+    return entries
+
+
+def get_feed_urls() -> list[tuple[str, float]]:
+    """Список лент (url, вес источника) из NEWS_RSS_URLS, либо одна лента NEWS_RSS_URL."""
+    feeds = []
+    for item in (config.NEWS_RSS_URLS or config.NEWS_RSS_URL or "").split(","):
+        url, _, weight = item.strip().partition("|")
+        if not url:
+            continue
+        try:
+            feeds.append((url.strip(), float(weight) if weight else 1.0))
+        except ValueError:
+            logger.warning(f"Некорректный вес ленты '{item}', используется 1.0")
+            feeds.append((url.strip(), 1.0))
+    return feeds
+
+
+async def _refresh_one(url: str, semaphore: asyncio.Semaphore) -> bool:
+    """
+    Загружает одну ленту условным GET (ETag / If-Modified-Since).
+    При 304 разбор пропускается. Возвращает True, если лента изменилась.
+    """
+    state = _feeds_state.setdefault(url, {"etag": None, "last_modified": None, "entries": [], "fetched_at": None, "checked_at": None})
+    headers = {}
+    if state["etag"]:
+        headers["If-None-Match"] = state["etag"]
+    if state["last_modified"]:
+        headers["If-Modified-Since"] = state["last_modified"]
+
+    async with semaphore:
+        with perf.timer("rss.feed"):
+            response = await get_http_client().get(url, headers=headers)
+    logger.debug(f"Ответ от RSS сервера {url}: Статус {response.status_code}")
+
+    if response.status_code == 304 and state["entries"]:
+        state["checked_at"] = time.time()
+        logger.debug(f"RSS лента {url} не изменилась (304), разбор пропущен.")
+        return False
+
+    response.raise_for_status() # Проверка на ошибки HTTP (4xx, 5xx)
+    rss_content = response.content
+    if not rss_content:
+        raise FeedParseError("Пустой ответ от RSS-сервера")
+
+    logger.debug(f"Попытка парсинга RSS контента {url} ({len(rss_content)} байт)...")
+    entries = await asyncio.to_thread(_parse_feed, rss_content)
+
+    now = time.time()
+    state.update({
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "entries": entries,
+        "fetched_at": now,
+        "checked_at": now,
+    })
+    logger.info(f"RSS лента {url} обновлена: {len(entries)} записей.")
+    return True
+
+
+def title_key(title: str) -> str:
+    """Хэш нормализованного заголовка: без хвоста с источником, регистра, пунктуации и порядка слов."""
+    title = _TITLE_SOURCE_RE.sub("", title or "").lower()
+    words = sorted(set(w for w in _WORD_RE.findall(title) if len(w) > 2))
+    return hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest()
+
+
+def _merge_entries(feeds: list[tuple[str, float]]) -> list[dict]:
+    """Объединяет записи всех лент, удаляет дубли по заголовку и ранжирует по свежести и весу источника."""
+    now = time.time()
+    half_life = max(config.NEWS_RECENCY_HALF_LIFE_HOURS, 1) * 3600
+    best: dict[str, dict] = {}
+    for url, weight in feeds:
+        state = _feeds_state.get(url)
+        if not state:
+            continue
+        for entry in state["entries"]:
+            # Без даты считаем новость "возрастом в один период полураспада"
+            age = now - entry["published_ts"] if entry.get("published_ts") else half_life
+            score = weight * 0.5 ** (max(age, 0) / half_life)
+            key = title_key(entry["title"])
+            if key not in best or score > best[key]["score"]:
+                best[key] = {**entry, "source": url, "score": score}
+    return sorted(best.values(), key=lambda e: e["score"], reverse=True)
+
+
+async def refresh_feed() -> bool:
+    """
+    Параллельно обновляет все ленты (не более NEWS_FETCH_CONCURRENCY запросов одновременно)
+    и пересобирает объединённый список. Возвращает True, если хоть одна лента изменилась.
+    Если не удалось получить ни одной записи, пробрасывает первую ошибку (httpx или FeedParseError).
+    """
+    feeds = get_feed_urls()
+    async with _refresh_lock:
+        semaphore = asyncio.Semaphore(max(config.NEWS_FETCH_CONCURRENCY, 1))
+        results = await asyncio.gather(*(_refresh_one(url, semaphore) for url, _ in feeds), return_exceptions=True)
+
+        errors = []
+        for (url, _), result in zip(feeds, results):
+            if isinstance(result, Exception):
+                errors.append(result)
+                logger.warning(f"Не удалось обновить RSS ленту {url}: {type(result).__name__}: {result}")
+        changed = any(result is True for result in results)
+
+        if changed or not _merged["entries"]:
+            _merged["entries"] = _merge_entries(feeds)
+            fetched = [s["fetched_at"] for s in _feeds_state.values() if s["fetched_at"]]
+            _merged["fetched_at"] = max(fetched) if fetched else None
+        if not _merged["entries"] and errors:
+            raise errors[0]
+        _merged["checked_at"] = time.time()
+        logger.info(f"Ленты новостей: {len(feeds)} шт., ошибок {len(errors)}, после слияния {len(_merged['entries'])} записей.")
+        return changed
+
+
+def get_snapshot() -> dict:
+    """Возвращает снимок объединённой ленты: записи (по убыванию ранга) и возраст в секундах (None, если лент ещё нет)."""
+    fetched_at = _merged["fetched_at"]
+    checked_at = _merged["checked_at"]
+    return {
+        "entries": list(_merged["entries"]),
+        "age": time.time() - fetched_at if fetched_at else None,
+        "checked_age": time.time() - checked_at if checked_at else None,
+    }
+
+
+def format_age(seconds: float | None) -> str:
+    """Человекочитаемый возраст снимка ленты."""
+    if seconds is None:
+        return "неизвестно"
+    if seconds < 60:
+        return f"{int(seconds)} сек."
+    if seconds < 3600:
+        return f"{int(seconds // 60)} мин."
+    return f"{seconds / 3600:.1f} ч."
+
+
+async def rss_poll_job(context):
+    """Фоновая задача JobQueue: держит снимок ленты тёплым для /news."""
+    try:
+        await refresh_feed()
+    except FeedParseError as e:
+        logger.warning(f"Опрос RSS: не удалось разобрать ни одной ленты: {e}")
+    except httpx.HTTPError as e:
+        logger.warning(f"Опрос RSS: ни одна лента не загружена: {type(e).__name__}: {e}")
+    except Exception as e:
+        logger.error(f"❌ Опрос RSS: непредвиденная ошибка: {e}", exc_info=True)
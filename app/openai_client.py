@@ -2,7 +2,7 @@
 import logging
 import httpx # Убедимся, что httpx импортирован
 from openai import OpenAI, AsyncOpenAI, APIError # Импортируем нужные классы и ошибки
-from . import config # Импортируем нашу конфигурацию
+from . import config, perf, traffic_record # Импортируем нашу конфигурацию
 
 logger = logging.getLogger(__name__)
 
@@ -82,12 +82,12 @@ def get_async_openai_client() -> AsyncOpenAI | None:
                 logger.info(f"Используется OpenAI прокси (асинхронный): {config.OPENAI_PROXY}")
                 proxies = {"all://": config.OPENAI_PROXY}
                 # Создаем асинхронный httpx клиент с прокси
-                async_http_client = httpx.AsyncClient(proxies=proxies, timeout=60.0) # Добавим таймаут
+                async_http_client = httpx.AsyncClient(proxies=proxies, timeout=60.0, event_hooks=traffic_record.event_hooks("openai")) # Добавим таймаут
                 logger.debug("httpx.AsyncClient для OpenAI (асинхронный) с прокси создан.")
             else:
                 logger.info("Прокси для OpenAI (асинхронный) не используется.")
                 # Создаем клиент без прокси
-                async_http_client = httpx.AsyncClient(timeout=60.0)
+                async_http_client = httpx.AsyncClient(timeout=60.0, event_hooks=traffic_record.event_hooks("openai"))
                 logger.debug("httpx.AsyncClient для OpenAI (асинхронный) без прокси создан.")
 
             # Инициализируем AsyncOpenAI, передавая наш httpx клиент
@@ -172,7 +172,8 @@ async def generate_image(prompt: str) -> str | None:
              logger.debug(f"Для модели {config.IMAGE_MODEL} параметры response_format, quality, style не передаются.")
 
         # Выполняем запрос к API
-        response = await client.images.generate(**api_params)
+        with perf.timer("openai.image"):
+            response = await client.images.generate(**api_params)
 
         # Анализируем ответ
         if response.data and len(response.data) > 0 and response.data[0].url:
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import functools
+import logging
+import resource
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from telegram.request import BaseRequest, RequestData
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Время операций в памяти процесса: хэндлеры команд и кнопок, задачи автопостинга и вызовы внешних сервисов
+# (OpenAI, Perplexity, RSS, статьи, Bot API). По каждой операции хранятся последние PERF_WINDOW замеров,
+# по ним /perf считает p50/p95. Ошибкой считается выход из замера по исключению (или ответ Bot API >= 400).
+_samples: dict[str, deque] = {}
+_totals: dict[str, list[int]] = {} # операция -> [всего замеров, из них ошибок] с запуска
+_started = time.monotonic()
+
+
+def record(name: str, seconds: float, error: bool = False):
+    samples = _samples.get(name)
+    if samples is None:
+        samples = _samples[name] = deque(maxlen=max(config.PERF_WINDOW, 1))
+        _totals[name] = [0, 0]
+    samples.append(seconds)
+    totals = _totals[name]
+    totals[0] += 1
+    if error:
+        totals[1] += 1
+
+
+@contextmanager
+def timer(name: str):
+    """Замер блока кода: with perf.timer("openai.chat"): ..."""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record(name, time.perf_counter() - started, error)
+
+
+def timed(name):
+    """
+    Декоратор корутины с замером времени. name - имя операции или функция от аргументов вызова,
+    возвращающая имя (например, кнопка по callback_data).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with timer(name(*args, **kwargs) if callable(name) else name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def snapshot() -> list[dict]:
+    """Статистика по операциям (по убыванию p95): окно последних замеров, всего и ошибок с запуска."""
+    rows = []
+    for name, samples in _samples.items():
+        values = sorted(samples)
+        total, errors = _totals[name]
+        rows.append({"name": name, "window": len(values), "total": total, "errors": errors,
+                     "p50": _percentile(values, 0.5), "p95": _percentile(values, 0.95), "max": values[-1]})
+    return sorted(rows, key=lambda row: row["p95"], reverse=True)
+
+
+def rss_bytes() -> tuple[int, bool]:
+    """Текущий RSS процесса (из /proc) или, где /proc нет, пиковый (второе значение - True)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize(), False
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, True
+
+
+def uptime() -> float:
+    return time.monotonic() - _started
+
+
+class TimedRequest(BaseRequest):
+    """Обёртка запросов к Bot API: время каждого метода как операция "telegram.<метод>"."""
+
+    def __init__(self, request: BaseRequest):
+        self._request = request
+
+    @property
+    def read_timeout(self):
+        return self._request.read_timeout
+
+    async def initialize(self):
+        await self._request.initialize()
+
+    async def shutdown(self):
+        await self._request.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None,
+                         read_timeout=BaseRequest.DEFAULT_NONE, write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE, pool_timeout=BaseRequest.DEFAULT_NONE):
+        name = f"telegram.{url.rsplit('/', 1)[-1]}"
+        started = time.perf_counter()
+        try:
+            status, payload = await self._request.do_request(
+                url, method, request_data=request_data, read_timeout=read_timeout, write_timeout=write_timeout,
+                connect_timeout=connect_timeout, pool_timeout=pool_timeout)
+        except BaseException:
+            record(name, time.perf_counter() - started, error=True)
+            raise
+        record(name, time.perf_counter() - started, error=status >= 400)
+        return status, payload
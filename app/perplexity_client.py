@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import httpx
+
+from . import config, perf, traffic_record
+from .prompts import PROMPT_TMPL_RESEARCH
+
+logger = logging.getLogger(__name__)
+
+PPLX_BASE_URL = "https://api.perplexity.ai"
+SYSTEM_PROMPT = "You are an AI assistant writing concise and engaging Telegram posts for an IT audience." # Уточнили роль
+_CACHE_MAX_ENTRIES = 128
+
+# Постоянный клиент с пулом соединений к api.perplexity.ai (keep-alive между запросами)
+_http_client: httpx.AsyncClient | None = None
+# Кэш ответов: (нормализованный запрос, дата UTC, модель) -> (время получения, текст)
+_cache: OrderedDict = OrderedDict()
+# Запросы в полёте: одинаковые параллельные запросы ждут один и тот же вызов API
+_inflight: dict[tuple, asyncio.Task] = {}
+
+_WS_RE = re.compile(r"\s+")
+
+
+class PerplexityError(Exception):
+    """Perplexity API вернул ошибку или ответ неожиданного формата."""
+
+
+class PerplexityAuthError(PerplexityError):
+    """Ошибка авторизации (401): неверный PPLX_API_KEY."""
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий HTTP-клиент для Perplexity API."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=PPLX_BASE_URL,
+            timeout=60.0,
+            limits=httpx.Limits(max_keepalive_connections=5, keepalive_expiry=120),
+            headers={
+                "Authorization": f"Bearer {config.PPLX_API_KEY}",
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+            event_hooks=traffic_record.event_hooks("perplexity"),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Закрывает общий HTTP-клиент (при остановке бота)."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+def _cache_key(query: str, model: str) -> tuple:
+    """Ключ кэша: запрос без учёта регистра и пробелов, календарный день (UTC) и модель."""
+    normalized = _WS_RE.sub(" ", query).strip().lower()
+    return normalized, datetime.now(timezone.utc).date().isoformat(), model
+
+
+def _cache_get(key: tuple) -> str | None:
+    item = _cache.get(key)
+    if item is None:
+        return None
+    fetched_at, text = item
+    if time.time() - fetched_at > config.PPLX_CACHE_TTL:
+        del _cache[key]
+        return None
+    _cache.move_to_end(key)
+    return text
+
+
+def _cache_put(key: tuple, text: str):
+    _cache[key] = (time.time(), text)
+    _cache.move_to_end(key)
+    while len(_cache) > _CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+
+
+async def _request(query: str, model: str) -> str:
+    """Один вызов /chat/completions. Ошибки HTTP/сети (httpx) пробрасываются как есть."""
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": PROMPT_TMPL_RESEARCH.format(query=query)}
+        ],
+        "stream": False,
+    }
+    with perf.timer("perplexity.chat"):
+        res = await get_http_client().post("/chat/completions", json=payload)
+    logger.debug(f"Ответ от Perplexity API: Статус {res.status_code}")
+    if res.status_code == 401:
+        raise PerplexityAuthError("Ошибка авторизации (401)")
+    res.raise_for_status() # Проверка на другие ошибки (включая 400 Bad Request из-за неверной модели)
+    data = res.json()
+    logger.debug(f"Получены данные от Perplexity: {str(data)[:500]}...")
+
+    if isinstance(data, dict) and "choices" in data and data["choices"] and \
+       isinstance(data["choices"][0], dict) and "message" in data["choices"][0] and \
+       isinstance(data["choices"][0]["message"], dict) and "content" in data["choices"][0]["message"]:
+        text = data["choices"][0]["message"]["content"].strip()
+        if not text:
+            raise PerplexityError("API вернул пустой ответ")
+        return text
+
+    error_detail = data.get('error', {}).get('message', 'Неверный формат ответа') if isinstance(data, dict) else 'Неверный формат ответа'
+    logger.error(f"Ошибка API Perplexity или неверный формат ответа: {error_detail} | Ответ: {data}")
+    raise PerplexityError(error_detail)
+
+
+async def _request_and_cache(key: tuple, query: str, model: str) -> str:
+    """Запрос к API с сохранением результата в кэш (даже если инициатор перестал ждать)."""
+    text = await _request(query, model)
+    _cache_put(key, text)
+    return text
+
+
+async def research(query: str, model: str | None = None) -> tuple[str, bool]:
+    """
+    Генерирует пост по запросу через Perplexity.
+    Результат кэшируется на PPLX_CACHE_TTL секунд в пределах календарного дня,
+    одинаковые запросы в полёте объединяются. Возвращает (текст, взят_из_кэша_или_общего_запроса).
+    """
+    model = model or config.PPLX_MODEL
+    key = _cache_key(query, model)
+    cached = _cache_get(key)
+    if cached is not None:
+        logger.info(f"Perplexity: ответ по запросу '{query}' взят из кэша.")
+        return cached, True
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_request_and_cache(key, query, model))
+        _inflight[key] = task
+        task.add_done_callback(lambda _t: _inflight.pop(key, None))
+        shared = False
+    else:
+        logger.info(f"Perplexity: запрос '{query}' уже выполняется, ожидаем его результат.")
+        shared = True
+
+    # shield: отмена одного ожидающего не отменяет общий запрос для остальных
+    text = await asyncio.shield(task)
+    return text, shared
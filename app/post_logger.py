@@ -1,29 +1,64 @@
+import contextlib
 import logging
 import pandas as pd
 from datetime import datetime
 from pathlib import Path
-from . import config
+from . import channels, config, similarity, retrieval
+from .channels import Channel
+
+try:
+    import fcntl
+except ImportError: # Windows: без блокировки, там бот запускается одним процессом
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
-CSV_PATH = config.LOG_FILE
+# У каждого канала свой CSV (Channel.log_file); channel=None - канал по умолчанию
 CSV_COLUMNS = ["message_id", "text", "timestamp_iso", "reactions"]
 
-def _ensure_csv_exists():
+
+@contextlib.contextmanager
+def _file_lock(csv_path: Path, exclusive: bool):
+    """
+    Межпроцессная блокировка лога (flock на соседнем файле .lock): при LEADER_ELECTION несколько реплик
+    пишут в общий data/, и запись одной не должна перемешаться с записью или чтением другой.
+    flock блокирующий: log_post и read_posts вызываются из корутин только через asyncio.to_thread.
+    """
+    if fcntl is None or not config.LEADER_ELECTION:
+        yield
+        return
+    with open(csv_path.with_name(csv_path.name + ".lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def log_size(channel: Channel | None = None) -> int:
+    """Размер лога канала в байтах (0, если файла нет): индексы сверяют его, чтобы заметить записи других реплик."""
+    try:
+        return channels.resolve(channel).log_file.stat().st_size
+    except OSError:
+        return 0
+
+def _ensure_csv_exists(csv_path: Path):
     """Проверяет наличие CSV файла и создает его с заголовками при необходимости."""
-    if not CSV_PATH.exists():
+    if not csv_path.exists():
         try:
-            logger.warning(f"Файл лога {CSV_PATH} не найден. Создание нового файла.")
+            logger.warning(f"Файл лога {csv_path} не найден. Создание нового файла.")
             df = pd.DataFrame(columns=CSV_COLUMNS)
-            df.to_csv(CSV_PATH, index=False, encoding='utf-8')
-            logger.info(f"Создан пустой файл лога: {CSV_PATH}")
+            df.to_csv(csv_path, index=False, encoding='utf-8')
+            logger.info(f"Создан пустой файл лога: {csv_path}")
         except Exception as e:
-            logger.error(f"❌ Не удалось создать файл лога {CSV_PATH}: {e}", exc_info=True)
+            logger.error(f"❌ Не удалось создать файл лога {csv_path}: {e}", exc_info=True)
             raise
 
-def log_post(message_id: int, text: str, timestamp: datetime | None = None, reactions: int = 0):
-    """Логирует пост в CSV файл."""
-    _ensure_csv_exists()
+def log_post(message_id: int, text: str, timestamp: datetime | None = None, reactions: int = 0, channel: Channel | None = None):
+    """Логирует пост в CSV файл канала."""
+    channel = channels.resolve(channel)
+    csv_path = channel.log_file
+    _ensure_csv_exists(csv_path)
     if timestamp is None:
         timestamp = datetime.now()
     timestamp_iso = timestamp.isoformat()
@@ -36,17 +71,25 @@ def log_post(message_id: int, text: str, timestamp: datetime | None = None, reac
     }])
 
     try:
-        # Используем режим 'a' (append) и отключаем запись заголовка, если файл уже существует
-        new_data.to_csv(CSV_PATH, mode='a', header=not CSV_PATH.exists() or CSV_PATH.stat().st_size == 0, index=False, encoding='utf-8')
-        logger.info(f"Пост message_id={message_id} успешно залогирован в {CSV_PATH}")
+        with _file_lock(csv_path, exclusive=True):
+            size_before = log_size(channel)
+            # Используем режим 'a' (append) и отключаем запись заголовка, если файл уже существует
+            new_data.to_csv(csv_path, mode='a', header=size_before == 0, index=False, encoding='utf-8')
+            log_span = (size_before, log_size(channel))
+        logger.info(f"Пост message_id={message_id} успешно залогирован в {csv_path}")
+        # Инкрементально обновляем индексы похожих и релевантных постов
+        similarity.add_post(message_id, text, timestamp, channel=channel, log_span=log_span)
+        retrieval.add_post(text, reactions, channel=channel, log_span=log_span, message_id=message_id)
     except Exception as e:
         logger.error(f"❌ Ошибка записи поста message_id={message_id} в CSV: {e}", exc_info=True)
 
-def read_posts() -> pd.DataFrame:
-    """Читает все посты из CSV файла."""
-    _ensure_csv_exists()
+def read_posts(channel: Channel | None = None) -> pd.DataFrame:
+    """Читает все посты канала из CSV файла."""
+    csv_path = channels.resolve(channel).log_file
+    _ensure_csv_exists(csv_path)
     try:
-        df = pd.read_csv(CSV_PATH, encoding='utf-8')
+        with _file_lock(csv_path, exclusive=False):
+            df = pd.read_csv(csv_path, encoding='utf-8')
         # Преобразуем нужные колонки в правильные типы, если они прочитались как строки
         if 'timestamp_iso' in df.columns:
              df['dt'] = pd.to_datetime(df['timestamp_iso'])
@@ -55,20 +98,20 @@ def read_posts() -> pd.DataFrame:
         if 'message_id' in df.columns:
              df['message_id'] = pd.to_numeric(df['message_id'], errors='coerce').fillna(0).astype(int)
 
-        logger.debug(f"Прочитано {len(df)} постов из {CSV_PATH}")
+        logger.debug(f"Прочитано {len(df)} постов из {csv_path}")
         return df
     except pd.errors.EmptyDataError:
-        logger.warning(f"Файл лога {CSV_PATH} пуст.")
+        logger.warning(f"Файл лога {csv_path} пуст.")
         return pd.DataFrame(columns=CSV_COLUMNS + ['dt']) # Возвращаем пустой DataFrame с ожидаемыми колонками
     except Exception as e:
-        logger.error(f"❌ Ошибка чтения CSV файла {CSV_PATH}: {e}", exc_info=True)
+        logger.error(f"❌ Ошибка чтения CSV файла {csv_path}: {e}", exc_info=True)
         # В случае ошибки возвращаем пустой DataFrame, чтобы избежать падения других функций
         return pd.DataFrame(columns=CSV_COLUMNS + ['dt'])
 
 
-def read_top_posts(n: int = 5) -> pd.DataFrame:
-    """Читает CSV и возвращает N постов с наибольшим количеством реакций."""
-    df = read_posts()
+def read_top_posts(n: int = 5, channel: Channel | None = None) -> pd.DataFrame:
+    """Читает CSV канала и возвращает N постов с наибольшим количеством реакций."""
+    df = read_posts(channel)
     if df.empty or 'reactions' not in df.columns:
         logger.warning("Нет данных о постах или реакциях для определения топ постов.")
         return pd.DataFrame(columns=df.columns) # Возвращаем пустой DataFrame со всеми колонками
@@ -9,7 +9,7 @@ PROMPT_TMPL_IDEA = """
 --- НАЧАЛО ПОСТОВ ---
 {posts}
 --- КОНЕЦ ПОСТОВ ---
-
+{topic}
 Требования к НОВОМУ ПОСТУ:
 
 1.  **Тема:** Выбери актуальную и интересную тему из мира ИИ (новые модели, интересные применения, этические вопросы, будущее ИИ), которая НЕ повторяет напрямую последние посты, но может быть интересна той же аудитории.
@@ -25,11 +25,16 @@ PROMPT_TMPL_IDEA = """
 Сгенерируй черновик поста, соответствующий этим требованиям.
 """
 
+# Вставка в PROMPT_TMPL_IDEA, когда админ задал тему (/idea <тема>); без темы подставляется пустая строка
+PROMPT_TOPIC_HINT = """
+Админ задал тему нового поста: **"{topic}"**. Пиши именно на эту тему (требование про выбор темы ниже в этом случае не действует), а посты выше используй как образец стиля.
+"""
+
 # Шаблон для генерации НОВОСТНОГО ПОСТА (РАЗВЕРНУТОГО)
 PROMPT_TMPL_NEWS = """
 Ты — AI-ассистент, ведущий Telegram-канал об ИИ. Твоя задача — проанализировать свежие новости из RSS и написать об этом развернутый, понятный пост для подписчиков.
 
-Вот заголовки и краткие описания новостей из RSS-ленты про ИИ:
+Вот заголовки и краткие описания новостей из RSS-ленты про ИИ (для части новостей приведены фрагменты самих статей):
 --- НАЧАЛО НОВОСТЕЙ ---
 {news_items}
 --- КОНЕЦ НОВОСТЕЙ ---
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import time
+
+from . import config, perf, perplexity_client
+from .openai_client import get_async_openai_client
+from .prompts import PROMPT_TMPL_RESEARCH
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ("perplexity", "openai")
+PROVIDER_TITLES = {"perplexity": "Perplexity", "openai": "OpenAI"}
+LATENCY_KEY = "research_latency" # Ключ в bot_data: provider -> {"ewma", "runs", "failures"}
+EWMA_ALPHA = 0.3 # Вес нового замера в скользящем среднем задержки
+
+
+def available_providers() -> list[str]:
+    """Провайдеры из RESEARCH_PROVIDERS, для которых есть ключи API (порядок сохраняется)."""
+    providers = []
+    for name in (p.strip().lower() for p in (config.RESEARCH_PROVIDERS or "").split(",")):
+        if name not in PROVIDERS or name in providers:
+            if name and name not in PROVIDERS:
+                logger.warning(f"Неизвестный провайдер ресёрча '{name}' в RESEARCH_PROVIDERS, пропуск.")
+            continue
+        if name == "perplexity" and not config.PPLX_API_KEY:
+            continue
+        providers.append(name)
+    return providers
+
+
+def rank_providers(stats: dict, providers: list[str]) -> list[str]:
+    """Сортирует провайдеров по средней задержке; ещё не замеренные идут первыми."""
+    return sorted(providers, key=lambda p: stats.get(p, {}).get("ewma", 0.0))
+
+
+def record_latency(stats: dict, provider: str, elapsed: float, ok: bool):
+    """Обновляет EWMA задержки провайдера. Ошибка учитывается как ответ за полный таймаут."""
+    entry = stats.setdefault(provider, {"ewma": None, "runs": 0, "failures": 0})
+    sample = elapsed if ok else max(elapsed, config.RESEARCH_TIMEOUT)
+    entry["ewma"] = sample if entry["ewma"] is None else (1 - EWMA_ALPHA) * entry["ewma"] + EWMA_ALPHA * sample
+    entry["runs"] += 1
+    if not ok:
+        entry["failures"] += 1
+
+
+async def _openai_research(query: str) -> tuple[str, bool]:
+    """Тот же промпт ресёрча, но через OpenAI (без поиска в интернете, только знания модели)."""
+    client = get_async_openai_client()
+    if not client:
+        raise RuntimeError("Не удалось инициализировать клиент OpenAI")
+    with perf.timer("openai.chat"):
+        resp = await client.chat.completions.create(
+            model=config.MODEL,
+            messages=[
+                {"role": "system", "content": perplexity_client.SYSTEM_PROMPT},
+                {"role": "user", "content": PROMPT_TMPL_RESEARCH.format(query=query)},
+            ],
+            max_tokens=1200,
+            temperature=0.7,
+        )
+    if resp.choices and resp.choices[0].message and resp.choices[0].message.content:
+        return resp.choices[0].message.content.strip(), False
+    raise RuntimeError("Ответ API не содержит текста")
+
+
+async def run_provider(provider: str, query: str) -> dict:
+    """
+    Выполняет ресёрч одним провайдером с таймаутом RESEARCH_TIMEOUT.
+    Исключения не пробрасываются: возвращается {"provider", "text", "reused", "elapsed", "error"}.
+    """
+    started = time.monotonic()
+    call = perplexity_client.research(query) if provider == "perplexity" else _openai_research(query)
+    try:
+        text, reused = await asyncio.wait_for(call, timeout=config.RESEARCH_TIMEOUT)
+        result = {"provider": provider, "text": text, "reused": reused, "error": None}
+    except Exception as e:
+        logger.warning(f"Ресёрч через {PROVIDER_TITLES[provider]} не удался: {type(e).__name__}: {e}")
+        result = {"provider": provider, "text": None, "reused": False, "error": e}
+    result["elapsed"] = time.monotonic() - started
+    logger.info(f"Ресёрч через {PROVIDER_TITLES[provider]}: {'успех' if result['text'] else 'ошибка'} за {result['elapsed']:.1f} сек.")
+    return result
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+import logging
+import re
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from . import channels, config
+from .channels import Channel
+
+logger = logging.getLogger(__name__)
+
+# --- Параметры хэширующего векторизатора ---
+N_FEATURES = 1 << 18
+_TOKEN_RE = re.compile(r"\w{3,}", re.UNICODE)
+_MIN_DELTA_TO_MERGE = 1000 # Размер "хвоста" новых постов, после которого он сливается с основным сегментом
+
+
+class _Index:
+    """
+    TF-IDF индекс постов в виде разреженной матрицы по столбцам (postings по признакам):
+    основной сегмент хранится в NumPy-массивах, новые посты копятся в небольшом "хвосте"
+    и периодически сливаются. Запрос трогает только столбцы слов запроса.
+    """
+
+    def __init__(self):
+        self.texts: list[str] = []
+        self.log_size = 0 # Размер лога канала, отражённый в индексе (сверяется при LEADER_ELECTION)
+        self.reactions_list: list[float] = []
+        self._reactions: np.ndarray | None = None # Кэш массива реакций для запросов
+        self.df = np.zeros(N_FEATURES, dtype=np.int32)  # Документная частота признака
+        # Основной сегмент: индексы признаков -> (doc_ids, tf) в CSC-раскладке
+        self.indptr = np.zeros(N_FEATURES + 1, dtype=np.int64)
+        self.post_docs = np.zeros(0, dtype=np.int32)
+        self.post_tf = np.zeros(0, dtype=np.float32)
+        self.main_size = 0
+        self.main_norms = np.zeros(0, dtype=np.float64)
+        # Хвост: [(doc_id, features, tf)]
+        self.delta: list[tuple[int, np.ndarray, np.ndarray]] = []
+        # Кэши, сбрасываемые при добавлении постов (запросы намного чаще, чем публикации)
+        self._idf: np.ndarray | None = None
+        self._delta_coo: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+
+    def idf(self) -> np.ndarray:
+        if self._idf is None:
+            self._idf = np.log((1 + len(self.texts)) / (1 + self.df)) + 1.0
+        return self._idf
+
+    def delta_coo(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Хвост в виде склеенных COO-массивов (doc_ids относительно первого поста хвоста, признаки, tf)."""
+        if self._delta_coo is None:
+            first_doc = self.delta[0][0]
+            self._delta_coo = (
+                np.concatenate([np.full(len(f), d - first_doc, dtype=np.int64) for d, f, _ in self.delta]),
+                np.concatenate([f for _, f, _ in self.delta]),
+                np.concatenate([t for _, _, t in self.delta]),
+            )
+        return self._delta_coo
+
+    @property
+    def reactions(self) -> np.ndarray:
+        if self._reactions is None or len(self._reactions) != len(self.reactions_list):
+            self._reactions = np.array(self.reactions_list, dtype=np.float64)
+        return self._reactions
+
+    def add(self, text: str, reactions: float, auto_merge: bool = True):
+        features, tf = vectorize(text)
+        doc_id = len(self.texts)
+        self.texts.append(text)
+        self.reactions_list.append(float(reactions))
+        self.df[features] += 1
+        self.delta.append((doc_id, features, tf))
+        self._idf = None
+        self._delta_coo = None
+        if auto_merge and len(self.delta) >= max(_MIN_DELTA_TO_MERGE, self.main_size // 10):
+            self.merge()
+
+    def merge(self):
+        """Сливает хвост в основной сегмент (пересборка postings сортировкой COO-троек)."""
+        if not self.delta:
+            return
+        rows = [np.full(len(f), d, dtype=np.int32) for d, f, _ in self.delta]
+        new_docs = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+        new_feats = np.concatenate([f for _, f, _ in self.delta])
+        new_tf = np.concatenate([t for _, _, t in self.delta])
+
+        old_feats = np.repeat(np.arange(N_FEATURES, dtype=np.int64), np.diff(self.indptr))
+        feats = np.concatenate([old_feats, new_feats.astype(np.int64)])
+        docs = np.concatenate([self.post_docs, new_docs])
+        tfs = np.concatenate([self.post_tf, new_tf])
+        order = np.argsort(feats, kind="stable")
+        self.post_docs, self.post_tf = docs[order], tfs[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(feats, minlength=N_FEATURES))])
+        self.main_size = len(self.texts)
+        self.delta = []
+        self._delta_coo = None
+
+        # Нормы документов с актуальным idf: ||d||^2 = sum (tf * idf)^2
+        idf = self.idf()
+        weights = (self.post_tf * idf[feats[order]]) ** 2
+        self.main_norms = np.sqrt(np.bincount(self.post_docs, weights=weights, minlength=self.main_size))
+        self.main_norms[self.main_norms == 0] = 1.0
+
+    def scores(self, features: np.ndarray, tf: np.ndarray) -> np.ndarray:
+        """Косинусное сходство запроса со всеми постами (нули для постов без общих слов)."""
+        idf = self.idf()
+        query_w = tf * idf[features]
+        scores = np.zeros(len(self.texts), dtype=np.float64)
+        for feature, weight in zip(features, query_w):
+            start, end = self.indptr[feature], self.indptr[feature + 1]
+            if start != end:
+                # В пределах одного признака документы уникальны, поэтому простое += корректно
+                scores[self.post_docs[start:end]] += self.post_tf[start:end] * (idf[feature] * weight)
+        if self.main_size:
+            scores[:self.main_size] /= self.main_norms
+        if self.delta:
+            # Хвост считается векторно по склеенным COO-массивам
+            docs, feats, tfs = self.delta_coo()
+            weights = tfs * idf[feats]
+            first_doc = self.delta[0][0]
+            norms = np.sqrt(np.bincount(docs, weights=weights ** 2))
+            query_map = np.zeros(N_FEATURES, dtype=np.float64)
+            query_map[features] = query_w
+            dots = np.bincount(docs, weights=weights * query_map[feats], minlength=len(norms))
+            norms[norms == 0] = 1.0
+            scores[first_doc:first_doc + len(norms)] = dots / norms
+        return scores / (np.linalg.norm(query_w) or 1.0)
+
+
+_indexes: dict[str, _Index] = {} # channel.key -> индекс (строится лениво из лога канала)
+# Свои замки у каждого канала: короткий - для запроса и добавления поста, отдельный - для сборки индекса.
+# Сборка идёт вне короткого замка, так что add_post (log_post при публикации) её не ждёт
+_locks: dict[str, threading.Lock] = {}
+_build_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+# channel.key -> посты (text, reactions, log_span, message_id), записанные во время сборки индекса канала
+_pending: dict[str, list[tuple]] = {}
+
+
+def _channel_lock(channel: Channel) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(channel.key, threading.Lock())
+
+
+def _build_lock(channel: Channel) -> threading.Lock:
+    with _locks_guard:
+        return _build_locks.setdefault(channel.key, threading.Lock())
+
+
+def vectorize(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """Хэширующий векторизатор: уникальные индексы признаков и сублинейный tf (1 + log tf)."""
+    hashes = [zlib.crc32(token.encode("utf-8")) & (N_FEATURES - 1) for token in _TOKEN_RE.findall((text or "").lower())]
+    if not hashes:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+    features, counts = np.unique(np.array(hashes, dtype=np.int32), return_counts=True)
+    return features, (1.0 + np.log(counts)).astype(np.float32)
+
+
+def _ensure_built(channel: Channel) -> _Index:
+    """
+    Индекс канала; при первом обращении строится из лога постов. Лог читается и индексируется вне замка канала:
+    посты, записанные во время сборки, копятся в _pending и добавляются при подмене (кроме уже прочитанных из лога).
+    """
+    from .post_logger import read_posts, log_size # Локальный импорт: post_logger сам импортирует этот модуль
+    with _build_lock(channel):
+        with _channel_lock(channel):
+            index = _indexes.get(channel.key)
+            if index is not None and config.LEADER_ELECTION and log_size(channel) != index.log_size:
+                # Лог дописала другая реплика (общий data/) - строим индекс заново
+                logger.info(f"Лог постов канала {channel.key} изменён другой репликой, TF-IDF индекс перестраивается.")
+                index = None
+            if index is not None:
+                return index
+            _pending[channel.key] = []
+        try:
+            index = _Index()
+            index.log_size = log_size(channel) # До чтения: запись во время чтения вызовет ещё одну пересборку, а не пропуск поста
+            df = read_posts(channel)
+            read_ids = set()
+            if not df.empty and 'text' in df.columns:
+                reactions = df['reactions'] if 'reactions' in df.columns else [0] * len(df)
+                for text, reaction in zip(df['text'], reactions):
+                    index.add(text if isinstance(text, str) else "", reaction, auto_merge=False)
+                if 'message_id' in df.columns:
+                    read_ids.update(int(message_id) for message_id in df['message_id'])
+            index.merge() # Один раз после массовой загрузки
+        except BaseException:
+            with _channel_lock(channel):
+                _pending.pop(channel.key, None)
+            raise
+        with _channel_lock(channel):
+            for text, reaction, log_span, message_id in _pending.pop(channel.key, []):
+                if log_span is not None and log_span[0] == index.log_size:
+                    index.log_size = log_span[1]
+                if message_id is None or message_id not in read_ids:
+                    index.add(text, reaction)
+            _indexes[channel.key] = index
+    logger.info(f"TF-IDF индекс постов канала {channel.key} построен: {len(index.texts)} постов.")
+    return index
+
+
+def add_post(text: str, reactions: int = 0, channel: Channel | None = None, log_span: tuple[int, int] | None = None,
+             message_id: int | None = None):
+    """
+    Инкрементально добавляет пост (вызывается из log_post). До первого запроса индекс не строится,
+    во время сборки пост откладывается до её конца (message_id - чтобы не добавить уже прочитанный из лога).
+    log_span - размер лога до и после записи; несовпадение с индексом значит, что лог дописывала другая реплика.
+    """
+    channel = channels.resolve(channel)
+    with _channel_lock(channel):
+        pending = _pending.get(channel.key)
+        if pending is not None:
+            pending.append((text or "", reactions, log_span, message_id))
+            return
+        index = _indexes.get(channel.key)
+        if index is None:
+            return
+        if log_span is not None:
+            if config.LEADER_ELECTION and log_span[0] != index.log_size:
+                del _indexes[channel.key] # Перестроится при следующем запросе
+                return
+            index.log_size = log_span[1]
+        index.add(text or "", reactions)
+
+
+def search(query: str, k: int = 5, channel: Channel | None = None) -> pd.DataFrame:
+    """
+    Находит k постов канала, наиболее релевантных запросу, с поправкой на вовлечённость:
+    score = cos * (1 + RETRIEVAL_ENGAGEMENT_WEIGHT * log(1 + reactions)).
+    Возвращает DataFrame с колонками text, reactions, score (пустой, если совпадений нет).
+    """
+    features, tf = vectorize(query)
+    channel = channels.resolve(channel)
+    index = _ensure_built(channel)
+    with _channel_lock(channel):
+        if not len(features) or not index.texts:
+            return pd.DataFrame(columns=["text", "reactions", "score"])
+        scores = index.scores(features, tf)
+        scores *= 1.0 + config.RETRIEVAL_ENGAGEMENT_WEIGHT * np.log1p(np.maximum(index.reactions, 0))
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return pd.DataFrame(columns=["text", "reactions", "score"])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return pd.DataFrame({
+            "text": [index.texts[i] for i in top],
+            "reactions": index.reactions[top].astype(int),
+            "score": scores[top],
+        })
+
+
+def build_posts_context(topic: str | None = None, n: int = 5, channel: Channel | None = None) -> str:
+    """
+    Контекст прошлых постов канала для промптов: при заданной теме — самые релевантные посты с учётом реакций,
+    иначе (или если ничего не нашлось) — глобальный топ по реакциям.
+    """
+    from .post_logger import read_top_posts
+    posts_df = None
+    if topic:
+        try:
+            posts_df = search(topic, n, channel)
+            logger.debug(f"Найдено {len(posts_df)} релевантных постов для темы '{topic}'.")
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска релевантных постов: {e}", exc_info=True)
+    if posts_df is None or posts_df.empty:
+        posts_df = read_top_posts(n, channel)
+    if posts_df.empty:
+        return "(Пока нет данных о прошлых постах)"
+    return posts_df[['text', 'reactions']].to_string(index=False, header=True)
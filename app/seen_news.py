@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import math
+import pickle
+import time
+
+from . import channels, config
+from .channels import Channel
+from .news_feed import title_key
+
+logger = logging.getLogger(__name__)
+
+# Индекс уже использованных новостей: ротируемый фильтр Блума (несколько поколений).
+# У каждого канала свой индекс и файл (Channel.seen_news_file): одна новость может выйти в разных каналах
+_GENERATIONS = 3 # Элемент помнится не меньше окна и не больше окна * 3/2
+
+# channel.key -> {"m": бит, "k": хэшей, "filters": [(created_ts, bytearray), ...]} (новейший — последний)
+_states: dict[str, dict] = {}
+
+
+def _bloom_params(capacity: int, error_rate: float) -> tuple[int, int]:
+    """Размер фильтра в битах и число хэш-функций для заданной ёмкости и вероятности ложного срабатывания."""
+    m = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+    k = max(1, int(round(m / capacity * math.log(2))))
+    return m, k
+
+
+def _positions(key: str, m: int, k: int) -> list[int]:
+    """k позиций бита для ключа (двойное хэширование по blake2b)."""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % m for i in range(k)]
+
+
+def _rotation_period() -> float:
+    """Как часто начинается новое поколение фильтра, секунды."""
+    return max(config.NEWS_SEEN_WINDOW_DAYS, 1) * 86400 / (_GENERATIONS - 1)
+
+
+def _load(channel: Channel) -> dict:
+    """Загружает индекс канала с диска (один раз) и ротирует устаревшие поколения."""
+    state = _states.get(channel.key)
+    if state is None:
+        m, k = _bloom_params(max(config.NEWS_SEEN_CAPACITY, 100), 0.001)
+        state = {"m": m, "k": k, "filters": []}
+        seen_path = channel.seen_news_file
+        if seen_path.exists():
+            try:
+                with open(seen_path, "rb") as f:
+                    loaded = pickle.load(f)
+                if loaded.get("m") == m and loaded.get("k") == k:
+                    state = loaded
+                    logger.info(f"Загружен индекс просмотренных новостей канала {channel.key}: {len(state['filters'])} поколений.")
+                else:
+                    logger.warning("Параметры индекса просмотренных новостей изменились, индекс создается заново.")
+            except Exception as e:
+                logger.error(f"❌ Не удалось загрузить индекс просмотренных новостей {seen_path}: {e}", exc_info=True)
+        _states[channel.key] = state
+
+    filters = state["filters"]
+    now = time.time()
+    period = _rotation_period()
+    # После простоя за один вызов уходят все поколения старше окна + периода (в поколение пишут не дольше периода),
+    # а не одно: иначе новости оставались бы "просмотренными" дольше NEWS_SEEN_WINDOW_DAYS
+    expired = sum(1 for created, _ in filters if now - created >= period * _GENERATIONS)
+    if expired:
+        del filters[:expired]
+        logger.debug(f"Индекс просмотренных новостей: удалено устаревших поколений: {expired}.")
+    if not filters or now - filters[-1][0] >= period:
+        filters.append((now, bytearray((state["m"] + 7) // 8)))
+        del filters[:-_GENERATIONS]
+        logger.debug("Индекс просмотренных новостей: начато новое поколение фильтра.")
+    return state
+
+
+def _save(channel: Channel):
+    """Атомарно сохраняет индекс канала на диск."""
+    try:
+        seen_path = channel.seen_news_file
+        tmp_path = seen_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(_states[channel.key], f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(seen_path)
+    except Exception as e:
+        logger.error(f"❌ Не удалось сохранить индекс просмотренных новостей: {e}", exc_info=True)
+
+
+def _entry_keys(entry: dict) -> list[str]:
+    """Ключи записи: ссылка, GUID и хэш нормализованного заголовка."""
+    keys = []
+    if entry.get("link"):
+        keys.append("url:" + entry["link"].strip().rstrip("/").lower())
+    if entry.get("id") and entry.get("id") != entry.get("link"):
+        keys.append("guid:" + str(entry["id"]).strip())
+    if entry.get("title"):
+        keys.append("title:" + title_key(entry["title"]))
+    return keys
+
+
+def is_seen(entry: dict, channel: Channel | None = None) -> bool:
+    """True, если новость (по любому из ключей) уже попадала в черновик канала за последнее окно."""
+    state = _load(channels.resolve(channel))
+    m, k = state["m"], state["k"]
+    for key in _entry_keys(entry):
+        positions = _positions(key, m, k)
+        for _, bits in state["filters"]:
+            if all(bits[p >> 3] & (1 << (p & 7)) for p in positions):
+                return True
+    return False
+
+
+def filter_unseen(entries: list[dict], channel: Channel | None = None) -> list[dict]:
+    """Отбрасывает уже освещённые в канале новости, сохраняя порядок."""
+    unseen = [entry for entry in entries if not is_seen(entry, channel)]
+    if len(unseen) != len(entries):
+        logger.info(f"Индекс просмотренных новостей: пропущено {len(entries) - len(unseen)} из {len(entries)} записей.")
+    return unseen
+
+
+def mark_seen(entries: list[dict], channel: Channel | None = None):
+    """Запоминает новости, по которым сгенерирован черновик для канала."""
+    if not entries:
+        return
+    channel = channels.resolve(channel)
+    state = _load(channel)
+    m, k = state["m"], state["k"]
+    bits = state["filters"][-1][1]
+    for entry in entries:
+        for key in _entry_keys(entry):
+            for p in _positions(key, m, k):
+                bits[p >> 3] |= 1 << (p & 7)
+    _save(channel)
+    logger.debug(f"Индекс просмотренных новостей: отмечено {len(entries)} записей.")
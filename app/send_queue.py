@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable
+
+from telegram.error import RetryAfter
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# --- Приоритеты исходящих запросов (меньше - важнее) ---
+CHANNEL = 0   # Публикации в канал
+ADMIN = 1     # Сообщения админу (черновики, уведомления)
+STATUS = 2    # Правки статусных сообщений ("⏳ Публикую...")
+
+_DRAIN_TIMEOUT = 10 # Сколько ждать отправки очереди при остановке, сек.
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity накопленных."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0 # После RetryAfter отправка в чат запрещена до этого момента
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд можно взять токен (0 - можно сейчас)."""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Item:
+    __slots__ = ("priority", "seq", "call", "chat_id", "supersede_key", "future", "attempts")
+
+    def __init__(self, priority, seq, call, chat_id, supersede_key, future):
+        self.priority, self.seq, self.call = priority, seq, call
+        self.chat_id, self.supersede_key, self.future = chat_id, supersede_key, future
+        self.attempts = 0
+
+    def sort_key(self):
+        return self.priority, self.seq
+
+
+class SendQueue:
+    """
+    Очередь исходящих запросов к Bot API с приоритетами и ограничением скорости.
+
+    Каждый запрос тратит токен из глобального ведра и из ведра своего чата
+    (каналы и группы - SEND_GROUP_RATE_PER_MINUTE в минуту, личные чаты - SEND_CHAT_RATE в секунду).
+    Запросы в один чат выполняются по одному (сохраняется порядок), в разные - параллельно
+    (до SEND_MAX_IN_FLIGHT). Из готовых к отправке всегда берётся самый приоритетный.
+    RetryAfter ставит чат на паузу на retry_after секунд и возвращает запрос в очередь.
+    Новый запрос с тем же supersede_key вытесняет ещё не отправленный старый (его future получает None).
+    """
+
+    def __init__(self):
+        self._pending: list[_Item] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._global = TokenBucket(config.SEND_GLOBAL_RATE, max(config.SEND_GLOBAL_RATE, 1))
+        self._chats: dict[int, TokenBucket] = {}
+        self._busy_chats: set[int] = set()
+        self._in_flight: set[asyncio.Task] = set()
+        self._worker: asyncio.Task | None = None
+        self.stats = {"sent": 0, "superseded": 0, "retry_after": 0, "failed": 0}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if chat_id < 0: # Каналы и группы
+                rate = config.SEND_GROUP_RATE_PER_MINUTE / 60
+                bucket = TokenBucket(rate, 3)
+            else:
+                bucket = TokenBucket(config.SEND_CHAT_RATE, 3)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def submit(self, call: Callable[[], Awaitable], chat_id: int, priority: int = ADMIN,
+               supersede_key: tuple | None = None) -> asyncio.Future:
+        """Ставит запрос в очередь. call - фабрика корутины (вызывается заново при повторе)."""
+        future = asyncio.get_running_loop().create_future()
+        if supersede_key is not None:
+            for old in self._pending:
+                if old.supersede_key == supersede_key:
+                    self._pending.remove(old)
+                    self.stats["superseded"] += 1
+                    if not old.future.done():
+                        old.future.set_result(None)
+                    break # Ключ уникален среди ожидающих: каждый новый вытесняет предыдущий
+        self._pending.append(_Item(priority, next(self._seq), call, chat_id, supersede_key, future))
+        self._wakeup.set()
+        return future
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run(), name="telegram-send-queue")
+            logger.info("Очередь исходящих сообщений Telegram запущена.")
+
+    async def stop(self):
+        """Дожидается отправки очереди (не дольше _DRAIN_TIMEOUT) и останавливает обработчик."""
+        deadline = time.monotonic() + _DRAIN_TIMEOUT
+        while (self._pending or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+        for item in self._pending:
+            if not item.future.done():
+                item.future.cancel()
+        self._pending.clear()
+        logger.info(f"Очередь исходящих сообщений остановлена. Статистика: {self.stats}")
+
+    def _next_ready(self, now: float) -> tuple[_Item | None, float]:
+        """Самый приоритетный запрос, который можно отправить сейчас, или время до ближайшего готового."""
+        global_wait = self._global.wait_time(now)
+        if len(self._in_flight) >= config.SEND_MAX_IN_FLIGHT:
+            return None, 1.0 # Разбудит завершение одного из запросов
+        nearest = float("inf")
+        for item in sorted(self._pending, key=_Item.sort_key):
+            if item.chat_id in self._busy_chats:
+                continue
+            wait = max(global_wait, self._chat_bucket(item.chat_id).wait_time(now))
+            if wait <= 0:
+                return item, 0.0
+            nearest = min(nearest, wait)
+        return None, nearest
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            item, wait = self._next_ready(now)
+            if item is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=None if wait == float("inf") else wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._pending.remove(item)
+            self._global.consume(now)
+            self._chat_bucket(item.chat_id).consume(now)
+            self._busy_chats.add(item.chat_id)
+            task = asyncio.create_task(self._execute(item))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _execute(self, item: _Item):
+        try:
+            item.attempts += 1
+            result = await item.call()
+            self.stats["sent"] += 1
+            if not item.future.done():
+                item.future.set_result(result)
+        except RetryAfter as e:
+            self.stats["retry_after"] += 1
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+            self._chat_bucket(item.chat_id).paused_until = time.monotonic() + retry_after
+            if item.attempts <= config.SEND_MAX_RETRIES:
+                logger.warning(f"Flood control в чате {item.chat_id}: пауза {retry_after:.0f} сек., запрос возвращён в очередь.")
+                self._pending.append(item)
+            else:
+                logger.error(f"Flood control в чате {item.chat_id}: запрос отброшен после {item.attempts} попыток.")
+                self.stats["failed"] += 1
+                if not item.future.done():
+                    item.future.set_exception(e)
+        except Exception as e:
+            self.stats["failed"] += 1
+            if not item.future.done():
+                item.future.set_exception(e)
+        finally:
+            self._busy_chats.discard(item.chat_id)
+            self._wakeup.set()
+
+
+_queue: SendQueue | None = None
+_background: set[asyncio.Future] = set() # Ссылки на фоновые правки статусов (иначе задачи может собрать GC)
+
+
+def start():
+    """Запускает общую очередь (из post_init приложения)."""
+    global _queue
+    if _queue is None:
+        _queue = SendQueue()
+    _queue.start()
+
+
+async def stop():
+    global _queue
+    if _queue is not None:
+        await _queue.stop()
+        _queue = None
+
+
+async def send(call: Callable[[], Awaitable], chat_id: int, priority: int = ADMIN, supersede_key: tuple | None = None):
+    """
+    Выполняет запрос к Bot API через очередь и возвращает его результат (None, если запрос вытеснен).
+    Ошибки запроса пробрасываются вызывающему. Без запущенной очереди запрос выполняется напрямую.
+    """
+    if _queue is None:
+        return await call()
+    return await _queue.submit(call, chat_id, priority, supersede_key)
+
+
+def _status_done(future: asyncio.Future):
+    _background.discard(future)
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        if "message is not modified" in str(error).lower():
+            logger.debug(f"Статус не изменился: {error}")
+        else:
+            logger.warning(f"Не удалось обновить статусное сообщение: {type(error).__name__}: {error}")
+
+
+def post_status(message, text: str, **kwargs):
+    """
+    Фоновая правка статусного сообщения админа: не ждёт Telegram и не блокирует публикацию.
+    Ожидающие правки одного сообщения схлопываются до последней, ошибки только логируются.
+    """
+    call = lambda: message.edit_text(text, **kwargs)
+    if _queue is None:
+        future = asyncio.ensure_future(call())
+    else:
+        future = _queue.submit(call, message.chat_id, STATUS, supersede_key=("edit", message.chat_id, message.message_id))
+    _background.add(future)
+    future.add_done_callback(_status_done)
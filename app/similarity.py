@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import logging
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from . import channels, config
+from .channels import Channel
+
+logger = logging.getLogger(__name__)
+
+# --- Параметры MinHash / LSH ---
+SHINGLE_SIZE = 5        # Символьные n-граммы
+NUM_PERM = 128          # Длина сигнатуры MinHash
+BANDS, ROWS = 32, 4     # LSH: 32 полосы по 4 строки (порог срабатывания ~0.42)
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(20240501) # Фиксированное зерно: сигнатуры стабильны между запусками
+_PERM_A = _rng.integers(1, int(_PRIME), NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, int(_PRIME), NUM_PERM, dtype=np.uint64)
+_POWERS = np.array([pow(31, SHINGLE_SIZE - 1 - i, int(_PRIME)) for i in range(SHINGLE_SIZE)], dtype=np.uint64)
+
+_NON_WORD_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_WS_RE = re.compile(r"\s+")
+
+
+class _PostIndex:
+    """Индекс постов одного канала: сигнатуры, метаданные и LSH-корзины (строится лениво из лога канала)."""
+
+    def __init__(self):
+        self.signatures: list[np.ndarray] = []
+        self.meta: list[dict] = [] # {"message_id", "dt", "preview"}
+        self.buckets: list[dict[bytes, list[int]]] = [{} for _ in range(BANDS)]
+        self.built = False
+        self.log_size = 0 # Размер лога канала, отражённый в индексе (см. _is_stale)
+        self.building = False # Идёт сборка: add_post не ждёт её, а откладывает пост в pending
+        self.pending: list[tuple] = [] # (message_id, text, timestamp, log_span) постов, записанных во время сборки
+        self.lock = threading.Lock() # Короткие операции: запрос, добавление поста, подмена собранного индекса
+        self.build_lock = threading.Lock() # Одна сборка за раз; чтение лога и MinHash идут вне lock
+
+
+_indexes: dict[str, _PostIndex] = {} # channel.key -> индекс
+_indexes_lock = threading.Lock()
+
+
+def _index_for(channel: Channel | None) -> tuple[Channel, _PostIndex]:
+    channel = channels.resolve(channel)
+    with _indexes_lock:
+        index = _indexes.get(channel.key)
+        if index is None:
+            index = _indexes[channel.key] = _PostIndex()
+    return channel, index
+
+
+def _normalize(text: str) -> str:
+    """Нижний регистр, без пунктуации и лишних пробелов."""
+    return _WS_RE.sub(" ", _NON_WORD_RE.sub(" ", (text or "").lower())).strip()
+
+
+def signature(text: str) -> np.ndarray | None:
+    """MinHash-сигнатура текста по символьным шинглам; вычисляется векторно в NumPy."""
+    normalized = _normalize(text)
+    if not normalized:
+        return None
+    codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < SHINGLE_SIZE:
+        codes = np.pad(codes, (0, SHINGLE_SIZE - len(codes)))
+    windows = sliding_window_view(codes, SHINGLE_SIZE)
+    shingles = np.unique((windows * _POWERS).sum(axis=1) % _PRIME)
+    return ((_PERM_A[:, None] * shingles[None, :] + _PERM_B[:, None]) % _PRIME).min(axis=1)
+
+
+def _add(index: _PostIndex, sig: np.ndarray, meta: dict):
+    """Добавляет сигнатуру в индекс и LSH-корзины (под index.lock или в собираемый индекс, ещё никому не видный)."""
+    doc_id = len(index.signatures)
+    index.signatures.append(sig)
+    index.meta.append(meta)
+    for band in range(BANDS):
+        key = sig[band * ROWS:(band + 1) * ROWS].tobytes()
+        index.buckets[band].setdefault(key, []).append(doc_id)
+
+
+def _to_utc(dt) -> datetime | None:
+    """Приводит дату поста к aware UTC (в логе встречаются наивные даты)."""
+    if dt is None or dt != dt: # NaT/NaN
+        return None
+    if hasattr(dt, "to_pydatetime"):
+        dt = dt.to_pydatetime()
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def _reset(index: _PostIndex):
+    index.signatures, index.meta = [], []
+    index.buckets = [{} for _ in range(BANDS)]
+    index.built = False
+
+
+def _ensure_built(channel: Channel, index: _PostIndex):
+    """
+    Строит индекс из лога постов канала при первом обращении. Лог читается и хэшируется вне index.lock,
+    поэтому add_post (log_post при публикации) сборку не ждёт: посты, записанные во время неё, копятся в pending
+    и добавляются при подмене (кроме уже прочитанных из лога).
+    При LEADER_ELECTION лог могла дописать другая реплика: если его размер изменился, индекс строится заново.
+    """
+    from .post_logger import read_posts, log_size # Локальный импорт: post_logger сам импортирует этот модуль
+    with index.build_lock:
+        with index.lock:
+            if index.built:
+                if not config.LEADER_ELECTION or log_size(channel) == index.log_size:
+                    return
+                logger.info(f"Лог постов канала {channel.key} изменён другой репликой, индекс похожих постов перестраивается.")
+            index.building, index.pending = True, []
+        try:
+            fresh = _PostIndex()
+            fresh.log_size = log_size(channel) # До чтения: запись во время чтения вызовет ещё одну пересборку, а не пропуск поста
+            df = read_posts(channel)
+            read_ids = set()
+            if not df.empty and 'text' in df.columns:
+                dts = df['dt'] if 'dt' in df.columns else [None] * len(df)
+                for message_id, text, dt in zip(df['message_id'], df['text'], dts):
+                    read_ids.add(int(message_id))
+                    sig = signature(text if isinstance(text, str) else "")
+                    if sig is not None:
+                        _add(fresh, sig, {"message_id": int(message_id), "dt": _to_utc(dt), "preview": str(text)[:80]})
+        except BaseException:
+            with index.lock:
+                index.building, index.pending = False, []
+            raise
+        with index.lock:
+            index.signatures, index.meta, index.buckets = fresh.signatures, fresh.meta, fresh.buckets
+            index.log_size = fresh.log_size
+            for message_id, text, timestamp, log_span in index.pending:
+                if log_span is not None and log_span[0] == index.log_size:
+                    index.log_size = log_span[1]
+                if message_id not in read_ids:
+                    _add_post(index, message_id, text, timestamp)
+            index.building, index.pending, index.built = False, [], True
+            count = len(index.signatures)
+    logger.info(f"Индекс похожих постов канала {channel.key} построен: {count} постов.")
+
+
+def _add_post(index: _PostIndex, message_id: int, text: str, timestamp: datetime | None):
+    """Добавляет пост в собранный индекс (под index.lock)."""
+    sig = signature(text)
+    if sig is not None:
+        _add(index, sig, {"message_id": message_id, "dt": _to_utc(timestamp or datetime.now(timezone.utc)), "preview": text[:80]})
+
+
+def add_post(message_id: int, text: str, timestamp: datetime | None = None, channel: Channel | None = None,
+             log_span: tuple[int, int] | None = None):
+    """
+    Инкрементально добавляет опубликованный пост (вызывается из log_post). До первого запроса индекс не строится,
+    во время сборки пост откладывается до её конца.
+    log_span - размер лога до и после записи: если до записи он не совпал с индексом, лог дописывала другая реплика,
+    и индекс будет перестроен целиком при следующем запросе.
+    """
+    _, index = _index_for(channel)
+    with index.lock:
+        if index.building:
+            index.pending.append((message_id, text, timestamp, log_span))
+            return
+        if not index.built:
+            return # Пост уже записан в лог и попадёт в индекс при ленивой сборке
+        if log_span is not None:
+            if config.LEADER_ELECTION and log_span[0] != index.log_size:
+                _reset(index)
+                return
+            index.log_size = log_span[1]
+        _add_post(index, message_id, text, timestamp)
+
+
+def find_similar(text: str, threshold: float | None = None, window_days: int | None = None,
+                 channel: Channel | None = None) -> list[dict]:
+    """
+    Ищет недавние посты канала, похожие на текст (оценка Жаккара по MinHash не ниже порога).
+    Кандидаты берутся из LSH-корзин, поэтому запрос не сканирует весь лог. Без сетевых вызовов.
+    Возвращает [{"similarity", "message_id", "dt", "preview"}] по убыванию сходства.
+    """
+    threshold = config.SIMILARITY_THRESHOLD if threshold is None else threshold
+    window_days = config.SIMILARITY_WINDOW_DAYS if window_days is None else window_days
+    sig = signature(text)
+    if sig is None:
+        return []
+    channel, index = _index_for(channel)
+    _ensure_built(channel, index)
+    with index.lock:
+        candidates = set()
+        for band in range(BANDS):
+            candidates.update(index.buckets[band].get(sig[band * ROWS:(band + 1) * ROWS].tobytes(), ()))
+        if not candidates:
+            return []
+        ids = np.fromiter(candidates, dtype=np.int64)
+        scores = (np.stack([index.signatures[i] for i in ids]) == sig).mean(axis=1)
+        metas = [index.meta[i] for i in ids]
+
+    since = datetime.now(timezone.utc) - timedelta(days=window_days)
+    matches = [
+        {"similarity": float(score), **meta}
+        for score, meta in zip(scores, metas)
+        if score >= threshold and (meta["dt"] is None or meta["dt"] >= since)
+    ]
+    return sorted(matches, key=lambda m: m["similarity"], reverse=True)
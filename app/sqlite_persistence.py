@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from copy import deepcopy
+from pathlib import Path
+
+from telegram.ext import BasePersistence, PersistenceInput, PicklePersistence
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (chat_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS bot_data (key TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS callback_data (id INTEGER PRIMARY KEY CHECK (id = 0), data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (name TEXT NOT NULL, key TEXT NOT NULL, state BLOB NOT NULL, PRIMARY KEY (name, key));
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    callback TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    data BLOB,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS job_runs (key TEXT PRIMARY KEY, holder TEXT NOT NULL, claimed_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS job_history (
+    name TEXT NOT NULL,
+    scheduled_for REAL NOT NULL,
+    ran_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (name, scheduled_for)
+);
+"""
+_JOB_RUNS_KEEP = 7 * 86400 # Сколько хранить отметки о выполненных запусках задач, сек.
+
+
+def _dumps(obj) -> bytes:
+    return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Хранение состояния бота в SQLite вместо одного pickle-файла.
+
+    Каждая запись user_data/chat_data и каждый ключ bot_data - отдельная строка с собственным pickle,
+    поэтому сохранение пишет только изменившиеся строки (сравнение с последним записанным pickle),
+    а не весь файл. Таблица читается только при первом запросе своего раздела.
+    WAL и busy_timeout позволяют нескольким процессам работать с одной базой.
+    Дополнительно хранит описания задач планировщика (таблица jobs): PTB сам задачи не сохраняет,
+    а также аренды (leases) для выбора реплики-лидера, отметки о запусках задач (job_runs)
+    и историю запусков по слотам (job_history) для досылки пропущенных во время простоя.
+    С shared=True (несколько реплик с одной базой) user_data перечитывается из базы перед обработкой обновления.
+
+    При первом открытии базы данные из старого bot_persistence.pickle (если он есть) переносятся в неё,
+    а файл переименовывается в *.migrated.
+    Значения должны сериализоваться обычным pickle (объекты Telegram, привязанные к боту, не поддерживаются).
+    """
+
+    def __init__(self, filepath: str | Path, legacy_pickle: str | Path | None = None,
+                 store_data: PersistenceInput | None = None, update_interval: float = 60, shared: bool = False):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.filepath = Path(filepath)
+        # База общая для нескольких реплик (LEADER_ELECTION): user_data перечитывается перед каждым обновлением
+        self.shared = shared
+        self.legacy_pickle = Path(legacy_pickle) if legacy_pickle else None
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._migrated = False
+        self._migration_lock = asyncio.Lock()
+        # Последний записанный pickle каждой строки: (таблица, ключ) -> bytes
+        self._written: dict[tuple[str, object], bytes] = {}
+
+    # --- Низкоуровневый доступ (вызывается из пула потоков) ---
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.filepath, check_same_thread=False, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.executescript(_SCHEMA)
+            # С какого момента ведётся job_history: задачи старше не считаются пропущенными без записей
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('job_history_since', ?)", (str(time.time()),))
+            self._conn = conn
+            logger.info(f"SQLite persistence открыт: {self.filepath}")
+        return self._conn
+
+    def _query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def _execute_many(self, statements: list[tuple]):
+        """
+        Выполняет несколько изменений одной транзакцией. Элемент - (sql, params) или (sql, params, (ключ кэша, pickle)):
+        кэш записанных pickle обновляется только после успешного COMMIT.
+        """
+        statements = [s for s in statements if s]
+        if not statements:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params, *_ in statements:
+                    conn.execute(sql, params)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            for _, _, *cache in statements:
+                if cache:
+                    self._written[cache[0][0]] = cache[0][1]
+
+    async def _run(self, func, *args):
+        return await asyncio.to_thread(func, *args)
+
+    def _upsert_statement(self, table: str, key_column: str, key, data) -> tuple | None:
+        """INSERT OR REPLACE для строки, если её pickle изменился с последней записи, иначе None."""
+        blob = _dumps(data)
+        if self._written.get((table, key)) == blob:
+            return None
+        return f"INSERT OR REPLACE INTO {table} ({key_column}, data) VALUES (?, ?)", (key, blob), ((table, key), blob)
+
+    def _load_table(self, table: str, key_column: str) -> dict:
+        data = {}
+        for key, blob in self._query(f"SELECT {key_column}, data FROM {table}"):
+            try:
+                data[key] = pickle.loads(blob)
+                self._written[(table, key)] = blob
+            except Exception as e:
+                logger.error(f"❌ Не удалось прочитать строку {table}[{key}] из SQLite persistence: {e}")
+        return data
+
+    # --- Миграция из PicklePersistence ---
+    async def _ensure_migrated(self):
+        async with self._migration_lock:
+            if not self._migrated:
+                await self._migrate_legacy_pickle()
+                self._migrated = True
+
+    async def _migrate_legacy_pickle(self):
+        if not self.legacy_pickle or not self.legacy_pickle.exists():
+            return
+        done = await self._run(self._query, "SELECT value FROM meta WHERE key = 'migrated_from'")
+        if done:
+            return
+        logger.info(f"Перенос состояния из {self.legacy_pickle} в SQLite...")
+        legacy = PicklePersistence(filepath=self.legacy_pickle)
+        legacy.set_bot(self.bot)
+        user_data, chat_data = await legacy.get_user_data() or {}, await legacy.get_chat_data() or {}
+        bot_data, callback_data = await legacy.get_bot_data() or {}, await legacy.get_callback_data()
+        conversations = legacy.conversations or {}
+
+        statements = [self._upsert_statement("user_data", "user_id", k, v) for k, v in user_data.items()]
+        statements += [self._upsert_statement("chat_data", "chat_id", k, v) for k, v in chat_data.items()]
+        statements += [self._upsert_statement("bot_data", "key", str(k), v) for k, v in bot_data.items()]
+        if callback_data is not None:
+            statements.append(self._upsert_statement("callback_data", "id", 0, callback_data))
+        for name, states in conversations.items():
+            for key, state in states.items():
+                statements.append(("INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                                   (name, json.dumps(list(key)), _dumps(state))))
+        statements.append(("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)", (str(self.legacy_pickle),)))
+        await self._run(self._execute_many, statements)
+        self.legacy_pickle.rename(self.legacy_pickle.with_name(self.legacy_pickle.name + ".migrated"))
+        logger.info(f"✅ Состояние перенесено: user_data {len(user_data)}, chat_data {len(chat_data)}, bot_data {len(bot_data)} ключей.")
+
+    # --- Чтение (PTB вызывает при инициализации) ---
+    async def get_user_data(self) -> dict[int, dict]:
+        await self._ensure_migrated()
+        return await self._run(self._load_table, "user_data", "user_id")
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        await self._ensure_migrated()
+        return await self._run(self._load_table, "chat_data", "chat_id")
+
+    async def get_bot_data(self) -> dict:
+        await self._ensure_migrated()
+        return await self._run(self._load_table, "bot_data", "key")
+
+    async def get_callback_data(self):
+        await self._ensure_migrated()
+        rows = await self._run(self._query, "SELECT data FROM callback_data WHERE id = 0")
+        return pickle.loads(rows[0][0]) if rows else None
+
+    async def get_conversations(self, name: str) -> dict:
+        await self._ensure_migrated()
+        rows = await self._run(self._query, "SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    # --- Инкрементальная запись ---
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await self._run(self._execute_many, [self._upsert_statement("user_data", "user_id", user_id, data)])
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        await self._run(self._execute_many, [self._upsert_statement("chat_data", "chat_id", chat_id, data)])
+
+    async def update_bot_data(self, data: dict) -> None:
+        """Пишет только изменившиеся ключи bot_data и удаляет исчезнувшие."""
+        statements = [self._upsert_statement("bot_data", "key", str(k), v) for k, v in data.items()]
+        current = {str(k) for k in data}
+        for table, key in list(self._written):
+            if table == "bot_data" and key not in current:
+                del self._written[(table, key)]
+                statements.append(("DELETE FROM bot_data WHERE key = ?", (key,)))
+        await self._run(self._execute_many, statements)
+
+    async def update_callback_data(self, data) -> None:
+        await self._run(self._execute_many, [self._upsert_statement("callback_data", "id", 0, data)])
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None) -> None:
+        key_json = json.dumps(list(key))
+        if new_state is None:
+            statement = ("DELETE FROM conversations WHERE name = ? AND key = ?", (name, key_json))
+        else:
+            statement = ("INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)", (name, key_json, _dumps(new_state)))
+        await self._run(self._execute_many, [statement])
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._written.pop(("user_data", user_id), None)
+        await self._run(self._execute_many, [("DELETE FROM user_data WHERE user_id = ?", (user_id,))])
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._written.pop(("chat_data", chat_id), None)
+        await self._run(self._execute_many, [("DELETE FROM chat_data WHERE chat_id = ?", (chat_id,))])
+
+    def _load_row(self, table: str, key_column: str, key) -> bytes | None:
+        rows = self._query(f"SELECT data FROM {table} WHERE {key_column} = ?", (key,))
+        return rows[0][0] if rows else None
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        """
+        При общей базе подтягивает user_data, записанные другой репликой (например, канал из /channel).
+        Если у этой реплики есть ещё не записанные изменения, они не затираются: при записи они перекроют чужие.
+        """
+        if not self.shared:
+            return
+        blob = await self._run(self._load_row, "user_data", "user_id", user_id)
+        written = self._written.get(("user_data", user_id))
+        if blob is None or blob == written:
+            return
+        pending = _dumps(user_data) != written if written is not None else bool(user_data)
+        if pending:
+            return
+        try:
+            data = pickle.loads(blob)
+        except Exception as e:
+            logger.error(f"❌ Не удалось прочитать строку user_data[{user_id}] из SQLite persistence: {e}")
+            return
+        self._written[("user_data", user_id)] = blob
+        user_data.clear()
+        user_data.update(data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Данные уже записаны; при остановке сбрасываем WAL в основной файл и закрываем соединение."""
+        def close():
+            with self._lock:
+                if self._conn is not None:
+                    self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    self._conn.close()
+                    self._conn = None
+        await self._run(close)
+
+    # --- Задачи планировщика ---
+    async def save_job(self, name: str, callback: str, kind: str, spec: dict, data: dict | None = None) -> None:
+        """Сохраняет описание задачи (например, kind='daily', spec={'time': 'HH:MM'}) для восстановления после перезапуска."""
+        await self._run(self._execute_many, [(
+            "INSERT OR REPLACE INTO jobs (name, callback, kind, spec, data, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (name, callback, kind, json.dumps(spec), _dumps(deepcopy(data)), time.time()),
+        )])
+
+    async def delete_job(self, name: str) -> None:
+        await self._run(self._execute_many, [("DELETE FROM jobs WHERE name = ?", (name,))])
+
+    async def load_jobs(self, group: str | None = None) -> list[dict]:
+        """
+        Сохранённые задачи: [{"name", "callback", "kind", "spec", "data"}].
+        group - только задача с этим именем и задачи "group@..." (все слоты автопостинга канала одним запросом).
+        """
+        await self._ensure_migrated()
+        sql = "SELECT name, callback, kind, spec, data, updated_at FROM jobs"
+        rows = await self._run(self._query, *self._group_filter(sql, group))
+        return [
+            {"name": name, "callback": callback, "kind": kind, "spec": json.loads(spec),
+             "data": pickle.loads(data) if data else None, "updated_at": updated_at}
+            for name, callback, kind, spec, data, updated_at in rows
+        ]
+
+    @staticmethod
+    def _group_filter(sql: str, group: str | None, params: tuple = ()) -> tuple[str, tuple]:
+        """Добавляет к запросу условие "имя = group или начинается с group@"."""
+        if group is None:
+            return sql, params
+        prefix = f"{group}@"
+        joiner = " AND " if " WHERE " in sql else " WHERE "
+        return sql + joiner + "(name = ? OR substr(name, 1, ?) = ?)", params + (group, len(prefix), prefix)
+
+    # --- История запусков задач по слотам ---
+    async def record_job_run(self, name: str, scheduled_for: float, status: str) -> None:
+        """
+        Отмечает слот задачи (время по расписанию): status - "ok", "recovered" (выполнен после простоя),
+        "missed" (пропущен за пределами окна досылки) или "failed" (запуск был, но пост не опубликован).
+        """
+        now = time.time()
+        await self._run(self._execute_many, [
+            ("INSERT OR REPLACE INTO job_history (name, scheduled_for, ran_at, status) VALUES (?, ?, ?, ?)",
+             (name, scheduled_for, now, status)),
+            ("DELETE FROM job_history WHERE ran_at < ?", (now - _JOB_RUNS_KEEP,)),
+        ])
+
+    async def last_job_runs(self) -> dict[str, float]:
+        """Последний отмеченный слот каждой задачи: имя -> время по расписанию (unix)."""
+        rows = await self._run(self._query, "SELECT name, MAX(scheduled_for) FROM job_history GROUP BY name")
+        return dict(rows)
+
+    async def job_history(self, group: str | None = None, since: float = 0, statuses: tuple[str, ...] | None = None) -> list[dict]:
+        """Отметки о слотах задач (group - как в load_jobs) начиная с since, новые первыми."""
+        sql = "SELECT name, scheduled_for, ran_at, status FROM job_history WHERE scheduled_for >= ?"
+        params: tuple = (since,)
+        if statuses:
+            sql += f" AND status IN ({', '.join('?' * len(statuses))})"
+            params += tuple(statuses)
+        sql, params = self._group_filter(sql, group, params)
+        rows = await self._run(self._query, sql + " ORDER BY scheduled_for DESC", params)
+        return [{"name": name, "scheduled_for": scheduled_for, "ran_at": ran_at, "status": status}
+                for name, scheduled_for, ran_at, status in rows]
+
+    async def job_history_since(self) -> float:
+        rows = await self._run(self._query, "SELECT value FROM meta WHERE key = 'job_history_since'")
+        return float(rows[0][0]) if rows else time.time()
+
+    # --- Несколько реплик: аренда лидерства и однократный запуск задач ---
+    def _acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE") # Блокировка записи: две реплики не захватят аренду одновременно
+            try:
+                row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+                acquired = row is None or row[0] == holder or row[1] < now
+                if acquired:
+                    conn.execute("INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)", (name, holder, now + ttl))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return acquired
+
+    async def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """Захватывает или продлевает аренду name на ttl секунд. False - аренда у другой реплики и ещё не истекла."""
+        return await self._run(self._acquire_lease, name, holder, ttl)
+
+    async def release_lease(self, name: str, holder: str) -> None:
+        """Отдаёт аренду (если она наша), чтобы другая реплика подхватила её без ожидания срока."""
+        await self._run(self._execute_many, [("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))])
+
+    async def lease_holder(self, name: str) -> str | None:
+        """Текущий держатель неистёкшей аренды или None."""
+        rows = await self._run(self._query, "SELECT holder FROM leases WHERE name = ? AND expires_at >= ?", (name, time.time()))
+        return rows[0][0] if rows else None
+
+    def _claim_run(self, key: str, holder: str) -> bool:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            claimed = conn.execute(
+                "INSERT OR IGNORE INTO job_runs (key, holder, claimed_at) VALUES (?, ?, ?)", (key, holder, now)
+            ).rowcount == 1
+            if claimed:
+                conn.execute("DELETE FROM job_runs WHERE claimed_at < ?", (now - _JOB_RUNS_KEEP,))
+        return claimed
+
+    async def claim_run(self, key: str, holder: str) -> bool:
+        """Отмечает запуск задачи key. False - этот запуск уже выполнила другая реплика (например, при смене лидера)."""
+        return await self._run(self._claim_run, key, holder)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import re
+from html.parser import HTMLParser
+
+logger = logging.getLogger(__name__)
+
+# Теги, содержимое которых не является текстом: те же, что исключает get_text() BeautifulSoup
+# (noscript, head/title и CDATA он оставляет - оставляем и мы)
+_SKIP_TAGS = {"script", "style", "template"}
+_WS_RE = re.compile(r"\s+")
+
+
+class _TextCollector(HTMLParser):
+    """
+    Потоковый экстрактор текста на базе html.parser (без построения дерева, как в BeautifulSoup).
+    Собирает текстовые узлы, пропуская script/style/template, результат совпадает с
+    BeautifulSoup(html, "html.parser").get_text(separator=' ', strip=True), в том числе для noscript, head, CDATA
+    и незакрытых тегов (незакрытый script, как и в bs4, поглощает остаток фрагмента).
+    Отличие - только сущности без ";" или неизвестные ("AT&T", "&copy2024", "&amp" в конце): они раскрываются
+    по правилам HTML5 (html.unescape), а bs4 оставляет или теряет их по-своему.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts = []
+        self._text = [] # Куски текущего текстового узла: html.parser может отдавать его частями
+        self._skip_depth = 0
+
+    def _flush(self):
+        """Завершает текстовый узел (на границе тега, комментария, объявления), как строку bs4."""
+        if self._text:
+            data = "".join(self._text).strip()
+            if data:
+                self._parts.append(data)
+            self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag in _SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.startswith("CDATA["):
+            self.handle_data(data[len("CDATA["):])
+            self._flush()
+
+    def extract(self, html: str) -> str:
+        """Разбирает один HTML-фрагмент и возвращает его текст. Экземпляр переиспользуется между фрагментами."""
+        self.reset()
+        self._parts = []
+        self._text = []
+        self._skip_depth = 0
+        self.feed(html)
+        self.close()
+        self._flush()
+        return " ".join(self._parts)
+
+
+# Блоки страницы, которые обычно не относятся к тексту статьи
+_BOILERPLATE_TAGS = _SKIP_TAGS | {"noscript", "nav", "header", "footer", "aside", "form", "button", "figcaption"}
+_PARAGRAPH_TAGS = {"p", "h2", "h3", "li", "blockquote"}
+_MIN_PARAGRAPH_LEN = 60 # Короче — скорее подписи, меню и кнопки
+
+
+class _ParagraphCollector(HTMLParser):
+    """Потоковый экстрактор основного текста статьи: абзацы вне навигации, шапки и подвала."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._paragraphs = []
+        self._current = []
+        self._skip_depth = 0
+        self._para_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _BOILERPLATE_TAGS:
+            self._skip_depth += 1
+        elif tag in _PARAGRAPH_TAGS and not self._skip_depth:
+            if not self._para_depth:
+                self._current = []
+            self._para_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in _BOILERPLATE_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in _PARAGRAPH_TAGS and self._para_depth:
+            self._para_depth -= 1
+            if not self._para_depth:
+                paragraph = _WS_RE.sub(" ", " ".join(self._current)).strip()
+                if len(paragraph) >= _MIN_PARAGRAPH_LEN:
+                    self._paragraphs.append(paragraph)
+
+    def handle_data(self, data):
+        if self._para_depth and not self._skip_depth:
+            self._current.append(data)
+
+    def extract(self, html: str) -> str:
+        """Возвращает абзацы статьи, разделённые переводом строки."""
+        self.feed(html)
+        self.close()
+        return "\n".join(self._paragraphs)
+
+
+def extract_main_text(html: str) -> str:
+    """Извлекает основной текст статьи из HTML-страницы (эвристика по абзацам). Синхронная, для пула потоков."""
+    try:
+        return _ParagraphCollector().extract(html)
+    except Exception as e:
+        logger.warning(f"Не удалось извлечь текст статьи: {e}")
+        return ""
+
+
+def html_to_text_batch(fragments: list[str]) -> list[str]:
+    """
+    Превращает пачку HTML-фрагментов (описаний RSS, статей) в простой текст.
+    Один парсер на всю пачку; фрагменты без разметки просто нормализуются по пробелам.
+    """
+    collector = _TextCollector()
+    texts = []
+    for fragment in fragments:
+        if not fragment:
+            texts.append("")
+        elif "<" not in fragment and "&" not in fragment:
+            texts.append(_WS_RE.sub(" ", fragment).strip())
+        else:
+            try:
+                texts.append(collector.extract(fragment))
+            except Exception as e:
+                logger.warning(f"Не удалось извлечь текст из HTML-фрагмента: {e}")
+                collector = _TextCollector() # Парсер мог остаться в неконсистентном состоянии
+                texts.append(_WS_RE.sub(" ", re.sub(r"<[^>]*>", " ", fragment)).strip())
+    return texts
+
+
+def html_to_text(fragment: str) -> str:
+    """Извлекает текст из одного HTML-фрагмента."""
+    return html_to_text_batch([fragment])[0]
+
+
+async def extract_texts(fragments: list[str]) -> list[str]:
+    """Асинхронная обёртка: разбор пачки выполняется в пуле потоков, не блокируя event loop."""
+    return await asyncio.to_thread(html_to_text_batch, fragments)
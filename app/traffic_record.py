@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import logging
+import re
+import time
+from datetime import datetime, timezone
+
+import httpx
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+from . import channels, config
+
+logger = logging.getLogger(__name__)
+
+# Запись трафика для воспроизведения (benchmarks/replay.py): при TRAFFIC_RECORD_FILE каждое входящее обновление
+# и каждый исходящий запрос (Bot API, OpenAI, Perplexity, RSS) пишутся строкой JSON в файл (.gz - со сжатием).
+# Строки: {"k": "meta"} - каналы и время старта; {"k": "update", "t", "u"} - обновление как есть;
+# {"k": "api", "t", "svc", "m", "s", "ms"} - запрос: сервис, метод, статус, длительность;
+# у Bot API ещё параметры "p" и результат "r". Тела ответов OpenAI/Perplexity/RSS не пишутся - только время.
+# Токены, ключи и секреты вырезаются по имени поля и по значению. Каждая строка сразу сбрасывается на диск
+# (у .gz - точкой синхронизации zlib), так что при падении или kill процесса запись обрывается на последней строке.
+FORMAT_VERSION = 1
+_SECRET_KEY_RE = re.compile(r"(^|_)(token|secret|key|password|authorization|phone)(_|$)", re.IGNORECASE)
+_REDACTED = "***"
+
+_file = None
+_started = 0.0
+_secrets: list[str] = []
+
+
+def start():
+    """Открывает файл записи и пишет заголовок с каналами (их админы нужны для воспроизведения)."""
+    global _file, _started, _secrets
+    if not config.TRAFFIC_RECORD_FILE or _file is not None:
+        return
+    path = config.TRAFFIC_RECORD_FILE
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _file = gzip.open(path, "at", encoding="utf-8") if path.suffix == ".gz" else open(path, "a", encoding="utf-8")
+        if path.suffix != ".gz" and _file.tell():
+            with open(path, "rb") as f:
+                f.seek(-1, 2)
+                if f.read(1) != b"\n":
+                    _file.write("\n") # Прошлый запуск оборвался посреди строки: новая сессия начинается с новой строки
+    except OSError as e:
+        logger.error(f"❌ Не удалось открыть файл записи трафика {path}: {e}")
+        return
+    _started = time.monotonic()
+    _secrets = [s for s in (config.BOT_TOKEN, config.OPENAI_API_KEY, config.PPLX_API_KEY, config.WEBHOOK_SECRET_TOKEN) if s]
+    _write({
+        "k": "meta", "v": FORMAT_VERSION, "started": datetime.now(timezone.utc).isoformat(),
+        "channels": [[c.key, c.chat_id, list(c.admin_ids)] for c in channels.all_channels()],
+        "default_chat_id": channels.default().chat_id,
+    })
+    logger.info(f"⏺ Запись трафика в {path}")
+
+
+def close():
+    global _file
+    if _file is not None:
+        _file.close()
+        _file = None
+        logger.info("Запись трафика остановлена.")
+
+
+def redact(value):
+    """Копия значения без секретов: поля с "token"/"key"/... в имени и вхождения токенов и ключей в строках."""
+    if isinstance(value, dict):
+        return {k: _REDACTED if _SECRET_KEY_RE.search(str(k)) else redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        for secret in _secrets:
+            if secret in value:
+                value = value.replace(secret, _REDACTED)
+    return value
+
+
+def _write(record: dict):
+    try:
+        _file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+        _file.flush()
+    except (OSError, ValueError) as e:
+        logger.warning(f"Не удалось записать трафик: {e}")
+
+
+def _elapsed() -> float:
+    return round(time.monotonic() - _started, 3)
+
+
+async def record_update(update: object, _ctx):
+    """TypeHandler в группе -1: пишет обновление до обработки, остальные хэндлеры вызываются как обычно."""
+    if _file is not None and isinstance(update, Update):
+        _write({"k": "update", "t": _elapsed(), "u": redact(update.to_dict())})
+
+
+def record_api(service: str, method: str, status: int, elapsed_ms: float, params: dict | None = None, result=None):
+    if _file is None:
+        return
+    record = {"k": "api", "t": _elapsed(), "svc": service, "m": method, "s": status, "ms": round(elapsed_ms, 1)}
+    if params is not None:
+        record["p"] = redact(params)
+    if result is not None:
+        record["r"] = redact(result)
+    _write(record)
+
+
+class RecordingRequest(BaseRequest):
+    """Обёртка запросов к Bot API: вызывает исходный BaseRequest и пишет метод, параметры, статус и результат."""
+
+    def __init__(self, request: BaseRequest):
+        self._request = request
+
+    @property
+    def read_timeout(self):
+        return self._request.read_timeout
+
+    async def initialize(self):
+        await self._request.initialize()
+
+    async def shutdown(self):
+        await self._request.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None,
+                         read_timeout=BaseRequest.DEFAULT_NONE, write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE, pool_timeout=BaseRequest.DEFAULT_NONE):
+        started = time.perf_counter()
+        status, payload = await self._request.do_request(
+            url, method, request_data=request_data, read_timeout=read_timeout, write_timeout=write_timeout,
+            connect_timeout=connect_timeout, pool_timeout=pool_timeout)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if _file is not None:
+            # Файлы (фото) не пишутся: в параметрах остаётся только ссылка на вложение
+            params = dict(request_data.parameters) if request_data else {}
+            try:
+                result = json.loads(payload).get("result")
+            except (ValueError, AttributeError):
+                result = None
+            record_api("telegram", url.rsplit("/", 1)[-1], status, elapsed_ms, params, result)
+        return status, payload
+
+
+def wrap_bot_request(request: BaseRequest) -> BaseRequest:
+    """Запрос к Bot API с записью, если она включена (TRAFFIC_RECORD_FILE), иначе исходный."""
+    return RecordingRequest(request) if config.TRAFFIC_RECORD_FILE else request
+
+
+def event_hooks(service: str) -> dict:
+    """event_hooks для httpx-клиента внешнего сервиса: время и статус каждого запроса (пустые без записи)."""
+    if not config.TRAFFIC_RECORD_FILE:
+        return {}
+
+    async def on_request(request: httpx.Request):
+        request.extensions["record_started"] = time.perf_counter()
+
+    async def on_response(response: httpx.Response):
+        started = response.request.extensions.get("record_started")
+        if started is not None:
+            await response.aread() # Время до конца тела, как его видит вызывающий код
+            request = response.request
+            record_api(service, f"{request.method} {request.url.path}", response.status_code,
+                       (time.perf_counter() - started) * 1000)
+
+    return {"request": [on_request], "response": [on_response]}
@@ -3,29 +3,30 @@ import logging
 import pandas as pd # Убедимся, что pandas импортирован
 import matplotlib
 matplotlib.use('Agg') # Устанавливаем бэкенд для работы без GUI (ДО импорта pyplot)
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure # Объектный API без глобального состояния pyplot: графики разных каналов строятся в потоках параллельно
+from datetime import datetime, timezone
 from pathlib import Path
 import httpx # Для асинхронных запросов скачивания
 import io    # Для работы с байтами изображения в памяти
 
 # Импортируем локальные модули
-from . import config
+from . import channels, config, perf
+from .channels import Channel
 from .post_logger import read_posts # Импортируем функцию чтения логов
 
 logger = logging.getLogger(__name__)
 
-# Определяем путь к файлу графика из конфигурации
-PLOT_PATH = config.PLOT_FILE
-
 # --- Функция анализа лучшего времени постинга (ИСПРАВЛЕННАЯ ВЕРСИЯ 3) ---
-def get_best_posting_time() -> tuple[str, Path | None]:
+def get_best_posting_time(channel: Channel | None = None, render: bool = True) -> tuple[str, Path | None]:
     """
-    Анализирует лог постов и определяет лучшее время для публикации.
-    Сохраняет график статистики по часам, если возможно.
+    Анализирует лог постов канала и определяет лучшее время для публикации.
+    Сохраняет график статистики по часам (Channel.plot_file), если возможно и render=True.
     Возвращает кортеж: (строка с лучшим временем 'ЧЧ:00', путь к файлу графика | None).
     """
     logger.debug("Начало анализа лучшего времени постинга.")
-    df = read_posts()
+    channel = channels.resolve(channel)
+    plot_path = channel.plot_file
+    df = read_posts(channel)
 
     # Проверка на наличие данных
     if df.empty or 'dt' not in df.columns or 'reactions' not in df.columns or df['dt'].isnull().all():
@@ -72,34 +73,95 @@ def get_best_posting_time() -> tuple[str, Path | None]:
     except Exception as e:
         logger.error(f"Ошибка при расчете лучшего часа: {e}. Используем дефолт.", exc_info=True)
 
+    if not render:
+        return best_time_str, None
+
     # --- Визуализация ---
-    fig = None
     try:
         # !!! Строим график ТОЛЬКО если hourly_stats - это непустая Series !!!
         if isinstance(hourly_stats, pd.Series) and not hourly_stats.empty:
-            fig, ax = plt.subplots(figsize=(10, 5))
+            fig = Figure(figsize=(10, 5))
+            ax = fig.subplots()
             hourly_stats.plot(kind='bar', ax=ax, title="Среднее число реакций по часам публикации") # Вызов plot только здесь
             ax.set_xlabel("Час дня (UTC)")
             ax.set_ylabel("Среднее кол-во реакций")
-            plt.xticks(rotation=0)
-            plt.tight_layout()
-            PLOT_PATH.parent.mkdir(parents=True, exist_ok=True)
-            plt.savefig(PLOT_PATH)
-            logger.info(f"График сохранен в {PLOT_PATH}")
-            plot_generated = PLOT_PATH
+            ax.tick_params(axis='x', labelrotation=0)
+            fig.tight_layout()
+            plot_path.parent.mkdir(parents=True, exist_ok=True)
+            fig.savefig(plot_path)
+            logger.info(f"График сохранен в {plot_path}")
+            plot_generated = plot_path
         else:
              logger.info("Недостаточно данных (требуется Series) для построения графика.")
 
     except Exception as e:
         logger.error(f"❌ Ошибка создания/сохранения графика: {e}", exc_info=True)
         plot_generated = None
-    finally:
-        if fig is not None: plt.close(fig)
-        elif plt.get_fignums(): plt.close('all')
-        logger.debug("Фигура графика закрыта.")
+    # Figure без pyplot не регистрируется глобально и освобождается сборщиком мусора - закрывать не нужно
 
     return best_time_str, plot_generated
 
+# --- Недельный отчёт ---
+def weekly_stats(df: pd.DataFrame, now: datetime, top_n: int = 3) -> dict | None:
+    """
+    Сводка по постам за 7 дней до now (df из read_posts): {"since", "total_posts", "total_reactions",
+    "average_reactions", "top_posts"}. None, если постов за неделю нет. Даты без таймзоны считаются UTC.
+    """
+    if df['dt'].dt.tz is None:
+        logger.warning("Таймзоны в логе нет. Предполагается UTC.")
+        df = df.assign(dt=df['dt'].dt.tz_localize(timezone.utc))
+    since = now - pd.Timedelta(days=7)
+    weekly_df = df[df['dt'] > since]
+    if weekly_df.empty:
+        return None
+    reactions = weekly_df['reactions'].fillna(0)
+    return {
+        "since": since,
+        "total_posts": len(weekly_df),
+        "total_reactions": reactions.sum(),
+        "average_reactions": reactions.mean(),
+        "top_posts": weekly_df.nlargest(top_n, 'reactions'),
+    }
+
+# --- Слоты автопостинга по дням недели ---
+SLOT_PRIOR_POSTS = 3 # Вес среднего по часу для редких ячеек (день недели, час): сглаживание к общему среднему часа
+
+def get_best_posting_slots(channel: Channel | None = None, per_day: int = 1) -> dict[int, list[int]]:
+    """
+    Лучшие часы публикации для каждого дня недели (0 - понедельник): {день: [час, ...]}, не больше per_day часов в день.
+    Средние реакции по ячейкам (день недели, час) считаются одной группировкой; в ячейках с малым числом постов
+    среднее сглаживается к среднему по часу за все дни. Часы без постов не предлагаются;
+    если данных нет совсем - каждый день DEFAULT_POST_TIME. График не строится.
+    """
+    channel = channels.resolve(channel)
+    default_hour = int(config.DEFAULT_POST_TIME.split(":")[0])
+    fallback = {day: [default_hour] for day in range(7)}
+    df = read_posts(channel)
+    if df.empty or 'dt' not in df.columns or 'reactions' not in df.columns:
+        logger.warning("Нет данных для расчёта слотов автопостинга. Используется время по умолчанию.")
+        return fallback
+    df = df.dropna(subset=['dt'])
+    if df.empty:
+        return fallback
+
+    cells = df.groupby([df['dt'].dt.weekday, df['dt'].dt.hour])['reactions'].agg(['sum', 'count'])
+    cells.index.names = ['weekday', 'hour']
+    hourly = cells.groupby(level='hour').sum()
+    hourly_mean = hourly['sum'] / hourly['count']
+    # Сетка 7 x (часы с данными): пустые ячейки получают среднее часа
+    grid = pd.MultiIndex.from_product([range(7), hourly_mean.index], names=['weekday', 'hour'])
+    cells = cells.reindex(grid, fill_value=0)
+    prior = hourly_mean.reindex(cells.index.get_level_values('hour')).to_numpy()
+    cells['score'] = (cells['sum'] + SLOT_PRIOR_POSTS * prior) / (cells['count'] + SLOT_PRIOR_POSTS)
+
+    per_day = max(1, min(per_day, len(hourly_mean)))
+    slots = {}
+    for weekday, day_cells in cells['score'].groupby(level='weekday'):
+        best = day_cells.nlargest(per_day).index.get_level_values('hour')
+        slots[int(weekday)] = sorted(int(hour) for hour in best)
+    logger.info(f"Слоты автопостинга канала {channel.key}: {slots}")
+    return slots
+
 # --- Функция для скачивания изображения по URL ---
 async def download_image(url: str) -> bytes | None:
     """
@@ -118,7 +180,8 @@ async def download_image(url: str) -> bytes | None:
         async with httpx.AsyncClient(timeout=45.0, follow_redirects=True, verify=True) as client: # verify=True по умолчанию, но можно указать явно
             # Добавляем User-Agent для маскировки под браузер
             headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-            response = await client.get(url, headers=headers)
+            with perf.timer("image.download"):
+                response = await client.get(url, headers=headers)
 
             # Логируем статус ответа
             logger.debug(f"Ответ от сервера изображения: Статус {response.status_code}")
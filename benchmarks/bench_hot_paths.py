@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк горячих путей лога постов и аналитики на синтетических логах разного размера
+(по умолчанию 1 тыс., 100 тыс. и 1 млн постов): log_post, read_posts, read_top_posts,
+get_best_posting_time с графиком и без, агрегация недельного отчёта (weekly_stats).
+
+Сеть не нужна: логи и график пишутся во временную директорию, ключи API не используются.
+Результаты сохраняются в JSON (по умолчанию benchmarks/results/hot_paths_<commit>.json),
+--compare печатает изменение медиан относительно прежнего JSON:
+    python -m benchmarks.bench_hot_paths --sizes 1000,100000 --repeat 5
+    python -m benchmarks.bench_hot_paths --compare benchmarks/results/hot_paths_<старый commit>.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RESULTS_DIR = Path(__file__).parent / "results"
+WORDS = ["нейросеть", "модель", "OpenAI", "обучение", "данные", "агент", "GPU", "релиз", "исследование", "API",
+         "бенчмарк", "контекст", "токены", "инференс", "датасет", "стартап", "open-source", "чипы"]
+
+
+def _prepare_env(workdir: Path):
+    """Минимальная конфигурация до импорта app: фиктивные ключи и файлы во временной директории."""
+    for name, value in {"BOT_TOKEN": "1:bench", "CHANNEL_ID": "-1001", "ADMIN_ID": "1", "OPENAI_API_KEY": "sk-bench"}.items():
+        os.environ.setdefault(name, value)
+    os.environ["LOG_FILE"] = str(workdir / "telegram_channel_log.csv")
+    os.environ["PLOT_FILE"] = str(workdir / "posting_time_stats.png")
+    os.environ.pop("CHANNELS", None)
+    os.environ["LEADER_ELECTION"] = "False"
+
+
+def make_log(n: int, seed: int = 42) -> pd.DataFrame:
+    """Синтетический лог: тексты из словаря, даты за последние 90 дней, реакции ~ Пуассон с пиком вечером."""
+    rng = np.random.default_rng(seed)
+    phrases = np.array([" ".join(rng.choice(WORDS, size=rng.integers(6, 30))) for _ in range(2000)], dtype=object)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    offsets = rng.integers(0, 90 * 86400 * 1_000_000, size=n).astype("timedelta64[us]")
+    dts = pd.to_datetime(np.datetime64(now, "us") - offsets)
+    hours = dts.hour.to_numpy()
+    reactions = rng.poisson(3 + 5 * ((hours >= 18) & (hours <= 21)))
+    return pd.DataFrame({
+        "message_id": np.arange(1, n + 1),
+        "text": phrases[rng.integers(0, len(phrases), size=n)],
+        "timestamp_iso": dts.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        "reactions": reactions,
+    })
+
+
+def measure(func, repeat: int, setup=None) -> dict:
+    """Время repeat вызовов func (setup перед каждым не учитывается): min/median/mean, секунды."""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {"repeat": repeat, "min_s": min(timings), "median_s": statistics.median(timings), "mean_s": statistics.fmean(timings)}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(sizes: list[int], repeat: int, log_post_calls: int, workdir: Path) -> list[dict]:
+    # Импорт после _prepare_env: config читает переменные окружения при импорте
+    from app import channels
+    from app.post_logger import log_post, read_posts, read_top_posts
+    from app.utils import get_best_posting_time, weekly_stats
+
+    channel = channels.default()
+    results = []
+    for size in sizes:
+        print(f"\n=== {size} постов ===")
+        started = time.perf_counter()
+        log = make_log(size)
+        log.to_csv(channel.log_file, index=False, encoding="utf-8")
+        print(f"Лог создан за {time.perf_counter() - started:.1f} сек. ({channel.log_file.stat().st_size / 1e6:.1f} МБ)")
+        df = read_posts(channel)
+        now = datetime.now(timezone.utc)
+        # Повторы для больших логов урезаются: один прогон 1 млн постов идёт секунды
+        size_repeat = max(1, repeat if size < 1_000_000 else min(repeat, 3))
+
+        cases = {
+            "read_posts": lambda: read_posts(channel),
+            "read_top_posts": lambda: read_top_posts(5, channel),
+            "get_best_posting_time": lambda: get_best_posting_time(channel, render=True),
+            "get_best_posting_time_no_render": lambda: get_best_posting_time(channel, render=False),
+            "weekly_stats": lambda: weekly_stats(df, now),
+        }
+        for name, func in cases.items():
+            result = measure(func, size_repeat)
+            results.append({"size": size, "name": name, **result})
+            print(f"{name:34s} median {result['median_s'] * 1000:10.2f} мс   min {result['min_s'] * 1000:10.2f} мс")
+
+        # log_post: время одной дозаписи в лог такого размера (индексы похожих постов не построены - как после старта)
+        timestamp = now - timedelta(minutes=1)
+        counter = iter(range(size + 1, size + 1 + log_post_calls * size_repeat))
+        result = measure(lambda: log_post(next(counter), "Бенчмарк дозаписи поста", timestamp, 0, channel),
+                         log_post_calls * size_repeat)
+        results.append({"size": size, "name": "log_post", **result})
+        print(f"{'log_post':34s} median {result['median_s'] * 1000:10.2f} мс   min {result['min_s'] * 1000:10.2f} мс")
+    return results
+
+
+def compare(results: list[dict], baseline_path: Path):
+    """Печатает отношение медиан к прежнему прогону (>1 - медленнее)."""
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    old = {(r["size"], r["name"]): r["median_s"] for r in baseline["results"]}
+    print(f"\nСравнение с {baseline_path} (commit {baseline['meta'].get('commit')}):")
+    for r in results:
+        before = old.get((r["size"], r["name"]))
+        if before:
+            ratio = r["median_s"] / before
+            mark = "  ⚠️ медленнее" if ratio > 1.2 else ""
+            print(f"{r['size']:>8} {r['name']:34s} x{ratio:5.2f}{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="Размеры логов через запятую")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов каждого замера (для 1 млн постов не больше 3)")
+    parser.add_argument("--log-post-calls", type=int, default=20, help="Вызовов log_post на повтор")
+    parser.add_argument("--output", type=Path, help="Файл результатов JSON (по умолчанию benchmarks/results/hot_paths_<commit>.json)")
+    parser.add_argument("--compare", type=Path, help="JSON прежнего прогона для сравнения")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    with tempfile.TemporaryDirectory(prefix="bench_hot_paths_") as tmp:
+        _prepare_env(Path(tmp))
+        results = run(sizes, args.repeat, args.log_post_calls, Path(tmp))
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "sizes": sizes,
+        },
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"hot_paths_{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nРезультаты сохранены в {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
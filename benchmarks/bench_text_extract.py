@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк извлечения текста из описаний RSS: прежний путь (BeautifulSoup на каждую запись)
+против пакетного потокового экстрактора app.text_extract.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_text_extract --items 2000 --repeat 5
+"""
+import argparse
+import random
+import time
+
+from bs4 import BeautifulSoup
+
+from app.text_extract import html_to_text_batch
+
+
+def make_summaries(n: int, seed: int = 42) -> list[str]:
+    """Синтетические описания в стиле Google News / блогов: ссылки, font, абзацы, сущности, script."""
+    rnd = random.Random(seed)
+    words = ["нейросеть", "модель", "OpenAI", "обучение", "данные", "агент", "GPU", "релиз", "исследование", "API"]
+    templates = [
+        '<a href="https://news.example.com/{i}" target="_blank">{text}</a>&nbsp;&nbsp;<font color="#6f6f6f">Источник {i}</font>',
+        '<p>{text}</p><p>{text} &amp; ещё {i}</p>',
+        '<div><img src="x.png"/><b>{text}</b><br/>{text}<script>var a = {i};</script></div>',
+        '{text}',
+    ]
+    summaries = []
+    for i in range(n):
+        text = " ".join(rnd.choice(words) for _ in range(rnd.randint(8, 40)))
+        summaries.append(rnd.choice(templates).format(i=i, text=text))
+    return summaries
+
+
+# Пограничные случаи, на которых экстрактор должен совпадать с bs4: noscript и head остаются текстом,
+# CDATA - тоже, незакрытые script/style/template поглощают остаток, незакрытые noscript/head - нет
+EDGE_CASES = [
+    '<noscript>Включите JavaScript</noscript> текст',
+    '<noscript>незакрытый <p>абзац</p>',
+    '<head><title>Заголовок</title></head><body>тело</body>',
+    '<head><title>Заголовок</title>после незакрытого head',
+    'до<![CDATA[текст CDATA]]>после',
+    'до<![CDATA[незакрытый CDATA]]',
+    'до<script>незакрытый <p>абзац</p>',
+    '<style>p{} <b>незакрытый style</b>',
+    '<template>незакрытый <b>template</b>',
+    'a<![if !IE]>b<![endif]>c',
+    '<script><!-- <p>x</p> --></script>после',
+    'a<!-- комментарий -->b',
+]
+
+
+def bs4_path(summaries: list[str]) -> list[str]:
+    """Прежняя реализация из generate_news_post: отдельное дерево BeautifulSoup на каждую запись."""
+    return [BeautifulSoup(s, "html.parser").get_text(separator=' ', strip=True) for s in summaries]
+
+
+def best_time(func, arg, repeat: int) -> float:
+    """Лучшее время из repeat прогонов, секунды."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=2000, help="Количество описаний в пачке")
+    parser.add_argument("--repeat", type=int, default=5, help="Число повторов (берётся лучшее время)")
+    args = parser.parse_args()
+
+    summaries = make_summaries(args.items)
+    checked = summaries + EDGE_CASES
+    mismatched = [(s, a, b) for s, a, b in zip(checked, bs4_path(checked), html_to_text_batch(checked)) if a != b]
+    for source, expected, got in mismatched:
+        print(f"Расхождение: {source!r}\n  bs4:          {expected!r}\n  text_extract: {got!r}")
+    mismatches = len(mismatched)
+
+    bs4_t = best_time(bs4_path, summaries, args.repeat)
+    fast_t = best_time(html_to_text_batch, summaries, args.repeat)
+    print(f"Описаний: {args.items} (+ {len(EDGE_CASES)} пограничных), расхождений в тексте: {mismatches}")
+    print(f"BeautifulSoup (по записи): {bs4_t * 1000:8.1f} мс  ({bs4_t / args.items * 1e6:6.1f} мкс/запись)")
+    print(f"text_extract (пачкой):    {fast_t * 1000:8.1f} мс  ({fast_t / args.items * 1e6:6.1f} мкс/запись)")
+    print(f"Ускорение: x{bs4_t / fast_t:.1f}")
+
+
+if __name__ == "__main__":
+    main()
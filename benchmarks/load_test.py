@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный прогон настоящего приложения бота (те же хэндлеры, persistence, очередь отправки,
+семафоры генерации) против локальных заглушек Bot API, OpenAI, Perplexity и RSS (benchmarks/mock_servers.py).
+Сеть и ключи не нужны, состояние и логи пишутся во временную директорию (DATA_DIR, LOG_FILE, PLOT_FILE).
+
+Драйвер отправляет смесь команд, кнопок меню и нажатий inline-кнопок от нескольких админов через
+Application.process_update и печатает p50/p95/p99 задержки обработки по каждому хэндлеру:
+    python -m benchmarks.load_test --updates 300 --concurrency 20
+    python -m benchmarks.load_test --mocks "telegram=80:40:0.02,openai=1500:500:0.05" --rps 10
+    python -m benchmarks.load_test --mix "idea=1,schedule=5,publish=1" --output load.json
+
+Лимиты очереди отправки и семафоры берутся из окружения как у бота (SEND_*, GENERATION_CONCURRENCY...):
+публикации в канал упираются в SEND_GROUP_RATE_PER_MINUTE так же, как в работе.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.bench_hot_paths import make_log
+from benchmarks.mock_servers import RSS_URL, MockServers
+
+CHANNEL_ID = -1001
+FIRST_ADMIN_ID = 1001
+# Метка -> (команда или текст сообщения, тип обновления)
+ACTIONS = {
+    "start": ("/start", "command"),
+    "idea": ("/idea", "command"),
+    "news": ("/news", "command"),
+    # Разные запросы идут мимо кэша Perplexity; ответ доставляется фоновой задачей, задержка хэндлера - до подтверждения
+    "research": ("/research нейросети в медицине {update_id}", "command"),
+    "stats": ("/stats", "command"),
+    "weekly": ("/weekly", "command"),
+    "schedule": ("/schedule", "command"),
+    "auto_best": ("/auto_best", "command"),
+    "perf": ("/perf", "command"),
+    "menu_stats": ("📊 Статистика", "text"),
+    "publish": ("publish", "callback"),
+    "delete": ("delete", "callback"),
+}
+DEFAULT_MIX = "start=1,idea=3,news=2,research=2,stats=1,weekly=1,schedule=3,menu_stats=1,publish=1,delete=1"
+DEFAULT_MOCKS = "telegram=40:20:0.01,openai=1200:400:0.02,perplexity=2000:600:0.02,rss=150:50:0.01"
+
+
+def _prepare_env(workdir: Path, channels_spec: str, channel_id: int = CHANNEL_ID):
+    """Конфигурация до импорта app: фиктивные ключи, каналы (формат CHANNELS), данные во временной директории."""
+    os.environ.update({
+        "BOT_TOKEN": "1:mock", "OPENAI_API_KEY": "sk-mock", "PPLX_API_KEY": "pplx-mock",
+        "CHANNELS": channels_spec, "CHANNEL_ID": str(channel_id),
+        "DATA_DIR": str(workdir), "LOG_FILE": str(workdir / "telegram_channel_log.csv"),
+        "PLOT_FILE": str(workdir / "posting_time_stats.png"),
+        "NEWS_RSS_URL": RSS_URL, "IMAGE_GENERATION_ENABLED": "False",
+        "PERSISTENCE_BACKEND": "sqlite", "LEADER_ELECTION": "False",
+    })
+    for name in ("NEWS_RSS_URLS", "OPENAI_PROXY", "TRAFFIC_RECORD_FILE"):
+        os.environ.pop(name, None)
+
+
+def write_log(path: Path, posts: int):
+    """Синтетический лог канала; время постов в формате log_post (datetime.isoformat() сообщения Telegram)."""
+    log = make_log(posts)
+    log["timestamp_iso"] = pd.to_datetime(log["timestamp_iso"]).dt.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+    log.to_csv(path, index=False, encoding="utf-8")
+
+
+def build_application(servers: MockServers, workdir: Path):
+    """Приложение как в app/bot.py (хэндлеры, persistence, параллельные обновления), Bot API - заглушка."""
+    from telegram.constants import ParseMode
+    from telegram.ext import ApplicationBuilder, Defaults
+
+    from app import config, perf
+    from app.handlers import callbacks, channel_posts, commands, messages
+    from app.sqlite_persistence import SQLitePersistence
+
+    application = (
+        ApplicationBuilder()
+        .token(config.BOT_TOKEN)
+        .request(perf.TimedRequest(servers.bot_request(connection_pool_size=64)))
+        .get_updates_request(servers.bot_request())
+        .defaults(Defaults(parse_mode=ParseMode.MARKDOWN))
+        .persistence(SQLitePersistence(filepath=workdir / "bot_state.sqlite3"))
+        .concurrent_updates(max(config.UPDATE_CONCURRENCY, 1))
+        .build()
+    )
+    for handler in [*commands.command_handlers, messages.text_menu_handler, callbacks.callback_handler,
+                    channel_posts.channel_post_handler]:
+        application.add_handler(handler)
+    return application
+
+
+def parse_mix(spec: str) -> dict[str, float]:
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        label, _, weight = item.partition("=")
+        if label not in ACTIONS:
+            raise ValueError(f"Неизвестное действие '{label}' (ожидается одно из: {', '.join(ACTIONS)})")
+        mix[label] = float(weight or 1)
+    return mix
+
+
+def quantiles(values: list[float]) -> dict:
+    """p50/p95/p99/max в миллисекундах."""
+    values = sorted(values)
+    pick = lambda q: values[min(int(q * len(values)), len(values) - 1)] * 1000
+    return {"count": len(values), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": values[-1] * 1000}
+
+
+class Driver:
+    """Строит обновления Telegram для действий из смеси и прогоняет их через Application.process_update."""
+
+    def __init__(self, application, admins: int):
+        self.application = application
+        self.admins = admins
+        self.update_ids = iter(range(1, 10**9))
+        self.labels: dict[int, str] = {} # update_id -> метка (для счётчика ошибок)
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        application.add_error_handler(self._on_error)
+
+    async def _on_error(self, update, ctx):
+        label = self.labels.get(getattr(update, "update_id", None), "unknown")
+        self.errors[label] += 1
+
+    def _message(self, update_id: int, user_id: int, text: str, command: bool) -> dict:
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "admin"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "admin"},
+            "text": text,
+        }
+        if command:
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return message
+
+    def make_update(self, label: str, user_id: int) -> dict:
+        from app import drafts
+
+        update_id = next(self.update_ids)
+        self.labels[update_id] = label
+        payload, kind = ACTIONS[label]
+        if kind != "callback":
+            text = payload.format(update_id=update_id)
+            return {"update_id": update_id, "message": self._message(update_id, user_id, text, kind == "command")}
+        # Кнопка под свежим черновиком: как после /idea, черновик лежит в хранилище, id - в callback_data
+        text = f"Черновик нагрузочного теста #{update_id}: нейросети, модели и релизы недели."
+        draft_id = drafts.save(text, "idea", {"channel": "main"})
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": {"id": user_id, "is_bot": False, "first_name": "admin"},
+                "chat_instance": str(user_id),
+                "data": f"{payload}:{draft_id}",
+                "message": {**self._message(update_id, user_id, f"💡 Идея поста:\n\n{text}", False),
+                            "from": {"id": 1, "is_bot": True, "first_name": "mock"}},
+            },
+        }
+
+    async def run(self, labels: list[str], concurrency: int, rps: float) -> float:
+        """Прогоняет обновления (не больше concurrency одновременно, при rps - с равномерным темпом). Возвращает время прогона."""
+        from telegram import Update
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(index: int, label: str):
+            async with semaphore:
+                user_id = FIRST_ADMIN_ID + index % self.admins
+                update = Update.de_json(self.make_update(label, user_id), self.application.bot)
+                started = time.perf_counter()
+                await self.application.process_update(update)
+                self.latencies[label].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        tasks = []
+        for index, label in enumerate(labels):
+            if rps:
+                await asyncio.sleep(max(0.0, started + index / rps - time.perf_counter()))
+            tasks.append(asyncio.create_task(one(index, label)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started
+
+
+async def run(args, workdir: Path) -> dict:
+    # Импорт после _prepare_env: config читает переменные окружения при импорте
+    from app import channels, news_feed, perplexity_client, send_queue
+
+    write_log(channels.default().log_file, args.log_posts)
+    servers = MockServers.from_spec(args.mocks, seed=args.seed)
+    application = build_application(servers, workdir)
+    driver = Driver(application, args.admins)
+
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    labels = rng.choices(list(mix), weights=list(mix.values()), k=args.updates)
+
+    async with application:
+        servers.install()
+        await application.start()
+        send_queue.start()
+        try:
+            elapsed = await driver.run(labels, args.concurrency, args.rps)
+        finally:
+            await send_queue.stop()
+            await application.stop()
+            await news_feed.close_http_client()
+            await perplexity_client.close_http_client()
+
+    handlers = {label: {**quantiles(values), "errors": driver.errors.get(label, 0)}
+                for label, values in sorted(driver.latencies.items())}
+    return {"elapsed_s": elapsed, "updates": len(labels), "handlers": handlers, "upstream": servers.summary()}
+
+
+def print_report(report: dict):
+    print(f"\n{report['updates']} обновлений за {report['elapsed_s']:.1f} сек. "
+          f"({report['updates'] / report['elapsed_s']:.1f} обн./сек.)\n")
+    print(f"{'хэндлер':12s} {'n':>5s} {'ошибок':>7s} {'p50, мс':>10s} {'p95, мс':>10s} {'p99, мс':>10s} {'max, мс':>10s}")
+    for label, row in report["handlers"].items():
+        print(f"{label:12s} {row['count']:5d} {row['errors']:7d} {row['p50_ms']:10.1f} {row['p95_ms']:10.1f} "
+              f"{row['p99_ms']:10.1f} {row['max_ms']:10.1f}")
+    print("\nЗапросы к заглушкам (ошибки):")
+    for service, stats in report["upstream"].items():
+        calls = ", ".join(f"{method} {count}" + (f" ({stats['errors'][method]})" if method in stats["errors"] else "")
+                          for method, count in sorted(stats["requests"].items()))
+        print(f"  {service:10s} {calls or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=200, help="Сколько обновлений отправить")
+    parser.add_argument("--concurrency", type=int, default=16, help="Обновлений в обработке одновременно")
+    parser.add_argument("--rps", type=float, default=0, help="Темп поступления обновлений в секунду (0 - без паузы)")
+    parser.add_argument("--admins", type=int, default=5, help="Число админов канала (обновления распределяются между ними)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Веса действий: {', '.join(ACTIONS)}")
+    parser.add_argument("--mocks", default=DEFAULT_MOCKS, help="Заглушки: сервис=задержка_мс:разброс_мс:доля_ошибок,...")
+    parser.add_argument("--log-posts", type=int, default=5000, help="Постов в синтетическом логе канала (для /stats, /weekly)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="load_test_") as tmp:
+        admin_ids = "|".join(str(FIRST_ADMIN_ID + i) for i in range(args.admins))
+        _prepare_env(Path(tmp), f"main:{CHANNEL_ID}:{admin_ids}")
+        report = asyncio.run(run(args, Path(tmp)))
+
+    print_report(report)
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nОтчёт сохранён в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Локальные заглушки внешних сервисов для нагрузочных прогонов без сети: Bot API Telegram,
+OpenAI (chat.completions, images), Perplexity и RSS-лента со страницами статей.
+
+Заглушки - обработчики httpx.MockTransport: запросы не уходят в сеть, но проходят через настоящие
+клиенты бота (HTTPXRequest PTB, AsyncOpenAI, общие httpx-клиенты Perplexity и RSS) со всей их
+сериализацией, повторами и разбором ответов. У каждого сервиса задаются задержка, разброс
+задержки и доля ошибок (Bot API отвечает 429 с retry_after, остальные - 500):
+    servers = MockServers.from_spec("telegram=50:20:0.01,openai=800:300:0.02")
+    request = servers.bot_request()   # для ApplicationBuilder().request(...)
+    servers.install()                 # подменяет HTTP-клиенты OpenAI, Perplexity и RSS
+
+Используется в benchmarks/load_test.py.
+"""
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from collections import Counter
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs
+
+import httpx
+from telegram.request import HTTPXRequest
+
+OPENAI_BASE_URL = "http://openai.mock/v1"
+RSS_URL = "http://news.mock/rss.xml"
+ARTICLE_URL = "http://news.mock/article/{}"
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "mock", "username": "mock_bot"}
+
+SERVICES = ("telegram", "openai", "perplexity", "rss")
+_METHOD_RE = re.compile(r"/bot[^/]+/(\w+)$")
+_MULTIPART_FIELD_RE = re.compile(rb'name="([^"]+)"\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--', re.DOTALL)
+# Служебные методы при запуске приложения: ошибки в них не внедряются, иначе прогон не стартует
+_SETUP_METHODS = {"getMe", "getWebhookInfo", "setWebhook", "deleteWebhook", "setMyCommands"}
+_WORDS = ["нейросеть", "модель", "релиз", "агент", "GPU", "датасет", "инференс", "стартап", "исследование", "API"]
+
+
+def _json(status: int, payload) -> httpx.Response:
+    return httpx.Response(status, content=json.dumps(payload, ensure_ascii=False).encode(),
+                          headers={"Content-Type": "application/json"})
+
+
+def _bot_method(request: httpx.Request) -> str:
+    match = _METHOD_RE.search(request.url.path)
+    return match.group(1) if match else ""
+
+
+def _lorem(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+class MockService:
+    """
+    Один внешний сервис: задержка latency_ms ± jitter_ms, доля ошибок error_rate, счётчики запросов по методам.
+    handler(request, rng) возвращает httpx.Response; вызывается заглушкой транспорта после задержки.
+    """
+
+    def __init__(self, name: str, handler, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, seed: int | None = None):
+        self.name = name
+        self.handler = handler
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = Counter()
+        self.errors = Counter()
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self)
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        method = self.method_name(request)
+        self.requests[method] += 1
+        delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and method not in _SETUP_METHODS and self.rng.random() < self.error_rate:
+            self.errors[method] += 1
+            return self.error_response(request)
+        return self.handler(request, self.rng)
+
+    def method_name(self, request: httpx.Request) -> str:
+        return _bot_method(request) or request.url.path
+
+    def error_response(self, request: httpx.Request) -> httpx.Response:
+        if self.name == "telegram":
+            return _json(429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                               "parameters": {"retry_after": 1}})
+        return _json(500, {"error": {"message": "mock upstream error", "type": "server_error"}})
+
+
+# --- Bot API ---
+_message_ids = itertools.count(1000)
+
+
+def _form_fields(request: httpx.Request) -> dict:
+    """Параметры метода Bot API: форма (application/x-www-form-urlencoded) или текстовые поля multipart."""
+    content_type = request.headers.get("Content-Type", "")
+    body = request.read()
+    if content_type.startswith("multipart/form-data"):
+        return {name.decode(): value.decode("utf-8", "replace") for name, value in _MULTIPART_FIELD_RE.findall(body)}
+    return {name: values[-1] for name, values in parse_qs(body.decode()).items()}
+
+
+def _chat(chat_id: str | None) -> dict:
+    try:
+        chat_id = int(chat_id)
+    except (TypeError, ValueError):
+        chat_id = -1001
+    if chat_id < 0:
+        return {"id": chat_id, "type": "channel", "title": "mock"}
+    return {"id": chat_id, "type": "private", "first_name": "admin"}
+
+
+def _message(fields: dict, **extra) -> dict:
+    message_id = int(fields.get("message_id") or next(_message_ids))
+    message = {"message_id": message_id, "date": int(time.time()), "chat": _chat(fields.get("chat_id")), "from": BOT_USER}
+    if fields.get("text"):
+        message["text"] = fields["text"]
+    if fields.get("caption"):
+        message["caption"] = fields["caption"]
+    message.update(extra)
+    return message
+
+
+def telegram_handler(request: httpx.Request, rng: random.Random) -> httpx.Response:
+    """Ответы Bot API: методы, возвращающие сообщение, получают правдоподобный Message, остальные - True."""
+    method = _bot_method(request)
+    fields = _form_fields(request)
+    if method == "getMe":
+        result = BOT_USER
+    elif method == "getUpdates":
+        result = []
+    elif method in ("sendMessage", "editMessageText", "editMessageCaption", "editMessageReplyMarkup", "copyMessage"):
+        result = _message(fields)
+    elif method == "sendPhoto":
+        photo = [{"file_id": f"mock-photo-{rng.getrandbits(32)}", "file_unique_id": "mock", "width": 1024, "height": 1024}]
+        result = _message(fields, photo=photo)
+    elif method == "getWebhookInfo":
+        result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+    else: # answerCallbackQuery, sendChatAction, deleteMessage, setWebhook, setMyCommands...
+        result = True
+    return _json(200, {"ok": True, "result": result})
+
+
+class MockHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest PTB, чей httpx-клиент ходит в заглушку Bot API вместо api.telegram.org."""
+
+    def __init__(self, service: MockService, **kwargs):
+        self._service = service # До super().__init__: там создаётся клиент
+        super().__init__(**kwargs)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=self._service.transport(), timeout=self._client_kwargs["timeout"])
+
+
+# --- OpenAI и Perplexity ---
+def chat_completion_handler(request: httpx.Request, rng: random.Random) -> httpx.Response:
+    """/chat/completions (OpenAI и Perplexity) и /images/generations (OpenAI)."""
+    path = request.url.path
+    if path.endswith("/images/generations"):
+        return _json(200, {"created": int(time.time()), "data": [{"url": "http://news.mock/image.png"}]})
+    if not path.endswith("/chat/completions"):
+        return _json(404, {"error": {"message": f"unknown path {path}", "type": "invalid_request_error"}})
+    payload = json.loads(request.read() or b"{}")
+    content = f"🤖 *{_lorem(rng, 4).capitalize()}*\n\n{_lorem(rng, rng.randint(60, 120))}."
+    return _json(200, {
+        "id": f"chatcmpl-mock{rng.getrandbits(32)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", "mock"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 200, "total_tokens": 300},
+    })
+
+
+# --- RSS и статьи ---
+def rss_handler(request: httpx.Request, rng: random.Random, items: int = 30) -> httpx.Response:
+    """Лента из items свежих записей со ссылками на статьи заглушки; любой другой путь - HTML статьи."""
+    if request.url.path.endswith(".xml"):
+        now = datetime.now(timezone.utc)
+        entries = "".join(
+            f"<item><title>{_lorem(rng, 6)} #{i}</title><link>{ARTICLE_URL.format(i)}</link>"
+            f"<guid>{ARTICLE_URL.format(i)}</guid><pubDate>{format_datetime(now - timedelta(minutes=10 * i))}</pubDate>"
+            f"<description>&lt;p&gt;{_lorem(rng, 30)}&lt;/p&gt;</description></item>"
+            for i in range(items))
+        body = f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>mock</title>{entries}</channel></rss>'
+        return httpx.Response(200, content=body.encode(), headers={"Content-Type": "application/rss+xml"})
+    paragraphs = "".join(f"<p>{_lorem(rng, 60)}.</p>" for _ in range(8))
+    body = f"<html><head><title>mock</title></head><body><article>{paragraphs}</article></body></html>"
+    return httpx.Response(200, content=body.encode(), headers={"Content-Type": "text/html; charset=utf-8"})
+
+
+_HANDLERS = {"telegram": telegram_handler, "openai": chat_completion_handler,
+             "perplexity": chat_completion_handler, "rss": rss_handler}
+
+
+class MockServers:
+    """Набор заглушек всех внешних сервисов бота."""
+
+    def __init__(self, settings: dict[str, tuple[float, float, float]] | None = None, seed: int = 42):
+        settings = settings or {}
+        self.services = {name: MockService(name, _HANDLERS[name], *settings.get(name, (0.0, 0.0, 0.0)), seed=seed + i)
+                         for i, name in enumerate(SERVICES)}
+
+    @classmethod
+    def from_spec(cls, spec: str, seed: int = 42) -> "MockServers":
+        """Настройки из строки "сервис=задержка_мс:разброс_мс:доля_ошибок,...", например "openai=800:300:0.02"."""
+        settings = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            name, _, values = item.partition("=")
+            if name not in SERVICES:
+                raise ValueError(f"Неизвестный сервис '{name}' (ожидается один из: {', '.join(SERVICES)})")
+            latency, jitter, error_rate = ([float(v) for v in values.split(":")] + [0.0, 0.0, 0.0])[:3]
+            settings[name] = (latency, jitter, error_rate)
+        return cls(settings, seed)
+
+    def bot_request(self, **kwargs) -> MockHTTPXRequest:
+        return MockHTTPXRequest(self.services["telegram"], **kwargs)
+
+    def install(self):
+        """
+        Подменяет общие HTTP-клиенты бота клиентами заглушек. Вызывается после импорта app
+        (config читает окружение при импорте) и до первого запроса к OpenAI, Perplexity или RSS.
+        """
+        from openai import AsyncOpenAI
+
+        from app import news_feed, openai_client, perplexity_client
+
+        openai_client._async_client = AsyncOpenAI(
+            api_key="sk-mock", base_url=OPENAI_BASE_URL,
+            http_client=httpx.AsyncClient(transport=self.services["openai"].transport(), timeout=60.0))
+        perplexity_client._http_client = httpx.AsyncClient(
+            base_url=perplexity_client.PPLX_BASE_URL, transport=self.services["perplexity"].transport(), timeout=60.0)
+        news_feed._http_client = httpx.AsyncClient(transport=self.services["rss"].transport(), timeout=30.0,
+                                                   follow_redirects=True)
+
+    def summary(self) -> dict:
+        """Запросы и ошибки по сервисам и методам."""
+        return {name: {"requests": dict(service.requests), "errors": dict(service.errors)}
+                for name, service in self.services.items()}
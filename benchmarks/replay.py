@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Воспроизведение записанного трафика бота (TRAFFIC_RECORD_FILE, app/traffic_record.py) на ноутбуке:
+обновления из записи подаются в настоящее приложение с теми же паузами (или в --speed раз быстрее),
+а Bot API, OpenAI, Perplexity и RSS заменены заглушками (benchmarks/mock_servers.py), задержки и доля
+ошибок которых по умолчанию взяты из самой записи. Сеть и ключи не нужны, данные - во временной директории.
+
+Во время прогона монитор event loop каждые --lag-interval мс меряет, насколько опоздал его таймер:
+всплески выше --lag-threshold печатаются вместе с хэндлерами, которые в этот момент выполнялись
+(например, блокирующий event loop /stats). В конце - p50/p95/p99 задержки по хэндлерам:
+    python -m benchmarks.replay data/traffic.ndjson.gz --speed 20
+    python -m benchmarks.replay traffic.ndjson --speed 0 --log-file data/telegram_channel_log.csv
+    python -m benchmarks.replay traffic.ndjson --mocks "openai=3000:500:0.1"  # свои задержки вместо записанных
+
+Черновики из записи в хранилище нет: кнопки "Опубликовать" берут текст из сообщения, как для старых кнопок.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import shutil
+import statistics
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+
+from benchmarks.load_test import _prepare_env, build_application, quantiles, write_log
+from benchmarks.mock_servers import SERVICES, MockServers
+
+logger = logging.getLogger(__name__)
+
+
+_GZIP_MAGIC = b"\x1f\x8b\x08"
+
+
+def _gzip_lines(path: Path) -> list[str]:
+    """
+    Строки .gz записи по членам gzip (каждый запуск бота дописывает свой). Член, оборванный падением процесса,
+    читается до обрыва (строки сбрасываются точками синхронизации), затем чтение продолжается со следующего члена.
+    """
+    data = path.read_bytes()
+    text = []
+    pos = 0
+    while pos < len(data):
+        decompressor = zlib.decompressobj(wbits=31)
+        # Вход режется по сигнатурам gzip: ошибка на байтах следующего члена не теряет уже распакованное
+        offset, next_pos = pos, -1
+        while offset < len(data) and not decompressor.eof:
+            boundary = data.find(_GZIP_MAGIC, offset + 1)
+            boundary = len(data) if boundary < 0 else boundary
+            try:
+                text.append(decompressor.decompress(data[offset:boundary]))
+            except zlib.error:
+                next_pos = offset if offset > pos else data.find(_GZIP_MAGIC, pos + 1)
+                break
+            offset = boundary
+        if decompressor.eof:
+            pos = offset - len(decompressor.unused_data)
+            continue
+        logger.warning(f"{path}: запись оборвана (член gzip со смещения {pos} не завершён), читается до места обрыва.")
+        text.append(b"\n") # Оборванная строка не склеивается со следующей сессией
+        if next_pos < 0:
+            break
+        pos = next_pos
+    return b"".join(text).decode("utf-8", "replace").splitlines()
+
+
+def read_recording(path: Path, session: int = -1) -> tuple[dict, list[dict], list[dict]]:
+    """
+    Заголовок, обновления и исходящие запросы одной сессии записи (.gz читается со сжатием).
+    Файл дописывается при каждом запуске бота, сессия начинается со строки meta; по умолчанию - последняя.
+    Запись, оборванная падением процесса (недописанный gzip, последняя строка без конца), читается до обрыва.
+    """
+    if path.suffix == ".gz":
+        lines = _gzip_lines(path)
+    else:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    sessions = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            logger.warning(f"{path}: пропущена повреждённая строка (обрыв записи?): {line[:80]!r}")
+            continue
+        kind = record.get("k")
+        if kind == "meta":
+            sessions.append((record, [], []))
+        elif sessions and kind in ("update", "api"):
+            sessions[-1][1 if kind == "update" else 2].append(record)
+    if not sessions:
+        raise ValueError(f"В {path} нет заголовка записи (строки с \"k\": \"meta\")")
+    return sessions[session]
+
+
+def mocks_from_recording(calls: list[dict]) -> str:
+    """Настройки заглушек по записи: медиана задержки, разброс (p90 - p10) / 2 и доля ошибок каждого сервиса."""
+    by_service = defaultdict(list)
+    for call in calls:
+        by_service[call["svc"]].append(call)
+    specs = []
+    for service in SERVICES:
+        service_calls = by_service.get(service)
+        if not service_calls:
+            continue
+        latencies = sorted(call["ms"] for call in service_calls)
+        spread = (latencies[int(0.9 * (len(latencies) - 1))] - latencies[int(0.1 * (len(latencies) - 1))]) / 2
+        errors = sum(1 for call in service_calls if call["s"] >= 400) / len(service_calls)
+        specs.append(f"{service}={statistics.median(latencies):.0f}:{spread:.0f}:{errors:.3f}")
+    return ",".join(specs)
+
+
+def handler_label(update: dict) -> str:
+    """Метка хэндлера для отчёта: команда, действие кнопки, текст меню или пост канала."""
+    if "callback_query" in update:
+        return f"callback:{(update['callback_query'].get('data') or '').split(':', 1)[0]}"
+    if "channel_post" in update or "edited_channel_post" in update:
+        return "channel_post"
+    text = (update.get("message") or {}).get("text") or ""
+    if text.startswith("/"):
+        return text.split()[0][1:].split("@")[0]
+    return "text" if text else "other"
+
+
+class LoopLagMonitor:
+    """Опоздание таймера event loop: если цикл занят синхронным кодом, sleep(interval) просыпается позже."""
+
+    def __init__(self, interval: float, threshold: float, in_flight: dict[int, str]):
+        self.interval = interval
+        self.threshold = threshold
+        self.in_flight = in_flight
+        self.lags: list[float] = []
+        self.spikes: list[tuple[float, float, list[str]]] = [] # (время от старта, опоздание, хэндлеры в работе)
+        self._started = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - before - self.interval
+            self.lags.append(lag)
+            if lag >= self.threshold:
+                self.spikes.append((before - self._started, lag, sorted(set(self.in_flight.values()))))
+
+
+async def run(args, workdir: Path, meta: dict, updates: list[dict], mocks: str) -> dict:
+    # Импорт после _prepare_env: config читает переменные окружения при импорте
+    from telegram import Update
+
+    from app import channels, config, news_feed, perplexity_client, send_queue
+
+    if args.log_file:
+        shutil.copy(args.log_file, channels.default().log_file)
+    else:
+        write_log(channels.default().log_file, args.log_posts)
+    servers = MockServers.from_spec(mocks, seed=args.seed)
+    application = build_application(servers, workdir)
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    in_flight: dict[int, str] = {}
+
+    async def on_error(update, ctx):
+        errors[in_flight.get(getattr(update, "update_id", None), "unknown")] += 1
+
+    application.add_error_handler(on_error)
+    semaphore = asyncio.Semaphore(max(config.UPDATE_CONCURRENCY, 1))
+    monitor = LoopLagMonitor(args.lag_interval / 1000, args.lag_threshold / 1000, in_flight)
+
+    async def one(record: dict):
+        label = handler_label(record["u"])
+        async with semaphore:
+            update = Update.de_json(record["u"], application.bot)
+            in_flight[update.update_id] = label
+            started = time.perf_counter()
+            try:
+                await application.process_update(update)
+            finally:
+                latencies[label].append(time.perf_counter() - started)
+                in_flight.pop(update.update_id, None)
+
+    async with application:
+        servers.install()
+        await application.start()
+        send_queue.start()
+        monitor.start()
+        started = time.perf_counter()
+        try:
+            first_t = updates[0]["t"] if updates else 0.0
+            tasks = []
+            for record in updates:
+                if args.speed:
+                    due = started + (record["t"] - first_t) / args.speed
+                    await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                tasks.append(asyncio.create_task(one(record)))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+        finally:
+            await monitor.stop()
+            await send_queue.stop()
+            await application.stop()
+            await news_feed.close_http_client()
+            await perplexity_client.close_http_client()
+
+    lags = sorted(monitor.lags) or [0.0]
+    return {
+        "recording_started": meta.get("started"),
+        "updates": len(updates),
+        "elapsed_s": elapsed,
+        "mocks": mocks,
+        "handlers": {label: {**quantiles(values), "errors": errors.get(label, 0)} for label, values in sorted(latencies.items())},
+        "loop_lag": {**quantiles(lags), "spikes": [{"at_s": round(at, 3), "lag_ms": round(lag * 1000, 1), "handlers": handlers}
+                                                   for at, lag, handlers in monitor.spikes]},
+    }
+
+
+def print_report(report: dict):
+    print(f"\nВоспроизведено {report['updates']} обновлений за {report['elapsed_s']:.1f} сек. (запись от {report['recording_started']})")
+    print(f"Заглушки: {report['mocks'] or 'без задержек'}\n")
+    print(f"{'хэндлер':18s} {'n':>5s} {'ошибок':>7s} {'p50, мс':>10s} {'p95, мс':>10s} {'p99, мс':>10s} {'max, мс':>10s}")
+    for label, row in report["handlers"].items():
+        print(f"{label:18s} {row['count']:5d} {row['errors']:7d} {row['p50_ms']:10.1f} {row['p95_ms']:10.1f} "
+              f"{row['p99_ms']:10.1f} {row['max_ms']:10.1f}")
+    lag = report["loop_lag"]
+    print(f"\nОпоздание event loop: p50 {lag['p50_ms']:.1f} мс | p99 {lag['p99_ms']:.1f} мс | max {lag['max_ms']:.1f} мс")
+    spikes = sorted(lag["spikes"], key=lambda s: s["lag_ms"], reverse=True)[:10]
+    for spike in spikes:
+        print(f"  ⚠️ {spike['at_s']:8.2f} сек.: event loop заблокирован на {spike['lag_ms']:.0f} мс, в работе: {', '.join(spike['handlers']) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", type=Path, help="Файл записи (TRAFFIC_RECORD_FILE)")
+    parser.add_argument("--session", type=int, default=-1, help="Номер сессии записи (по запуску бота, -1 - последняя)")
+    parser.add_argument("--speed", type=float, default=10, help="Ускорение относительно записи (0 - без пауз между обновлениями)")
+    parser.add_argument("--mocks", help="Свои настройки заглушек (сервис=задержка_мс:разброс_мс:доля_ошибок,...) вместо записанных")
+    parser.add_argument("--log-file", type=Path, help="CSV-лог канала для /stats и /weekly (по умолчанию синтетический)")
+    parser.add_argument("--log-posts", type=int, default=5000, help="Постов в синтетическом логе")
+    parser.add_argument("--lag-interval", type=float, default=10, help="Период монитора event loop, мс")
+    parser.add_argument("--lag-threshold", type=float, default=100, help="Опоздание, с которого event loop считается заблокированным, мс")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    meta, updates, calls = read_recording(args.recording, args.session)
+    mocks = args.mocks if args.mocks is not None else mocks_from_recording(calls)
+    channels_spec = ",".join(f"{key}:{chat_id}:{'|'.join(map(str, admins))}" for key, chat_id, admins in meta["channels"])
+    with tempfile.TemporaryDirectory(prefix="replay_") as tmp:
+        _prepare_env(Path(tmp), channels_spec, meta.get("default_chat_id", meta["channels"][0][1]))
+        report = asyncio.run(run(args, Path(tmp), meta, updates, mocks))
+
+    print_report(report)
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nОтчёт сохранён в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
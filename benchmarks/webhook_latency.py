@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Замер задержки доставки обновлений в режиме вебхука: синтетические обновления
+отправляются POST-запросами на встроенный HTTP-сервер PTB.
+
+Без --url поднимается собственное приложение на 127.0.0.1 с офлайн-запросами к Bot API
+(сеть и токен не нужны) и меряется и ответ сервера, и время до вызова обработчика:
+    python -m benchmarks.webhook_latency --updates 500 --concurrency 20
+
+С --url обновления отправляются на уже запущенного бота (BOT_MODE=webhook, WEBHOOK_SECRET_TOKEN задан),
+меряется только ответ сервера. Обновления приходят от пользователя, не являющегося админом, и игнорируются:
+    python -m benchmarks.webhook_latency --url http://127.0.0.1:8443/telegram --secret <WEBHOOK_SECRET_TOKEN>
+"""
+import argparse
+import asyncio
+import json
+import socket
+import time
+
+import httpx
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+from telegram.request import BaseRequest, RequestData
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+FAKE_USER_ID = 777000001 # Не админ: хэндлеры бота такие обновления игнорируют
+
+
+class _OfflineRequest(BaseRequest):
+    """Ответы Bot API без сети: getMe возвращает фиктивного бота, остальные методы - True."""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        if url.endswith("/getMe"):
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def make_update(update_id: int) -> dict:
+    """Синтетическое текстовое сообщение от пользователя."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": FAKE_USER_ID, "type": "private"},
+            "from": {"id": FAKE_USER_ID, "is_bot": False, "first_name": "bench"},
+            "text": f"ping {update_id}",
+        },
+    }
+
+
+def percentiles(values: list[float]) -> str:
+    if not values:
+        return "нет данных"
+    values = sorted(values)
+    pick = lambda q: values[min(int(q * len(values)), len(values) - 1)] * 1000
+    return f"p50 {pick(0.5):6.2f} мс | p90 {pick(0.9):6.2f} мс | p99 {pick(0.99):6.2f} мс | max {values[-1] * 1000:6.2f} мс"
+
+
+async def post_updates(url: str, secret: str, count: int, concurrency: int) -> tuple[dict[int, float], list[float], int]:
+    """Отправляет count обновлений. Возвращает (update_id -> время отправки, задержки ответа, число ошибок)."""
+    sent_at, acks, failures = {}, [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one(update_id: int):
+            nonlocal failures
+            async with semaphore:
+                started = time.perf_counter()
+                sent_at[update_id] = started
+                response = await client.post(url, json=make_update(update_id), headers={SECRET_HEADER: secret})
+                acks.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    failures += 1
+        await asyncio.gather(*(one(i) for i in range(1, count + 1)))
+    return sent_at, acks, failures
+
+
+async def run_local(count: int, concurrency: int):
+    """Поднимает приложение с вебхуком на свободном порту и меряет задержку до обработчика."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    secret = "bench-secret"
+    received: dict[int, float] = {}
+    all_received = asyncio.Event()
+
+    async def record(update: Update, _ctx):
+        received[update.update_id] = time.perf_counter()
+        if len(received) >= count:
+            all_received.set()
+
+    application = ApplicationBuilder().token("1:bench").request(_OfflineRequest()).get_updates_request(_OfflineRequest()).build()
+    application.add_handler(TypeHandler(Update, record))
+    async with application:
+        await application.start()
+        await application.updater.start_webhook(listen="127.0.0.1", port=port, url_path="telegram", secret_token=secret)
+        url = f"http://127.0.0.1:{port}/telegram"
+        try:
+            async with httpx.AsyncClient() as client:
+                forbidden = await client.post(url, json=make_update(0), headers={SECRET_HEADER: "wrong"})
+            print(f"Запрос с неверным секретом: HTTP {forbidden.status_code} (ожидается 403)")
+
+            started = time.perf_counter()
+            sent_at, acks, failures = await post_updates(url, secret, count, concurrency)
+            await asyncio.wait_for(all_received.wait(), timeout=30)
+            elapsed = time.perf_counter() - started
+        finally:
+            await application.updater.stop()
+            await application.stop()
+
+    end_to_end = [received[i] - sent_at[i] for i in sent_at if i in received]
+    print(f"Обновлений: {count}, параллельно: {concurrency}, ошибок HTTP: {failures}, за {elapsed:.2f} сек. ({count / elapsed:.0f} обн./сек.)")
+    print(f"Ответ сервера:       {percentiles(acks)}")
+    print(f"До вызова хэндлера:  {percentiles(end_to_end)}")
+
+
+async def run_remote(url: str, secret: str, count: int, concurrency: int):
+    started = time.perf_counter()
+    _, acks, failures = await post_updates(url, secret, count, concurrency)
+    elapsed = time.perf_counter() - started
+    print(f"Обновлений: {count}, параллельно: {concurrency}, ошибок HTTP: {failures}, за {elapsed:.2f} сек. ({count / elapsed:.0f} обн./сек.)")
+    print(f"Ответ сервера: {percentiles(acks)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=500, help="Количество синтетических обновлений")
+    parser.add_argument("--concurrency", type=int, default=20, help="Одновременных POST-запросов")
+    parser.add_argument("--url", help="Адрес вебхука уже запущенного бота (иначе поднимается локальное приложение)")
+    parser.add_argument("--secret", default="", help="WEBHOOK_SECRET_TOKEN запущенного бота")
+    args = parser.parse_args()
+
+    if args.url:
+        asyncio.run(run_remote(args.url, args.secret, args.updates, args.concurrency))
+    else:
+        asyncio.run(run_local(args.updates, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()